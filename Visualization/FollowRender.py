@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Render the maps of a run while the model is still writing them.
+
+With ResultSWMR = yes in Control.Project the model writes Result_all.h5
+in HDF5 single-writer/multiple-reader mode: one growing dataset per
+variable, flushed after every step. This script opens the file in SWMR
+read mode, polls it every --interval seconds and renders each new step of
+the plotted variables with the templates of Plot_all.py, into the same
+folders and file names, so a landslide map is on disk seconds after the
+model finished its step instead of after EndDate.
+
+--publish runs a command for every new JPG, with {path}, {var} and {time}
+replaced, e.g. to copy the map to a web server or send an alert:
+
+    python FollowRender.py --publish "scp {path} maps@server:/www/{var}/"
+
+Files written without ResultSWMR (one dataset per step) are reopened and
+replaced by the model at every step and cannot be read safely while it
+runs; for them the script renders what is there and exits. --once does the
+same for the stacked files of finished runs (ResultBuffer > 0).
+
+Usage:
+    python FollowRender.py Results/Result_all.h5 --vars FS3D PF --interval 5
+    python FollowRender.py Results/Result_all.h5 --once
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from Plot_all import (FIGURE_DPI, FrameRenderer, base_path, control_file_path, filename, load_matrix,
+                      output_folders, read_boundary, read_extents, shp_path, variable_list)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from result_reader import ResultReader
+
+
+class Follower:
+    """Render the steps of a result file that were not rendered yet"""
+
+    def __init__(self, reader, renderer, variables, publish=None):
+        self.reader = reader
+        self.renderer = renderer
+        self.variables = [var for var in variables if var in reader]
+        self.publish = publish
+        self.rendered = {var: 0 for var in self.variables}
+
+    @property
+    def live(self):
+        """True when every followed variable is a stack the model appends to"""
+        return bool(self.variables) and all(self.reader.is_stacked(var) or not self.reader.entries(var)
+                                            for var in self.variables)
+
+    def render_new(self):
+        """Render the new steps of every variable in time order; returns the saved paths"""
+        saved = []
+        for var in self.variables:
+            n = len(self.reader.entries(var))
+            if n == self.rendered[var]:
+                continue
+            digits = self.reader.time_digits(var)
+            for position in range(self.rendered[var], n):
+                Time_moment = f"{int(digits[position])}"
+                variable_matrix = load_matrix(self.reader.raw_frame(var, position), var,
+                                              self.reader.encoding(var))
+                fig, save_path = self.renderer.draw_frame(var, Time_moment, variable_matrix)
+                fig.savefig(save_path, dpi=FIGURE_DPI)
+                print(f"{time.strftime('%H:%M:%S')} saved plot: {save_path}")
+                saved.append(save_path)
+                if self.publish:
+                    self.run_publish(save_path, var, Time_moment)
+            self.rendered[var] = n
+        return saved
+
+    def run_publish(self, path, var, Time_moment):
+        command = self.publish.format(path=path, var=var, time=Time_moment)
+        result = subprocess.run(command, shell=True)
+        if result.returncode != 0:
+            print(f"Publish command failed ({result.returncode}): {command}")
+
+
+def wait_for_file(path, interval):
+    """Wait until the model has created the result file"""
+    while not os.path.exists(path):
+        print(f"Waiting for {path}")
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the steps of Result_all.h5 while the model writes it")
+    parser.add_argument("source", nargs="?", default=filename, help="result file (default: as in Plot_all.py)")
+    parser.add_argument("--out", default=base_path, help="folder of the R, W, SM, FS, PF and Volume frames")
+    parser.add_argument("--vars", nargs="+", default=variable_list, choices=variable_list,
+                        help="variables to render (default: all plotted ones)")
+    parser.add_argument("--control", default=control_file_path,
+                        help="control file, for the extents of result files without them "
+                             "(default: ../Control.Project)")
+    parser.add_argument("--boundary", default=shp_path,
+                        help="basin boundary shapefile (default: ../HydroBasics/Basin_boundary.shp)")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between polls (default: 2)")
+    parser.add_argument("--idle-exit", type=float, default=None,
+                        help="exit when no new step arrived for this many seconds")
+    parser.add_argument("--once", action="store_true", help="render the steps in the file and exit")
+    parser.add_argument("--skip-existing", action="store_true",
+                        help="only render steps written after the start of this script")
+    parser.add_argument("--publish", metavar="CMD",
+                        help="command run for every new frame; {path}, {var} and {time} are replaced")
+    args = parser.parse_args()
+
+    for folder in output_folders:
+        os.makedirs(os.path.join(args.out, folder), exist_ok=True)
+
+    wait_for_file(args.source, args.interval)
+    # the model creates every dataset before it starts SWMR writing, so
+    # retry while the file is still being set up
+    while True:
+        try:
+            reader = ResultReader(args.source, cache_size=0, swmr=True)
+            break
+        except OSError as e:
+            print(f"Cannot open {args.source} yet: {e}")
+            time.sleep(args.interval)
+
+    # the file is already open in SWMR mode, take the extents from it
+    try:
+        extents = {"hydro": reader.group_grid("Hydrology").extent, "land": reader.group_grid("Landslide").extent}
+    except KeyError:
+        extents = read_extents(args.control)
+    boundary = read_boundary(args.boundary)
+    renderer = FrameRenderer(None, extents, boundary, args.out)
+    follower = Follower(reader, renderer, args.vars, args.publish)
+    if not follower.variables:
+        print(f"None of {args.vars} in {args.source}; found {reader.variables}")
+        return 1
+    if args.skip_existing:
+        follower.rendered = {var: len(reader.entries(var)) for var in follower.variables}
+
+    try:
+        follower.render_new()
+        if args.once:
+            return 0
+        if not follower.live:
+            print(f"{args.source} was not written with ResultSWMR = yes; rendered its steps, not following")
+            return 0
+        last_step = time.time()
+        while True:
+            time.sleep(args.interval)
+            if reader.refresh() and follower.render_new():
+                last_step = time.time()
+            elif args.idle_exit is not None and time.time() - last_step > args.idle_exit:
+                print(f"No new step for {args.idle_exit:g} s, stopping")
+                return 0
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        renderer.close()
+        reader.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
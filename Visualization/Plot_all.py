@@ -4,86 +4,65 @@
 Created on Tue Nov  8 15:08:15 2022
 @author: Guoding_Chen
 This program plots matrices and creates videos.
+
+Datasets can be rendered by a pool of worker processes (--workers). Each
+worker builds one template figure per variable the first time it meets it
+and afterwards only swaps the image data and the title, so the colorbar
+axes, basin boundary and labels are drawn once per worker instead of once
+per frame. The saved JPGs are identical to the ones of the serial loop.
+
+With --stream-video every frame is rendered once into an in-memory RGBA
+buffer and pushed straight into the cv2.VideoWriter of its variable, one
+process per variable, instead of writing JPGs and reading them back for
+the videos. The JPG stills are then optional (--no-jpg).
+
+Every run records in render_manifest.json the checksum of the stored bytes
+of each plotted dataset and a signature of its plot style. With
+--incremental the output folders are not cleared: only datasets that are
+new, changed, restyled or whose JPG is missing are rendered, frames of
+datasets that left the file are removed, and only the videos of variables
+with such changes are rebuilt (from the JPGs on disk, or re-streamed as a
+whole with --stream-video).
+
+The frames are listed and read with result_reader, so both layouts of the
+result file are plotted: one GOVar_<Var>_<Date> dataset per step, and the
+GOVar_<Var> stacks with their Time dataset written with ResultSWMR,
+ResultBuffer or ResultWriterThread.
 """
 
+import argparse
 import cv2
+import hashlib
+import io
+import json
 import numpy as np
 import re
-import h5py
 import matplotlib
 matplotlib.use('Agg')  # Non-interactive backend
+import matplotlib.image as mimage
 import matplotlib.pyplot as plt
 from matplotlib import colors
 from matplotlib.colors import ListedColormap, LinearSegmentedColormap
+import multiprocessing
 import os
 import shapefile as shp
+import sys
+from VideoMaker import open_video_writer, make_videos
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from result_reader import ResultReader, decode, encoding
 
 # Font settings
 font1 = {'family': 'Arial', 'style': 'normal', 'weight': 'normal', 'size': 16}
 
-# Base path
-base_path = 'D:/Recheck/iHydroSlide3D_v1_1/Visualization'
+# Default paths, relative to the project this folder belongs to
+base_path = os.path.dirname(os.path.abspath(__file__))
+project_path = os.path.dirname(base_path)
+control_file_path = os.path.join(project_path, 'Control.Project')
+shp_path = os.path.join(project_path, 'HydroBasics', 'Basin_boundary.shp')
+filename = os.path.join(project_path, 'Results', 'Result_all.h5')
 
-# Create output directories
-for folder in ["R", "W", "SM", "FS", "PF", "Volume"]:
-    os.makedirs(os.path.join(base_path, folder), exist_ok=True)
-
-# Clear output directories
-for folder in ["R", "W", "SM", "FS", "PF", "Volume"]:
-    folder_path = os.path.join(base_path, folder)
-    for filename in os.listdir(folder_path):
-        try:
-            os.remove(os.path.join(folder_path, filename))
-        except PermissionError:
-            print(f"Could not delete {filename} in {folder_path}")
-
-# Read control file
-control_file_path = 'D:/Recheck/iHydroSlide3D_v1_1/Control.Project'
-try:
-    with open(control_file_path, 'r') as control_file:
-        control_contents = control_file.readlines()
-except FileNotFoundError:
-    print(f"Control file not found: {control_file_path}")
-    exit(1)
-
-def get_control_value(key):
-    try:
-        line = re.sub(r'\s+', '', [s for s in control_contents if key in s][0])
-        return float(line.split("#", 1)[0].split("=", 1)[1])
-    except IndexError:
-        print(f"Key {key} not found in control file")
-        exit(1)
-
-# Hydro and landslide parameters
-XLLCorner_hydro = get_control_value("XLLCorner_Hydro")
-YLLCorner_hydro = get_control_value("YLLCorner_Hydro")
-nCols_hydro = get_control_value("NCols_Hydro")
-nRows_hydro = get_control_value("NRows_Hydro")
-cellSize_hydro = get_control_value("CellSize_Hydro")
-XLLCorner_land = get_control_value("XLLCorner_Land")
-YLLCorner_land = get_control_value("YLLCorner_Land")
-nCols_land = get_control_value("NCols_Land")
-nRows_land = get_control_value("NRows_Land")
-cellSize_land = get_control_value("CellSize_Land")
-
-print(f"Hydro domain: {int(nCols_hydro)}x{int(nRows_hydro)}, cellsize: {cellSize_hydro}")
-print(f"Land domain: {int(nCols_land)}x{int(nRows_land)}, cellsize: {cellSize_land}")
-
-# Extents
-extent_hydro = [XLLCorner_hydro, XLLCorner_hydro + nCols_hydro * cellSize_hydro,
-                YLLCorner_hydro, YLLCorner_hydro + nRows_hydro * cellSize_hydro]
-extent_land = [XLLCorner_land, XLLCorner_land + nCols_land * cellSize_land,
-               YLLCorner_land, YLLCorner_land + nRows_land * cellSize_land]
-
-# Read boundary shapefile
-shp_path = "D:/Recheck/iHydroSlide3D_v1_1/HydroBasics/Basin_boundary.shp"
-try:
-    sf = shp.Reader(shp_path)
-    x = np.array([i[0] for shape in sf.shapeRecords() for i in shape.shape.points])
-    y = np.array([i[1] for shape in sf.shapeRecords() for i in shape.shape.points])
-except Exception as e:
-    print(f"Error reading shapefile {shp_path}: {e}")
-    exit(1)
+output_folders = ["R", "W", "SM", "FS", "PF", "Volume"]
 
 # Color settings
 NODATA_value = -9999
@@ -98,125 +77,570 @@ bounds_FS = np.array([0, 0.8, 1, 1.2, 1.4, 2, 3])
 norm_FS = colors.BoundaryNorm(boundaries=bounds_FS, ncolors=7)
 colorbar_FS = LinearSegmentedColormap.from_list('my_palette', style_color_FS / 255, N=7)
 
-# Plotting
+# Plot style of every variable: image colormap/normalisation, colorbar
+# position, label and ticks, and the output folder of the frames
+variable_styles = {
+    "R": {"folder": "R", "domain": "hydro", "cmap": colorbar_R,
+          "norm": colors.LogNorm(vmin=10**-1, vmax=10**3),
+          "cb_label": 'R ($\\mathrm{m^3/s}$)', "cb_pos": [-40, 1.25],
+          "cbar_rect": [0.82, 0.35, 0.035, 0.3]},
+    "W": {"folder": "W", "domain": "hydro", "cmap": colorbar_W, "vmin": 0, "vmax": 150,
+          "cb_label": 'W ($\\mathrm{mm}$)', "cb_pos": [-30, 1.25],
+          "cbar_rect": [0.82, 0.35, 0.035, 0.3],
+          "ticks": [0, 25, 50, 75, 100, 125, 150]},
+    "SM": {"folder": "SM", "domain": "hydro", "cmap": colorbar_SM, "vmin": 0, "vmax": 100,
+           "cb_label": 'SM ($\\%$)', "cb_pos": [-30, 1.25],
+           "cbar_rect": [0.82, 0.35, 0.035, 0.3]},
+    "FS3D": {"folder": "FS", "domain": "land", "cmap": colorbar_FS, "norm": norm_FS,
+             "cb_label": '$F_{s}$ (-)', "cb_pos": [-20, 1.18],
+             "cbar_rect": [0.86, 0.30, 0.035, 0.4], "extend": "max"},
+    "PF": {"folder": "PF", "domain": "land", "cmap": colorbar_PF, "vmin": 0, "vmax": 1,
+           "cb_label": '$P_{f}$ (-)', "cb_pos": [-25, 1.23],
+           "cbar_rect": [0.86, 0.35, 0.035, 0.3],
+           "ticks": [0, 0.2, 0.4, 0.6, 0.8, 1]},
+    "FVolume": {"folder": "Volume", "domain": "land", "cmap": colorbar_Volume,
+                "vmin": 2*10**5, "vmax": 5*10**5,
+                "cb_label": '$V_{L}$ ($\\mathrm{10^5~m^{3}}$)', "cb_pos": [-30, 1.15],
+                "cbar_rect": [0.86, 0.25, 0.035, 0.5],
+                "ticks": [2*10**5, 2.5*10**5, 3*10**5, 3.5*10**5, 4*10**5, 4.5*10**5, 5*10**5],
+                "ticklabels": ["2", "2.5", "3", "3.5", "4", "4.5", "5"]},
+}
 variable_list = ["R", "W", "SM", "FS3D", "PF", "FVolume"]
-filename = 'D:/Recheck/iHydroSlide3D_v1_1/Results/Result_all.h5'
-try:
-    data = h5py.File(filename, 'r')
-except FileNotFoundError:
-    print(f"HDF5 file not found: {filename}")
-    exit(1)
-
-for group in data.keys():
-    for dset in data[group].keys():
-        print(f"Processing dataset: {dset}")
+FIGURE_DPI = 300
+MANIFEST_NAME = "render_manifest.json"
+
+
+def read_control_file(path):
+    try:
+        with open(path, 'r') as control_file:
+            return control_file.readlines()
+    except FileNotFoundError:
+        print(f"Control file not found: {path}")
+        exit(1)
+
+
+def get_control_value(control_contents, key):
+    try:
+        line = re.sub(r'\s+', '', [s for s in control_contents if key in s][0])
+        return float(line.split("#", 1)[0].split("=", 1)[1])
+    except IndexError:
+        print(f"Key {key} not found in control file")
+        exit(1)
+
+
+def read_extents(path, verbose=True):
+    """Return the plotting extents of the hydro and landslide domains"""
+    control_contents = read_control_file(path)
+    XLLCorner_hydro = get_control_value(control_contents, "XLLCorner_Hydro")
+    YLLCorner_hydro = get_control_value(control_contents, "YLLCorner_Hydro")
+    nCols_hydro = get_control_value(control_contents, "NCols_Hydro")
+    nRows_hydro = get_control_value(control_contents, "NRows_Hydro")
+    cellSize_hydro = get_control_value(control_contents, "CellSize_Hydro")
+    XLLCorner_land = get_control_value(control_contents, "XLLCorner_Land")
+    YLLCorner_land = get_control_value(control_contents, "YLLCorner_Land")
+    nCols_land = get_control_value(control_contents, "NCols_Land")
+    nRows_land = get_control_value(control_contents, "NRows_Land")
+    cellSize_land = get_control_value(control_contents, "CellSize_Land")
+
+    if verbose:
+        print(f"Hydro domain: {int(nCols_hydro)}x{int(nRows_hydro)}, cellsize: {cellSize_hydro}")
+        print(f"Land domain: {int(nCols_land)}x{int(nRows_land)}, cellsize: {cellSize_land}")
+
+    extent_hydro = [XLLCorner_hydro, XLLCorner_hydro + nCols_hydro * cellSize_hydro,
+                    YLLCorner_hydro, YLLCorner_hydro + nRows_hydro * cellSize_hydro]
+    extent_land = [XLLCorner_land, XLLCorner_land + nCols_land * cellSize_land,
+                   YLLCorner_land, YLLCorner_land + nRows_land * cellSize_land]
+    return {"hydro": extent_hydro, "land": extent_land}
+
+
+def read_extents_h5(h5_path, verbose=True):
+    """
+    Return the plotting extents from the group attributes of the result file.
+
+    Returns None for files written without the NCols/.../CellSize attributes.
+    """
+    try:
+        with ResultReader(h5_path) as reader:
+            grids = {"hydro": reader.group_grid("Hydrology"), "land": reader.group_grid("Landslide")}
+    except (KeyError, OSError):
+        return None
+    if verbose:
+        print(f"Hydro domain: {grids['hydro'].ncols}x{grids['hydro'].nrows}, cellsize: {grids['hydro'].cellsize}")
+        print(f"Land domain: {grids['land'].ncols}x{grids['land'].nrows}, cellsize: {grids['land'].cellsize}")
+    return {domain: grid.extent for domain, grid in grids.items()}
+
+
+def read_boundary(path):
+    """Read the basin boundary shapefile as two coordinate arrays"""
+    try:
+        sf = shp.Reader(path)
+        x = np.array([i[0] for shape in sf.shapeRecords() for i in shape.shape.points])
+        y = np.array([i[1] for shape in sf.shapeRecords() for i in shape.shape.points])
+    except Exception as e:
+        print(f"Error reading shapefile {path}: {e}")
+        exit(1)
+    return x, y
+
+
+def load_matrix(h5_dataset, variable_tag, data_encoding=None, packing=None):
+    """
+    Decode a stored dataset into the float matrix that is plotted.
+
+    Scale, offset and NoData value come from the attributes of the dataset;
+    a raw array is decoded with data_encoding (see result_reader.encoding),
+    or as value*100 with NODATA_value when it is not given. The vector of a
+    file written with PackedCells is put back on the grid with packing.
+    """
+    if data_encoding is None:
+        attrs = dict(getattr(h5_dataset, "attrs", {}))
+        attrs.setdefault("NoData_Value", NODATA_value)
+        data_encoding = encoding(attrs)
+    raw = h5_dataset[:]
+    if packing is not None:
+        raw = packing.scatter(raw, data_encoding[0])
+    variable_matrix = decode(raw, *data_encoding)
+    if variable_tag == "R":
+        variable_matrix[variable_matrix == 0] = 0.000001
+    return variable_matrix
+
+
+def build_template(variable_tag, variable_matrix, Time_moment, extents, boundary):
+    """
+    Build the complete figure of one variable.
+
+    Returns (fig, im, title). Later frames of the same variable only need
+    im.set_data() and title.set_text() before saving.
+    """
+    style = variable_styles[variable_tag]
+    extent = extents[style["domain"]]
+    x, y = boundary
+
+    fig, ax = plt.subplots(figsize=(6, 6))
+    fig.subplots_adjust(bottom=0.0, top=0.98, left=0.00, right=0.9)
+
+    if "norm" in style:
+        im = ax.imshow(variable_matrix, extent=extent, cmap=style["cmap"], norm=style["norm"])
+    else:
+        im = ax.imshow(variable_matrix, extent=extent, cmap=style["cmap"],
+                       vmin=style["vmin"], vmax=style["vmax"])
+    cbar_ax = fig.add_axes(style["cbar_rect"])
+
+    ax.plot(x, y, 'k', linewidth=1.5)
+    ax.set_xlim(extent[0:2])
+    ax.set_ylim(extent[2:4])
+    title = fig.suptitle(Time_moment, fontsize=16)
+    ax.axis('off')
+
+    cbar_ax.tick_params(labelsize=15)
+    cb = fig.colorbar(im, cax=cbar_ax)
+    cb.set_label(style["cb_label"], fontdict=font1, rotation=0,
+                 labelpad=style["cb_pos"][0], y=style["cb_pos"][1])
+    if "ticks" in style:
+        cb.set_ticks(style["ticks"])
+    if "ticklabels" in style:
+        cb.set_ticklabels(style["ticklabels"])
+    if "extend" in style:
+        cb = fig.colorbar(im, cax=cbar_ax, extend=style["extend"])
+
+    return fig, im, title
+
+
+class FrameRenderer:
+    """Render datasets of Result_all.h5 reusing one figure per variable"""
+
+    def __init__(self, h5_path, extents, boundary, out_dir):
+        # h5_path may be None when the frames are passed in by draw_frame
+        self.reader = ResultReader(h5_path, cache_size=0) if h5_path is not None else None
+        self.extents = extents
+        self.boundary = boundary
+        self.out_dir = out_dir
+        self.templates = {}
+        self.digits = {}
+
+    def time_moment(self, variable_tag, position):
+        """Date digits of step number position of a variable, the title and file name of its frame"""
+        if variable_tag not in self.digits:
+            self.digits[variable_tag] = self.reader.time_digits(variable_tag)
+        return f"{int(self.digits[variable_tag][position])}"
+
+    def draw(self, variable_tag, position):
+        """
+        Put step number position of a variable into its template figure.
+
+        Returns (fig, save_path), or None when the variable is not plotted.
+        """
+        if variable_tag not in variable_list:
+            print(f"Skipping {variable_tag}: not in {variable_list}")
+            return None
+        Time_moment = self.time_moment(variable_tag, position)
+        print(f"Plotting {variable_tag} for {Time_moment}")
+        variable_matrix = load_matrix(self.reader.raw_frame(variable_tag, position), variable_tag,
+                                      self.reader.encoding(variable_tag))
+        return self.draw_frame(variable_tag, Time_moment, variable_matrix)
+
+    def draw_frame(self, variable_tag, Time_moment, variable_matrix):
+        """Put a decoded frame into the template figure of its variable; returns (fig, save_path)"""
+        OutFigure_name = f"{variable_tag}_{Time_moment}.jpg"
+
+        if variable_tag in self.templates:
+            fig, im, title = self.templates[variable_tag]
+            im.set_data(variable_matrix)
+            title.set_text(Time_moment)
+        else:
+            fig, im, title = build_template(variable_tag, variable_matrix, Time_moment,
+                                            self.extents, self.boundary)
+            self.templates[variable_tag] = (fig, im, title)
+
+        save_path = os.path.join(self.out_dir, variable_styles[variable_tag]["folder"], OutFigure_name)
+        return fig, save_path
+
+    def render(self, variable_tag, position):
+        """Save one step of a variable as a JPG and return its path"""
+        print(f"Processing {variable_tag} step {position}")
         try:
-            variable_tag = dset.split("_", 2)[1]
-            print(f"Variable tag: {variable_tag}")
-            if variable_tag in variable_list:
-                print(f"Plotting {variable_tag} for {dset}")
-                variable_matrix = data[group][dset][:]
-                variable_matrix = variable_matrix.astype(np.float32)
-                variable_matrix[variable_matrix == NODATA_value] = np.nan
-                variable_matrix = variable_matrix / 100
-                Time_moment = dset.split("_", 2)[2]
-                OutFigure_name = dset.split("_", 1)[1] + ".jpg"
-
-                fig, ax = plt.subplots(figsize=(6, 6))
-                plt.subplots_adjust(bottom=0.0, top=0.98, left=0.00, right=0.9)
-
-                if variable_tag == "R":
-                    variable_matrix[variable_matrix == 0] = 0.000001
-                    im = ax.imshow(variable_matrix, extent=extent_hydro, cmap=colorbar_R,
-                                   norm=colors.LogNorm(vmin=10**-1, vmax=10**3))
-                    cb_label = 'R ($\mathrm{m^3/s}$)'
-                    cb_pos = [-40, 1.25]
-                    folder = "R"
-                    cbar_ax = fig.add_axes([0.82, 0.35, 0.035, 0.3])
-                elif variable_tag == "W":
-                    im = ax.imshow(variable_matrix, extent=extent_hydro, cmap=colorbar_W, vmin=0, vmax=150)
-                    cb_label = 'W ($\mathrm{mm}$)'
-                    cb_pos = [-30, 1.25]
-                    folder = "W"
-                    cbar_ax = fig.add_axes([0.82, 0.35, 0.035, 0.3])
-                elif variable_tag == "SM":
-                    im = ax.imshow(variable_matrix, extent=extent_hydro, cmap=colorbar_SM, vmin=0, vmax=100)
-                    cb_label = 'SM ($\%$)'
-                    cb_pos = [-30, 1.25]
-                    folder = "SM"
-                    cbar_ax = fig.add_axes([0.82, 0.35, 0.035, 0.3])
-                elif variable_tag == "FS3D":
-                    im = ax.imshow(variable_matrix, extent=extent_land, cmap=colorbar_FS, norm=norm_FS)
-                    cb_label = '$F_{s}$ (-)'
-                    cb_pos = [-20, 1.18]
-                    folder = "FS"
-                    cbar_ax = fig.add_axes([0.86, 0.30, 0.035, 0.4])
-                elif variable_tag == "PF":
-                    im = ax.imshow(variable_matrix, extent=extent_land, cmap=colorbar_PF, vmin=0, vmax=1)
-                    cb_label = '$P_{f}$ (-)'
-                    cb_pos = [-25, 1.23]
-                    folder = "PF"
-                    cbar_ax = fig.add_axes([0.86, 0.35, 0.035, 0.3])
-                elif variable_tag == "FVolume":
-                    im = ax.imshow(variable_matrix, extent=extent_land, cmap=colorbar_Volume, vmin=2*10**5, vmax=5*10**5)
-                    cb_label = '$V_{L}$ ($\mathrm{10^5~m^{3}}$)'
-                    cb_pos = [-30, 1.15]
-                    folder = "Volume"
-                    cbar_ax = fig.add_axes([0.86, 0.25, 0.035, 0.5])
-
-                ax.plot(x, y, 'k', linewidth=1.5)
-                ax.set_xlim(extent_hydro[0:2] if variable_tag in ["R", "W", "SM"] else extent_land[0:2])
-                ax.set_ylim(extent_hydro[2:4] if variable_tag in ["R", "W", "SM"] else extent_land[2:4])
-                plt.suptitle(Time_moment, fontsize=16)
-                ax.axis('off')
-
-                cbar_ax.tick_params(labelsize=15)
-                cb = plt.colorbar(im, cax=cbar_ax)
-                cb.set_label(cb_label, fontdict=font1, rotation=0, labelpad=cb_pos[0], y=cb_pos[1])
-                if variable_tag == "W":
-                    cb.set_ticks([0, 25, 50, 75, 100, 125, 150])
-                elif variable_tag == "PF":
-                    cb.set_ticks([0, 0.2, 0.4, 0.6, 0.8, 1])
-                elif variable_tag == "FVolume":
-                    cb.set_ticks([2*10**5, 2.5*10**5, 3*10**5, 3.5*10**5, 4*10**5, 4.5*10**5, 5*10**5])
-                    cb.set_ticklabels(["2", "2.5", "3", "3.5", "4", "4.5", "5"])
-                elif variable_tag == "FS3D":
-                    cb = plt.colorbar(im, cax=cbar_ax, extend="max")
-
-                save_path = os.path.join(base_path, folder, OutFigure_name)
-                plt.savefig(save_path, dpi=300)
-                plt.close()
+            drawn = self.draw(variable_tag, position)
+            if drawn is None:
+                return None
+            fig, save_path = drawn
+            fig.savefig(save_path, dpi=FIGURE_DPI)
+            print(f"Saved plot: {save_path}")
+            return save_path
+        except Exception as e:
+            print(f"Error processing {variable_tag} step {position}: {e}")
+            return None
+
+    def render_rgba(self, variable_tag, position, save_jpg=False):
+        """
+        Render one step of a variable into an in-memory RGBA array.
+
+        The JPG still, if requested, is encoded from the same buffer the way
+        matplotlib's JPG writer does it, so it matches render() exactly.
+        """
+        print(f"Processing {variable_tag} step {position}")
+        try:
+            drawn = self.draw(variable_tag, position)
+            if drawn is None:
+                return None
+            fig, save_path = drawn
+            buf = io.BytesIO()
+            fig.savefig(buf, format='raw', dpi=FIGURE_DPI)
+            width, height = [int(round(v * FIGURE_DPI)) for v in fig.get_size_inches()]
+            rgba = np.frombuffer(buf.getbuffer(), dtype=np.uint8).reshape(height, width, 4)
+            if save_jpg:
+                with matplotlib.rc_context({"savefig.facecolor": "white"}):
+                    mimage.imsave(save_path, rgba, format='jpeg', dpi=FIGURE_DPI)
                 print(f"Saved plot: {save_path}")
-            else:
-                print(f"Skipping dataset {dset}: variable_tag {variable_tag} not in {variable_list}")
-                continue  # Skip non-matching datasets
+            return rgba
         except Exception as e:
-            print(f"Error processing dataset {dset}: {e}")
+            print(f"Error processing {variable_tag} step {position}: {e}")
+            return None
+
+    def close(self):
+        for fig, _, _ in self.templates.values():
+            plt.close(fig)
+        self.templates = {}
+        if self.reader is not None:
+            self.reader.close()
+
+
+# renderer owned by each worker process of the pool
+_worker_renderer = None
+
+
+def _init_worker(h5_path, extents, boundary, out_dir):
+    global _worker_renderer
+    _worker_renderer = FrameRenderer(h5_path, extents, boundary, out_dir)
+
+
+def _render_task(task):
+    return _worker_renderer.render(*task)
+
+
+def open_result(h5_path):
+    """ResultReader of the result file, exits when it cannot be opened"""
+    try:
+        return ResultReader(h5_path, cache_size=0)
+    except (FileNotFoundError, OSError):
+        print(f"HDF5 file not found: {h5_path}")
+        exit(1)
+
+
+def list_frames(h5_path):
+    """List the (variable, step) pairs of the plotted variables, in time order per variable"""
+    with open_result(h5_path) as reader:
+        tasks = []
+        for variable_tag in reader.variables:
+            if variable_tag not in variable_list:
+                print(f"Skipping {variable_tag}: not in {variable_list}")
+                continue
+            tasks.extend((variable_tag, position) for position in range(len(reader.entries(variable_tag))))
+    return tasks
+
+
+def render_all(h5_path, extents, boundary, out_dir, workers=1, tasks=None):
+    """Render the (variable, step) frames (default: all), in this process or spread over a process pool"""
+    if tasks is None:
+        tasks = list_frames(h5_path)
+    if not tasks:
+        return []
+    if workers <= 1:
+        renderer = FrameRenderer(h5_path, extents, boundary, out_dir)
+        try:
+            saved = [renderer.render(variable_tag, position) for variable_tag, position in tasks]
+        finally:
+            renderer.close()
+    else:
+        # consecutive frames of one variable go to the same worker so its
+        # template is reused for a whole run of frames
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                                  initargs=(h5_path, extents, boundary, out_dir)) as pool:
+            saved = pool.map(_render_task, tasks, chunksize=chunksize)
+    return [path for path in saved if path is not None]
+
+
+def stream_variable(renderer, variable_tag, positions, save_jpg=True):
+    """Render the steps of one variable in time order straight into its video"""
+    out_path = os.path.join(renderer.out_dir, f"{variable_styles[variable_tag]['folder']}.avi")
+    out = None
+    for position in sorted(positions):
+        rgba = renderer.render_rgba(variable_tag, position, save_jpg=save_jpg)
+        if rgba is None:
             continue
-data.close()
-
-# Video creation
-print("Start making videos")
-for folder in ["R", "W", "SM", "FS", "PF", "Volume"]:
-    folder_path = os.path.join(base_path, folder)
-    file_list = [f for f in os.listdir(folder_path) if f.endswith('.jpg')]
-    if file_list:
-        file_list.sort(key=lambda x: int("".join([i for i in x if i.isdigit()])))
-        img_array = []
-        for filename in file_list:
-            img_path = os.path.join(folder_path, filename)
-            img = cv2.imread(img_path)
-            if img is not None:
-                img_array.append(img)
-            else:
-                print(f"Failed to read image: {img_path}")
-        if img_array:
-            height, width, layers = img_array[0].shape
-            out_path = os.path.join(base_path, f"{folder}.avi")
-            out = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*'DIVX'), 5, (width, height))
-            for img in img_array:
-                out.write(img)
-            out.release()
-            print(f"Created video: {out_path}")
+        if out is None:
+            height, width, layers = rgba.shape
+            out = open_video_writer(out_path, (width, height))
+        out.write(cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR))
+    if out is None:
+        print(f"No frames rendered for {variable_tag}")
+        return None
+    out.release()
+    print(f"Created video: {out_path}")
+    return out_path
+
+
+def _stream_task(task):
+    return stream_variable(_worker_renderer, *task)
+
+
+def stream_all(h5_path, extents, boundary, out_dir, workers=1, save_jpg=True, variables=None):
+    """Render every variable (or those given) into its video, encoding the variables concurrently"""
+    by_variable = {}
+    for variable_tag, position in list_frames(h5_path):
+        if variables is None or variable_tag in variables:
+            by_variable.setdefault(variable_tag, []).append(position)
+    tasks = [(variable_tag, positions, save_jpg) for variable_tag, positions in by_variable.items()]
+    if not tasks:
+        return []
+
+    if workers <= 1 or len(tasks) <= 1:
+        renderer = FrameRenderer(h5_path, extents, boundary, out_dir)
+        try:
+            videos = [stream_variable(renderer, *task) for task in tasks]
+        finally:
+            renderer.close()
     else:
-        print(f"No images found in {folder_path}")
\ No newline at end of file
+        with multiprocessing.Pool(min(workers, len(tasks)), initializer=_init_worker,
+                                  initargs=(h5_path, extents, boundary, out_dir)) as pool:
+            videos = pool.map(_stream_task, tasks, chunksize=1)
+    return [path for path in videos if path is not None]
+
+
+def _style_value(value):
+    """JSON-able description of one entry of variable_styles"""
+    if isinstance(value, colors.Colormap):
+        return [type(value).__name__, value.name, value.N,
+                np.round(value(np.linspace(0, 1, value.N)), 6).tolist()]
+    if isinstance(value, colors.Normalize):
+        boundaries = getattr(value, "boundaries", None)
+        return [type(value).__name__, value.vmin, value.vmax,
+                None if boundaries is None else np.asarray(boundaries).tolist()]
+    return value
+
+
+def style_signature(variable_tag, extents, boundary):
+    """Hash of everything that decides how the frames of a variable look"""
+    style = variable_styles[variable_tag]
+    description = {key: _style_value(value) for key, value in style.items()}
+    description["extent"] = [float(v) for v in extents[style["domain"]]]
+    description["dpi"] = FIGURE_DPI
+    description["font"] = font1
+    description["boundary"] = hashlib.sha1(np.asarray(boundary, dtype=np.float64).tobytes()).hexdigest()
+    text = json.dumps(description, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def dataset_checksum(h5_dataset, step=None):
+    """
+    Checksum of the bytes stored for a dataset, read without decompressing them.
+
+    With step, the checksum of that step of a stacked dataset, whose chunks
+    hold several steps; its values are read and hashed instead.
+    """
+    shape = h5_dataset.shape if step is None else h5_dataset.shape[1:]
+    digest = hashlib.sha1(f"{h5_dataset.dtype.str}{shape}".encode())
+    # the frames also change with the decoding of the stored values
+    for key in ("scale_factor", "add_offset", "NoData_Value"):
+        if key in h5_dataset.attrs:
+            digest.update(f"{key}={h5_dataset.attrs[key]!r}".encode())
+    dsid = h5_dataset.id
+    if step is not None:
+        digest.update(h5_dataset[step].tobytes())
+    elif h5_dataset.chunks is not None:
+        for k in range(dsid.get_num_chunks()):
+            offset = dsid.get_chunk_info(k).chunk_offset
+            digest.update(repr(offset).encode())
+            digest.update(dsid.read_direct_chunk(offset)[1])
+    else:
+        digest.update(h5_dataset[()].tobytes())
+    return digest.hexdigest()
+
+
+def load_manifest(out_dir):
+    """The manifest of the previous run, or an empty one"""
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    manifest.setdefault("datasets", {})
+    return manifest
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def plan_render(h5_path, manifest, signatures, out_dir, check_frames=True):
+    """
+    Compare the result file with the manifest of the previous run.
+
+    Returns (tasks, entries, changed): the (variable, step) pairs to render,
+    the manifest entries they get once rendered, and the variables whose
+    frames changed. Entries of datasets that are no longer in the file are
+    dropped from the manifest and their JPGs removed. The entries are keyed
+    <Group>/GOVar_<Var>_<Date> in both layouts of the file.
+    """
+    tasks, entries, changed = [], {}, set()
+    seen = set()
+    with open_result(h5_path) as reader:
+        for variable_tag in reader.variables:
+            if variable_tag not in variable_list:
+                continue
+            group = reader.group_of(variable_tag)
+            digits = reader.time_digits(variable_tag)
+            for position, (_, name, step) in enumerate(reader.entries(variable_tag)):
+                Time_moment = f"{int(digits[position])}"
+                key = f"{group}/GOVar_{variable_tag}_{Time_moment}" if group else f"GOVar_{variable_tag}_{Time_moment}"
+                seen.add(key)
+                frame = os.path.join(variable_styles[variable_tag]["folder"], f"{variable_tag}_{Time_moment}.jpg")
+                entry = {"variable": variable_tag, "frame": frame,
+                         "checksum": dataset_checksum(reader.file[name], step),
+                         "style": signatures[variable_tag]}
+                old = manifest["datasets"].get(key)
+                if (old is None or old["checksum"] != entry["checksum"] or old["style"] != entry["style"]
+                        or (check_frames and not os.path.exists(os.path.join(out_dir, frame)))):
+                    tasks.append((variable_tag, position))
+                    entries[key] = entry
+                    changed.add(variable_tag)
+
+    for key in [key for key in manifest["datasets"] if key not in seen]:
+        old = manifest["datasets"].pop(key)
+        changed.add(old["variable"])
+        try:
+            os.remove(os.path.join(out_dir, old["frame"]))
+        except OSError:
+            pass
+    return tasks, entries, changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plot the matrices of Result_all.h5 and create videos")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of rendering processes (default: 1, render in this process)")
+    parser.add_argument("--stream-video", action="store_true",
+                        help="render frames straight into the videos, one process per variable")
+    parser.add_argument("--no-jpg", action="store_true",
+                        help="with --stream-video, do not write the JPG stills")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"keep earlier frames and only render datasets that are new or changed "
+                             f"since the last run (recorded in {MANIFEST_NAME})")
+    parser.add_argument("--result", default=filename, help="result file (default: ../Results/Result_all.h5)")
+    parser.add_argument("--control", default=control_file_path,
+                        help="control file, for the extents of result files without them "
+                             "(default: ../Control.Project)")
+    parser.add_argument("--boundary", default=shp_path,
+                        help="basin boundary shapefile (default: ../HydroBasics/Basin_boundary.shp)")
+    parser.add_argument("--output", default=base_path,
+                        help="folder of the frame folders and videos (default: this folder)")
+    args = parser.parse_args()
+    if args.no_jpg and not args.stream_video:
+        parser.error("--no-jpg requires --stream-video")
+    out_dir, h5_path = args.output, args.result
+
+    # Create output directories
+    for folder in output_folders:
+        os.makedirs(os.path.join(out_dir, folder), exist_ok=True)
+
+    if args.incremental:
+        manifest = load_manifest(out_dir)
+    else:
+        # Clear output directories
+        manifest = {"datasets": {}}
+        for folder in output_folders:
+            folder_path = os.path.join(out_dir, folder)
+            for old_file in os.listdir(folder_path):
+                try:
+                    os.remove(os.path.join(folder_path, old_file))
+                except PermissionError:
+                    print(f"Could not delete {old_file} in {folder_path}")
+
+    extents = read_extents_h5(h5_path)
+    if extents is None:
+        extents = read_extents(args.control)
+    boundary = read_boundary(args.boundary)
+
+    signatures = {variable_tag: style_signature(variable_tag, extents, boundary) for variable_tag in variable_list}
+    tasks, entries, changed = plan_render(h5_path, manifest, signatures, out_dir,
+                                          check_frames=not args.no_jpg)
+    # variables whose video is missing are rendered again too
+    for variable_tag in variable_list:
+        video = os.path.join(out_dir, f"{variable_styles[variable_tag]['folder']}.avi")
+        if not os.path.exists(video) and any(entry["variable"] == variable_tag
+                                             for entry in manifest["datasets"].values()):
+            changed.add(variable_tag)
+    if args.incremental:
+        print(f"{len(tasks)} datasets to render, videos to rebuild: {sorted(changed) or 'none'}")
+
+    if args.stream_video:
+        # Plotting and video creation in one pass, whole variables at a time
+        print("Start rendering frames into videos")
+        videos = stream_all(h5_path, extents, boundary, out_dir, workers=args.workers,
+                            save_jpg=not args.no_jpg, variables=changed)
+        streamed = {os.path.splitext(os.path.basename(path))[0] for path in videos}
+        for key, entry in entries.items():
+            if variable_styles[entry["variable"]]["folder"] in streamed:
+                manifest["datasets"][key] = entry
+        save_manifest(out_dir, manifest)
+        return
+
+    # Plotting
+    saved = set(render_all(h5_path, extents, boundary, out_dir, workers=args.workers, tasks=tasks))
+    for key, entry in entries.items():
+        if os.path.join(out_dir, entry["frame"]) in saved:
+            manifest["datasets"][key] = entry
+    save_manifest(out_dir, manifest)
+
+    # Video creation
+    print("Start making videos")
+    folders = [folder for folder in output_folders
+               if not args.incremental or any(variable_styles[variable_tag]["folder"] == folder
+                                              for variable_tag in changed)]
+    make_videos(out_dir, folders, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Export the maps of Result_all.h5 as XYZ/PNG tile pyramids for web map viewers.
+
+Every step of the exported variables becomes a Web Mercator tile pyramid
+(256x256 PNG tiles, z/x/y as in OpenStreetMap, Leaflet and OpenLayers),
+coloured with the colormaps and norms of Plot_all.py and transparent for
+NoData, so a browser only loads the tiles of the part of the basin it
+shows at the zoom it shows. The grids are placed with the
+NCols/NRows/XLLCorner/YLLCorner/CellSize attributes of their group, which
+must be in geographic degrees (WGS84).
+
+The deepest zoom (--max-zoom, default: the first one whose pixels are not
+larger than a cell) samples the grid itself; the lower zooms sample
+overview levels of the grid, each halving the resolution of the previous
+one. An overview cell is the mean of the cells below it, except for FS3D
+(the minimum) and PF and FVolume (the maximum), so an unstable cell does
+not vanish when zooming out. The (variable, step, zoom) levels are
+rendered by a pool of worker processes (--workers).
+
+Tiles are stored once by content: every tile is hashed before it is
+encoded, new tiles are written to <output>/store/<hash>.png, and the z/x/y
+path of the step is a hard link to it (a copy where links are not
+possible). A tile that did not change since the previous step, or that
+looks like any other tile, is neither encoded nor stored again, and tiles
+without data are not written at all, which the viewers show as empty.
+
+Output layout:
+    <output>/store/ab/abcdef....png          unique tiles
+    <output>/<Var>/<YYYYMMDDHH>/<z>/<x>/<y>.png
+    <output>/<Var>/legend.png                 colorbar of the variable
+    <output>/<Var>/tiles.json                 bounds, zooms, steps and URL template
+
+With a viewer, use the URL template of tiles.json with {time} replaced by a
+step, e.g. L.tileLayer("FS3D/2024090512/{z}/{x}/{y}.png") in Leaflet.
+
+Usage:
+    python TileExport.py --vars FS3D PF --workers 8
+    python TileExport.py --result ../Results/Result_all.h5 --output tiles --start 2024-09-05 --end 2024-09-06
+    python TileExport.py --vars SM --min-zoom 6 --max-zoom 10
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import sys
+import warnings
+
+import cv2
+import matplotlib
+matplotlib.use('Agg')  # Non-interactive backend
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib import colors
+
+from Plot_all import filename, font1, variable_list, variable_styles
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from result_reader import ResultReader, parse_time_label
+
+TILE_SIZE = 256
+MAX_LATITUDE = 85.0511287798
+STORE_FOLDER = "store"
+# reduction of the cells below an overview cell, "mean" for the other variables
+OVERVIEW_REDUCTIONS = {"FS3D": "min", "PF": "max", "FVolume": "max"}
+
+
+def tile_range(extent, zoom):
+    """(x0, x1, y0, y1) tile numbers, inclusive, covering extent [xmin, xmax, ymin, ymax] at zoom"""
+    n = 2 ** zoom
+
+    def tile_x(lon):
+        return min(n - 1, max(0, int(math.floor((lon + 180.0) / 360.0 * n))))
+
+    def tile_y(lat):
+        lat = math.radians(min(MAX_LATITUDE, max(-MAX_LATITUDE, lat)))
+        return min(n - 1, max(0, int(math.floor((1.0 - math.asinh(math.tan(lat)) / math.pi) / 2.0 * n))))
+
+    return tile_x(extent[0]), tile_x(extent[1]), tile_y(extent[3]), tile_y(extent[2])
+
+
+def pixel_centres(x, y, zoom):
+    """Longitudes of the pixel columns and latitudes of the pixel rows of tile (x, y) at zoom"""
+    world = TILE_SIZE * 2 ** zoom
+    offsets = np.arange(TILE_SIZE) + 0.5
+    lon = (x * TILE_SIZE + offsets) / world * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * (y * TILE_SIZE + offsets) / world))))
+    return lon, lat
+
+
+def native_zoom(grid):
+    """First zoom whose pixels are not larger than a cell of grid"""
+    return max(0, int(math.ceil(math.log2(360.0 / (TILE_SIZE * grid.cellsize)))))
+
+
+def overview_zoom(grid):
+    """Deepest zoom at which the whole grid fits in one tile"""
+    width = grid.ncols * grid.cellsize
+    return max(0, int(math.floor(math.log2(360.0 / width))))
+
+
+def overview_level(grid, zoom):
+    """Overview level (0: the grid, k: cells 2**k times larger) sampled by the pixels of zoom"""
+    pixel = 360.0 / (TILE_SIZE * 2 ** zoom)
+    return max(0, int(math.floor(math.log2(pixel / grid.cellsize) + 1e-9)))
+
+
+def overview(frame, level, reduction):
+    """frame reduced by blocks of 2**level x 2**level cells, NaN where a block holds no data"""
+    if level == 0:
+        return frame
+    factor = 2 ** level
+    nrows, ncols = frame.shape
+    rows, cols = -(-nrows // factor), -(-ncols // factor)
+    padded = np.full((rows * factor, cols * factor), np.nan, dtype=np.float32)
+    padded[:nrows, :ncols] = frame
+    blocks = padded.reshape(rows, factor, cols, factor)
+    with warnings.catch_warnings():
+        # blocks outside the basin are all NaN
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        if reduction == "min":
+            return np.nanmin(blocks, axis=(1, 3))
+        if reduction == "max":
+            return np.nanmax(blocks, axis=(1, 3))
+        return np.nanmean(blocks, axis=(1, 3))
+
+
+def colorize(variable_tag, values):
+    """RGBA uint8 image of values with the colormap and norm of Plot_all.py, transparent for NaN"""
+    style = variable_styles[variable_tag]
+    if "norm" in style:
+        norm = style["norm"]
+    else:
+        norm = colors.Normalize(vmin=style["vmin"], vmax=style["vmax"])
+    cmap = style["cmap"]
+    if isinstance(cmap, str):
+        cmap = plt.get_cmap(cmap)
+    missing = np.isnan(values)
+    if variable_tag == "R":
+        # as load_matrix does for the JPGs, so dry cells get the lowest colour
+        values = np.where(values == 0, 0.000001, values)
+    rgba = cmap(norm(np.ma.masked_invalid(values)), bytes=True)
+    rgba[missing] = 0
+    return rgba
+
+
+def write_legend(variable_tag, path):
+    """Colorbar of a variable, the part of the JPGs the tiles leave out"""
+    style = variable_styles[variable_tag]
+    fig = plt.figure(figsize=(1.6, 4))
+    cbar_ax = fig.add_axes([0.15, 0.08, 0.2, 0.78])
+    if "norm" in style:
+        mappable = plt.cm.ScalarMappable(norm=style["norm"], cmap=style["cmap"])
+    else:
+        mappable = plt.cm.ScalarMappable(norm=colors.Normalize(vmin=style["vmin"], vmax=style["vmax"]),
+                                         cmap=style["cmap"])
+    cb = fig.colorbar(mappable, cax=cbar_ax, extend=style.get("extend", "neither"))
+    cbar_ax.tick_params(labelsize=11)
+    cbar_ax.set_title(style["cb_label"], fontdict=dict(font1, size=12), pad=10)
+    if "ticks" in style:
+        cb.set_ticks(style["ticks"])
+    if "ticklabels" in style:
+        cb.set_ticklabels(style["ticklabels"])
+    fig.savefig(path, dpi=150, transparent=True)
+    plt.close(fig)
+
+
+def link_tile(source, path):
+    """Put the stored tile source at path, as a hard link or else a copy"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.lexists(path):
+        os.remove(path)
+    try:
+        os.link(source, path)
+    except OSError:
+        shutil.copyfile(source, path)
+
+
+def store_tile(store_dir, rgba):
+    """Path of the stored PNG of a tile, encoding and writing it only when it is new"""
+    digest = hashlib.sha1(rgba.tobytes()).hexdigest()
+    path = os.path.join(store_dir, digest[:2], digest + ".png")
+    if os.path.exists(path):
+        return path, False
+    ok, png = cv2.imencode(".png", cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGRA))
+    if not ok:
+        raise RuntimeError("PNG encoding failed")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # workers may store the same tile at once: write aside, then rename
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "wb") as f:
+        f.write(png.tobytes())
+    os.replace(temp, path)
+    return path, True
+
+
+class TileRenderer:
+    """Render the tiles of one zoom of one step into the store and the step folder"""
+
+    def __init__(self, h5_path, out_dir):
+        self.reader = ResultReader(h5_path)
+        self.out_dir = out_dir
+        self.store_dir = os.path.join(out_dir, STORE_FOLDER)
+
+    def render(self, variable_tag, position, label, zoom):
+        """Returns (tiles linked, tiles newly stored, empty tiles skipped)"""
+        grid = self.reader.grid(variable_tag)
+        level = overview_level(grid, zoom)
+        values = overview(self.reader.frame(variable_tag, position), level,
+                          OVERVIEW_REDUCTIONS.get(variable_tag, "mean"))
+        cellsize = grid.cellsize * 2 ** level
+        top = grid.yllcorner + grid.nrows * grid.cellsize
+        step_dir = os.path.join(self.out_dir, variable_tag, label, str(zoom))
+
+        linked = stored = empty = 0
+        x0, x1, y0, y1 = tile_range(grid.extent, zoom)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                lon, lat = pixel_centres(x, y, zoom)
+                cols = np.floor((lon - grid.xllcorner) / cellsize).astype(int)
+                rows = np.floor((top - lat) / cellsize).astype(int)
+                col_in = (cols >= 0) & (cols < values.shape[1])
+                row_in = (rows >= 0) & (rows < values.shape[0])
+                if not col_in.any() or not row_in.any():
+                    empty += 1
+                    continue
+                tile = np.full((TILE_SIZE, TILE_SIZE), np.nan, dtype=np.float32)
+                tile[np.ix_(row_in, col_in)] = values[np.ix_(rows[row_in], cols[col_in])]
+                path = os.path.join(step_dir, str(x), f"{y}.png")
+                if np.isnan(tile).all():
+                    empty += 1
+                    if os.path.lexists(path):
+                        os.remove(path)
+                    continue
+                source, new = store_tile(self.store_dir, colorize(variable_tag, tile))
+                link_tile(source, path)
+                linked += 1
+                stored += new
+        return linked, stored, empty
+
+    def close(self):
+        self.reader.close()
+
+
+# renderer owned by each worker process of the pool
+_worker_renderer = None
+
+
+def _init_worker(h5_path, out_dir):
+    global _worker_renderer
+    _worker_renderer = TileRenderer(h5_path, out_dir)
+
+
+def _render_task(task):
+    return task[0], _worker_renderer.render(*task)
+
+
+def plan_tasks(reader, variables, start=None, end=None, min_zoom=None, max_zoom=None):
+    """
+    The (variable, position, label, zoom) levels to render and the tiles.json of every variable.
+
+    label is the date digits of the step, its folder name.
+    """
+    lo = parse_time_label(start)[0] if start is not None else None
+    hi = parse_time_label(end)[1] if end is not None else None
+    tasks, indexes = [], {}
+    for variable_tag in variables:
+        grid = reader.grid(variable_tag)
+        xmin, xmax, ymin, ymax = grid.extent
+        if xmin < -180 or xmax > 180 or ymin < -90 or ymax > 90:
+            raise ValueError(f"the grid of {variable_tag} is not in geographic degrees: {grid}")
+        zooms = (overview_zoom(grid) if min_zoom is None else min_zoom,
+                 native_zoom(grid) if max_zoom is None else max_zoom)
+        if zooms[0] > zooms[1]:
+            zooms = (zooms[1], zooms[1])
+        labels = []
+        for position, (when, digits) in enumerate(zip(reader.times(variable_tag), reader.time_digits(variable_tag))):
+            if (lo is not None and when < lo) or (hi is not None and when > hi):
+                continue
+            label = f"{int(digits)}"
+            labels.append(label)
+            tasks.extend((variable_tag, position, label, zoom) for zoom in range(zooms[0], zooms[1] + 1))
+        indexes[variable_tag] = {
+            "tilejson": "2.2.0",
+            "name": variable_tag,
+            "scheme": "xyz",
+            "tiles": ["{time}/{z}/{x}/{y}.png"],
+            "bounds": [xmin, ymin, xmax, ymax],
+            "center": [(xmin + xmax) / 2, (ymin + ymax) / 2, zooms[0]],
+            "minzoom": zooms[0],
+            "maxzoom": zooms[1],
+            "overview": OVERVIEW_REDUCTIONS.get(variable_tag, "mean"),
+            "legend": "legend.png",
+            "times": labels,
+        }
+    return tasks, indexes
+
+
+def export_tiles(h5_path, out_dir, tasks, workers=1):
+    """Render the tasks of plan_tasks; returns {variable: [linked, stored, empty]}"""
+    totals = {}
+
+    def add(variable_tag, counts):
+        total = totals.setdefault(variable_tag, [0, 0, 0])
+        for i, count in enumerate(counts):
+            total[i] += count
+
+    if workers <= 1:
+        renderer = TileRenderer(h5_path, out_dir)
+        try:
+            for task in tasks:
+                add(task[0], renderer.render(*task))
+        finally:
+            renderer.close()
+    else:
+        # the deep zooms have most tiles: start them first so no worker is
+        # left with one at the end
+        tasks = sorted(tasks, key=lambda task: -task[3])
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(h5_path, out_dir)) as pool:
+            for variable_tag, counts in pool.imap_unordered(_render_task, tasks):
+                add(variable_tag, counts)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the maps of Result_all.h5 as XYZ/PNG tile pyramids")
+    parser.add_argument("--result", default=filename, help="result file (default: ../Results/Result_all.h5)")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "Tiles"),
+                        help="folder of the tile pyramids (default: Tiles in this folder)")
+    parser.add_argument("--vars", nargs="+", default=None,
+                        help=f"variables to export (default: those of {variable_list} in the file)")
+    parser.add_argument("--start", help="first step to export, e.g. 2024-09-05 or 2024090512")
+    parser.add_argument("--end", help="last step to export, a day includes all its steps")
+    parser.add_argument("--min-zoom", type=int, help="lowest zoom (default: the grid fits in one tile)")
+    parser.add_argument("--max-zoom", type=int, help="deepest zoom (default: pixels not larger than a cell)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of rendering processes (default: 1, render in this process)")
+    args = parser.parse_args()
+
+    try:
+        with ResultReader(args.result) as reader:
+            variables = args.vars or [var for var in variable_list if var in reader]
+            unknown = [var for var in variables if var not in variable_styles or var not in reader]
+            if unknown:
+                print(f"Error: no plot style or no datasets for {unknown}; "
+                      f"available: {[var for var in variable_list if var in reader]}")
+                return 1
+            tasks, indexes = plan_tasks(reader, variables, args.start, args.end, args.min_zoom, args.max_zoom)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    if not tasks:
+        print("Error: no steps to export")
+        return 1
+
+    for variable_tag, index in indexes.items():
+        os.makedirs(os.path.join(args.output, variable_tag), exist_ok=True)
+        write_legend(variable_tag, os.path.join(args.output, variable_tag, index["legend"]))
+        print(f"{variable_tag}: {len(index['times'])} steps, zooms {index['minzoom']}-{index['maxzoom']}")
+
+    totals = export_tiles(args.result, args.output, tasks, workers=args.workers)
+
+    for variable_tag, index in indexes.items():
+        with open(os.path.join(args.output, variable_tag, "tiles.json"), "w") as f:
+            json.dump(index, f, indent=2)
+        linked, stored, empty = totals.get(variable_tag, [0, 0, 0])
+        share = 100.0 * stored / linked if linked else 0.0
+        print(f"{variable_tag}: {linked} tiles, {stored} stored ({share:.1f}%), {empty} empty tiles skipped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
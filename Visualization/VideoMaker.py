@@ -1,61 +1,97 @@
 
-
 # used to make the video
+# Frames are read and encoded one at a time, so only a single image is held
+# in memory per video; the variables can be encoded concurrently (--workers).
 
+import argparse
 import cv2
-import numpy as np
-import glob
+import multiprocessing
 import os
 
 # List of variable types to create videos for
 variable_types = ['R', 'W', 'SM', 'FS', 'PF', 'Volume']
 
-for var_type in variable_types:
-    print(f"Creating video for {var_type}...")
-    
-    # Set path to the specific variable directory
-    path = f'./{var_type}/'
-    
-    # Check if directory exists
-    if not os.path.exists(path):
-        print(f"Directory {path} does not exist, skipping {var_type}")
-        continue
-    
+VIDEO_FPS = 5
+VIDEO_FOURCC = 'DIVX'
+
+
+def frame_sort_key(name):
+    """Sort frames by the numeric part in the filename"""
+    return int("".join([i for i in name if i.isdigit()]))
+
+
+def open_video_writer(output_filename, size, fps=VIDEO_FPS):
+    """Create the video writer used for every variable; size is (width, height)"""
+    return cv2.VideoWriter(output_filename, cv2.VideoWriter_fourcc(*VIDEO_FOURCC), fps, size)
+
+
+def make_video(path, output_filename, fps=VIDEO_FPS):
+    """Encode the jpg frames of one directory, streaming them to the writer"""
     # Get list of jpg files in the directory
     file_list = [f for f in os.listdir(path) if f.endswith('.jpg')]
-    
+
     if not file_list:
-        print(f"No jpg files found in {path}, skipping {var_type}")
-        continue
-    
-    # Sort files by the numeric part in filename
-    file_list = sorted(file_list, key=lambda x: int("".join([i for i in x if i.isdigit()])))
-    
-    print(f"Found {len(file_list)} images for {var_type}")
-    
-    # Read first image to get dimensions
-    first_img = cv2.imread(path + file_list[0])
-    if first_img is None:
-        print(f"Could not read first image for {var_type}, skipping")
-        continue
-        
-    height, width, layers = first_img.shape
-    size = (width, height)
-    
-    # Create video writer
-    output_filename = f'{var_type}.avi'
-    out = cv2.VideoWriter(output_filename, cv2.VideoWriter_fourcc(*'DIVX'), 5, size)
-    
-    # Add all images to video
+        print(f"No jpg files found in {path}")
+        return False
+
+    file_list = sorted(file_list, key=frame_sort_key)
+    print(f"Found {len(file_list)} images in {path}")
+
+    out = None
     for filename in file_list:
-        print(f"Processing {filename}")
-        img = cv2.imread(path + filename)
-        if img is not None:
-            out.write(img)
-    
+        img = cv2.imread(os.path.join(path, filename))
+        if img is None:
+            print(f"Failed to read image: {os.path.join(path, filename)}")
+            continue
+        if out is None:
+            # the first readable image gives the dimensions
+            height, width, layers = img.shape
+            out = open_video_writer(output_filename, (width, height), fps)
+        out.write(img)
+
+    if out is None:
+        print(f"Could not read any image in {path}")
+        return False
+
     # Release video writer
     out.release()
     print(f"Video {output_filename} created successfully!")
+    return True
+
+
+def _make_video_task(task):
+    return make_video(*task)
+
+
+def make_videos(base_path, folders=variable_types, out_dir=None, fps=VIDEO_FPS, workers=1):
+    """Create one video per variable directory, several variables at a time"""
+    if out_dir is None:
+        out_dir = base_path
+    tasks = []
+    for var_type in folders:
+        path = os.path.join(base_path, var_type)
+        # Check if directory exists
+        if not os.path.exists(path):
+            print(f"Directory {path} does not exist, skipping {var_type}")
+            continue
+        tasks.append((path, os.path.join(out_dir, f'{var_type}.avi'), fps))
+
+    if workers <= 1 or len(tasks) <= 1:
+        return [make_video(*task) for task in tasks]
+    with multiprocessing.Pool(min(workers, len(tasks))) as pool:
+        return pool.map(_make_video_task, tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create one video per variable from the plotted jpg frames")
+    parser.add_argument("--path", default=".", help="directory holding the R, W, SM, FS, PF and Volume folders")
+    parser.add_argument("--fps", type=int, default=VIDEO_FPS, help="frames per second")
+    parser.add_argument("--workers", type=int, default=1, help="number of videos encoded at the same time")
+    args = parser.parse_args()
+
+    make_videos(args.path, fps=args.fps, workers=args.workers)
+    print("All videos created!")
 
-print("All videos created!")
 
+if __name__ == "__main__":
+    main()
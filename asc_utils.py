@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Helpers to read, edit and write ESRI ASCII grids (.asc) with NumPy.
+
+The six header lines (ncols, nrows, xllcorner, yllcorner, cellsize,
+NODATA_value) are parsed the same way the model's ReadASCFileHeader does:
+one "key value" pair per line, in that order. The data block is read as a
+flat stream of whitespace separated tokens, like Fortran list-directed
+input, so the line layout of the file does not matter.
+
+Edits work on the tokens: the numeric array is only used to decide which
+cells change, and every untouched cell is written back with exactly the
+text it had in the input file.
+"""
+
+import multiprocessing
+import os
+
+import numpy as np
+
+HEADER_KEYS = ["ncols", "nrows", "xllcorner", "yllcorner", "cellsize", "nodata_value"]
+
+
+class AscError(ValueError):
+    """Raised when a file is not a valid ASCII grid"""
+
+
+def parse_header(header_lines):
+    """Return the header as a dict with the lower case keys of HEADER_KEYS"""
+    if len(header_lines) < len(HEADER_KEYS):
+        raise AscError(f"expected {len(HEADER_KEYS)} header lines, found {len(header_lines)}")
+    header = {}
+    for expected, line in zip(HEADER_KEYS, header_lines):
+        fields = line.split()
+        if len(fields) < 2:
+            raise AscError(f"bad header line: {line!r}")
+        key = fields[0].decode() if isinstance(fields[0], bytes) else fields[0]
+        if key.lower() != expected:
+            raise AscError(f"header key {key!r} found where {expected!r} was expected")
+        header[expected] = float(fields[1])
+    header["ncols"] = int(header["ncols"])
+    header["nrows"] = int(header["nrows"])
+    return header
+
+
+def read_asc_tokens(path):
+    """
+    Read a grid as raw text tokens.
+
+    Returns (header_lines, header, tokens) where header_lines are the six
+    header lines as bytes and tokens is a (nrows, ncols) array of bytes.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    parts = raw.split(b'\n', len(HEADER_KEYS))
+    if len(parts) <= len(HEADER_KEYS):
+        raise AscError(f"{path}: file has less than {len(HEADER_KEYS)} lines (header expected)")
+    header_lines = [line.rstrip(b'\r') for line in parts[:len(HEADER_KEYS)]]
+    header = parse_header(header_lines)
+
+    tokens = parts[-1].split()
+    n = header["nrows"] * header["ncols"]
+    if len(tokens) < n:
+        raise AscError(f"{path}: {len(tokens)} values found, {n} expected")
+    tokens = np.array(tokens[:n], dtype=bytes).reshape(header["nrows"], header["ncols"])
+    return header_lines, header, tokens
+
+
+def tokens_to_array(tokens, dtype=np.float64):
+    """Convert a token array to numbers"""
+    try:
+        return tokens.astype(dtype)
+    except ValueError:
+        # "1.0d0" style exponents are valid for Fortran, not for NumPy
+        return np.char.replace(np.char.replace(tokens, b'd', b'e'), b'D', b'e').astype(dtype)
+
+
+def write_asc_tokens(path, header_lines, tokens):
+    """Write a grid from its header lines and a (nrows, ncols) token array"""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'\n'.join(header_lines) + b'\n')
+        for row in tokens:
+            f.write(b' '.join(row) + b'\n')
+
+
+def read_asc(path, dtype=np.float64):
+    """Read a grid, returning (header, data) with data shaped (nrows, ncols)"""
+    header_lines, header, tokens = read_asc_tokens(path)
+    return header, tokens_to_array(tokens, dtype)
+
+
+def format_header(header):
+    """Header lines of a grid written from scratch"""
+    return [
+        f"ncols         {header['ncols']}".encode(),
+        f"nrows         {header['nrows']}".encode(),
+        f"xllcorner     {header['xllcorner']!r}".encode(),
+        f"yllcorner     {header['yllcorner']!r}".encode(),
+        f"cellsize      {header['cellsize']!r}".encode(),
+        f"NODATA_value  {header['nodata_value']:g}".encode(),
+    ]
+
+
+def write_asc(path, header, data, fmt="%g"):
+    """Write a (nrows, ncols) array as a grid"""
+    data = np.asarray(data)
+    if data.shape != (header["nrows"], header["ncols"]):
+        raise AscError(f"data shape {data.shape} does not match the header "
+                       f"({header['nrows']}, {header['ncols']})")
+    tokens = np.char.mod(fmt, data).astype(bytes)
+    write_asc_tokens(path, format_header(header), tokens)
+
+
+def format_value(value):
+    """Token written for a replacement value (0 stays "0", not "0.0")"""
+    return f"{value:g}".encode()
+
+
+def set_tokens(tokens, mask, value):
+    """Replace the tokens selected by mask, widening the array if needed"""
+    token = format_value(value) if not isinstance(value, bytes) else value
+    if len(token) > tokens.dtype.itemsize:
+        tokens = tokens.astype(f"S{len(token)}")
+    tokens[mask] = token
+    return tokens
+
+
+def clamp_asc(input_path, output_path, lower=0.0, upper=None):
+    """
+    Clamp the valid cells of a grid to [lower, upper] and write the result.
+
+    NoData cells are left alone. Returns a dict with the number of cells,
+    NoData cells and cells raised/lowered, and the value range before
+    clamping, all taken from the single read of the file.
+    """
+    header_lines, header, tokens = read_asc_tokens(input_path)
+    values = tokens_to_array(tokens)
+    valid = values != header["nodata_value"]
+
+    below = valid & (values < lower)
+    tokens = set_tokens(tokens, below, lower)
+    above = np.zeros_like(valid)
+    if upper is not None:
+        above = valid & (values > upper)
+        tokens = set_tokens(tokens, above, upper)
+
+    write_asc_tokens(output_path, header_lines, tokens)
+
+    n_valid = int(np.count_nonzero(valid))
+    return {
+        "file": input_path,
+        "output": output_path,
+        "cells": int(values.size),
+        "nodata": int(values.size - n_valid),
+        "below": int(np.count_nonzero(below)),
+        "above": int(np.count_nonzero(above)),
+        "min": float(values[valid].min()) if n_valid else None,
+        "max": float(values[valid].max()) if n_valid else None,
+    }
+
+
+def _call(task):
+    func, args = task
+    try:
+        return func(*args)
+    except (OSError, ValueError) as e:
+        return {"file": args[0], "error": str(e)}
+
+
+def map_files(func, arg_list, workers=None):
+    """
+    Run func(*args) for every args tuple, over a process pool.
+
+    The first element of every args tuple is the file being processed; a
+    file that cannot be read or parsed gives {"file": ..., "error": ...}
+    instead of stopping the batch. Results come back in input order.
+    """
+    tasks = [(func, tuple(args)) for args in arg_list]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(tasks)))
+    if workers == 1:
+        return [_call(task) for task in tasks]
+    with multiprocessing.Pool(workers) as pool:
+        return pool.map(_call, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
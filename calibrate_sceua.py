@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+"""
+Calibrate model parameters with SCE-UA, running the simulations in parallel.
+
+RunStyle = cali_SCEUA evaluates one parameter set at a time inside the
+model. This script runs the Shuffled Complex Evolution (Duan et al., 1992)
+outside it: every parameter set is an isolated run directory prepared
+like run_ensemble.py does (the keys go to the parameter file that defines
+them, e.g. RainFact to Parameters_hydro.txt), and the runs of a batch share
+the cores through run_ensemble's scheduler. The concurrency follows the
+algorithm:
+
+    - the initial population (ngs complexes of 2n+1 points for n
+      parameters) is one batch,
+    - in each evolution step every complex makes one competitive complex
+      evolution step, and the reflections of all complexes are one batch,
+      then the contractions of the complexes that need one, then the
+      random points; the steps of one complex stay in order, so the
+      search is the same as the serial one with the same seed.
+
+With more cores than complexes, raise ngs: the evaluations per loop grow
+with ngs, the loops needed shrink.
+
+The score of a run is computed from <ResultPath>Outlet_<OutletName>_Results.csv
+(columns R and RObs, from WarmupDate on, skipping negative values like
+GetNSCE): NSCE, Bias (%) and CC, and the objective maximized is nsce
+(default, as in cali_SCEUA), cc or nsce_bias (NSCE - |Bias| / 100).
+
+Parameter vectors are rounded to --digits significant digits, the values
+written to the files, and every vector evaluated is kept in
+<output>/cache.jsonl with its scores: a vector seen before, in this
+calibration or an earlier one with the same fixed settings, is not
+simulated again. Running the command again with the same settings and
+seed therefore resumes an interrupted calibration.
+
+    <output>/cache.jsonl        parameters and scores of every simulated vector
+    <output>/evaluations.csv    every evaluation in order, with its loop
+    <output>/calibration.json   the best vector, its scores and the progress per loop
+    <output>/runs/<id>/         run directories, removed once scored unless --keep-runs
+
+The runs use RunStyle = simu and, unless set otherwise, ModelCore = Hydro
+and no grid outputs (GOVar_* = no), since only the outlet discharge is
+scored. Only parameters of the "Uniform" type are changed by their key;
+"Distributed" ones are read from their rasters.
+
+The parameters and settings come from a JSON file, from the command line
+or both:
+
+    {
+        "binary": "build/iHydroSlide3D",
+        "output": "Calibration",
+        "parameters": {"RainFact": [1, 8], "B": [0.1, 1.5], "coeM": [10, 150],
+                       "expM": [0.1, 0.9], "KS": [0.1, 0.9], "KI": [0.05, 0.9]},
+        "set": {"EndDate": 2024091023, "NHydroThread": 4, "NLandThread": 1},
+        "objective": "nsce",
+        "ngs": 4, "maxn": 2000, "kstop": 5, "pcento": 0.01
+    }
+
+ngs, maxn, kstop, pcento and iseed default to the values of
+Calibrations.txt in CalibPath when it exists.
+
+Usage:
+    python calibrate_sceua.py --spec calibration.json --cores 32
+    python calibrate_sceua.py --binary build/iHydroSlide3D --param RainFact=1,8 B=0.1,1.5 --ngs 4
+    python calibrate_sceua.py --spec calibration.json --write
+"""
+
+import argparse
+import csv
+import datetime
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import signal
+import sys
+
+import numpy as np
+
+from control_utils import get_float, get_int, get_str, parse_control, read_control, set_control_value
+from run_ensemble import PARAM_FILES, Run, prepare_run, schedule
+from tune_parallel import DATE_FORMATS
+
+OBJECTIVES = {
+    "nsce": lambda scores: scores["nsce"],
+    "cc": lambda scores: scores["cc"],
+    "nsce_bias": lambda scores: scores["nsce"] - abs(scores["bias"]) / 100.0,
+}
+SCE_DEFAULTS = {"ngs": 2, "maxn": 500, "kstop": 5, "pcento": 0.01, "peps": 0.001, "iseed": 1969}
+
+# a data line of Outlet_*_Results.csv: "2024- 9- 1  0: 0: 0,  values"
+_DATA_ROW = re.compile(r"^\s*(\d{4})-\s*(\d+)-\s*(\d+)\s+(\d+):\s*(\d+):\s*(\d+),(.*)$")
+# columns after DateTime: Rain, PET, EPot, EAct, W, SM, RS, RI, ExcS, ExcI, R, RObs
+_R_COLUMN, _ROBS_COLUMN = 10, 11
+
+
+def read_outlet(path, warmup=None):
+    """Simulated and observed discharge of an outlet file from warmup on, negative values left out"""
+    sim, obs = [], []
+    with open(path) as f:
+        for line in f:
+            match = _DATA_ROW.match(line)
+            if not match:
+                continue
+            values = match.group(7).split(",")
+            if len(values) <= _ROBS_COLUMN:
+                raise ValueError(f"no observed discharge (RObs) in {path}")
+            if warmup and datetime.datetime(*map(int, match.groups()[:6])) < warmup:
+                continue
+            r, robs = float(values[_R_COLUMN]), float(values[_ROBS_COLUMN])
+            if r < 0 or robs < 0:
+                continue
+            sim.append(r)
+            obs.append(robs)
+    if len(obs) < 2:
+        raise ValueError(f"fewer than 2 valid time steps in {path}")
+    return np.array(sim), np.array(obs)
+
+
+def scores_of(sim, obs):
+    """NSCE, Bias (%) and CC, as GetNSCE, GetBias and GetCC compute them"""
+    nsce = 1.0 - np.sum((obs - sim) ** 2) / np.sum((obs - obs.mean()) ** 2)
+    bias = (sim.sum() / obs.sum() - 1.0) * 100.0
+    cc = np.corrcoef(obs, sim)[0, 1]
+    return {"nsce": float(nsce), "bias": float(bias), "cc": float(cc)}
+
+
+class Evaluator:
+    """Scores of parameter vectors, from the cache or from batches of parallel runs"""
+
+    def __init__(self, names, binary, base_text, project_dir, settings, output_dir, cores,
+                 objective, outlet, warmup, digits, keep_runs):
+        self.names = names
+        self.binary = binary
+        self.base_text = base_text
+        self.project_dir = project_dir
+        self.settings = settings
+        self.output_dir = output_dir
+        self.cores = cores
+        self.objective = OBJECTIVES[objective]
+        self.outlet = outlet
+        self.warmup = warmup
+        self.digits = digits
+        self.keep_runs = keep_runs
+        self.cache = {}
+        self.simulated = 0
+        self.count = 0
+        self.loop = 0
+        self.cache_path = os.path.join(output_dir, "cache.jsonl")
+        self.log_path = os.path.join(output_dir, "evaluations.csv")
+        self._read_cache()
+        with open(self.log_path, "w", newline="") as f:
+            csv.writer(f).writerow(["Evaluation", "Loop"] + names + ["NSCE", "Bias", "CC", "Objective",
+                                                                   "Cached", "Error"])
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            # scores of other fixed settings (window, outlet, ...) do not apply
+            if (entry.get("settings") == self.settings and entry.get("outlet") == self.outlet
+                    and set(entry["params"]) == set(self.names)):
+                self.cache[tuple(entry["params"][name] for name in self.names)] = entry
+
+    def key(self, x):
+        """Values of a vector as written to the parameter files"""
+        return tuple(f"{value:.{self.digits}g}" for value in x)
+
+    def snap(self, points):
+        """Vectors rounded like key(), the points actually evaluated"""
+        return np.array([[float(value) for value in self.key(x)] for x in points])
+
+    def objective_of(self, entry):
+        """Value to minimize: minus the objective, +inf for failed runs"""
+        if entry.get("error"):
+            return math.inf
+        value = self.objective(entry["scores"])
+        return -value if np.isfinite(value) else math.inf
+
+    def _run_of(self, key):
+        run_id = hashlib.sha1("|".join(key).encode()).hexdigest()[:12]
+        settings = dict(self.settings, **dict(zip(self.names, key)))
+        return Run(run_id, settings, os.path.join(self.output_dir, "runs", run_id))
+
+    def _score(self, run):
+        status = run.read_status() or {}
+        if status.get("state") != "done":
+            return {"error": status.get("error") or "run did not finish"}
+        try:
+            sim, obs = read_outlet(os.path.join(run.directory, "Results", f"Outlet_{self.outlet}_Results.csv"),
+                                   self.warmup)
+        except (OSError, ValueError) as e:
+            return {"error": str(e)}
+        return {"scores": scores_of(sim, obs)}
+
+    def __call__(self, points):
+        """(vectors evaluated, values to minimize) of a batch of vectors"""
+        points = self.snap(points)
+        keys = [self.key(x) for x in points]
+        todo, runnable = [], []
+        for key in dict.fromkeys(keys):
+            if key in self.cache:
+                continue
+            run = self._run_of(key)
+            todo.append(run)
+            os.makedirs(run.directory, exist_ok=True)
+            # runs finished before an interruption are scored without running them again
+            if run.needs_run(retry_failed=True):
+                prepare_run(run, self.base_text, self.project_dir)
+                run.threads = min(run.threads, self.cores)
+                run.write_status("pending")
+                runnable.append(run)
+        if runnable:
+            schedule(runnable, self.binary, self.cores)
+        fresh = set()
+        with open(self.cache_path, "a") as f:
+            for run in todo:
+                key = tuple(run.settings[name] for name in self.names)
+                entry = dict(self._score(run), params=dict(zip(self.names, key)), settings=self.settings,
+                             outlet=self.outlet)
+                self.cache[key] = entry
+                fresh.add(key)
+                f.write(json.dumps(entry) + "\n")
+                if entry.get("error"):
+                    print(f"{run.name}: {entry['error']}")
+                elif not self.keep_runs:
+                    shutil.rmtree(run.directory, ignore_errors=True)
+        self.simulated += len(runnable)
+
+        values = np.array([self.objective_of(self.cache[key]) for key in keys])
+        with open(self.log_path, "a", newline="") as f:
+            writer = csv.writer(f)
+            for key in keys:
+                entry = self.cache[key]
+                scores = entry.get("scores", {})
+                self.count += 1
+                writer.writerow([self.count, self.loop] + list(key)
+                                + [scores.get(name, "") for name in ("nsce", "bias", "cc")]
+                                + ["" if entry.get("error") else self.objective(scores),
+                                   "no" if key in fresh else "yes", entry.get("error") or ""])
+                fresh.discard(key)
+        return points, values
+
+
+def select_subcomplex(rng, npg, nps):
+    """Positions of a sub-complex in a sorted complex, the better points more likely"""
+    chosen = [0]
+    while len(chosen) < nps:
+        lpos = int(npg + 0.5 - math.sqrt((npg + 0.5) ** 2 - npg * (npg + 1) * rng.random()))
+        if lpos not in chosen:
+            chosen.append(lpos)
+    return sorted(chosen)
+
+
+def random_point(rng, mean, std, bl, bu):
+    """A point drawn around mean with the spread of the population, inside the bounds"""
+    for _ in range(100):
+        x = mean + std * rng.standard_normal(mean.size)
+        if np.all((x >= bl) & (x <= bu)):
+            return x
+    return np.clip(x, bl, bu)
+
+
+def cce_step(complexes, rng, bl, bu, std, evaluate):
+    """
+    One competitive complex evolution step in every complex.
+
+    complexes is a list of [points, values] sorted by value. The new point
+    of each sub-complex is tried as reflection, then contraction, then a
+    random point, and the evaluations of every stage are one batch.
+    Returns the number of evaluations.
+    """
+    npg = complexes[0][0].shape[0]
+    nps = complexes[0][0].shape[1] + 1
+    subs = [select_subcomplex(rng, npg, nps) for _ in complexes]
+    worst, centroid, best, worst_value = [], [], [], []
+    for (points, values), sub in zip(complexes, subs):
+        s = points[sub]
+        worst.append(s[-1])
+        centroid.append(s[:-1].mean(axis=0))
+        best.append(s[0])
+        worst_value.append(values[sub[-1]])
+
+    new = []
+    for sw, ce, sb in zip(worst, centroid, best):
+        x = 2.0 * ce - sw
+        if np.any((x < bl) | (x > bu)):
+            x = random_point(rng, sb, std, bl, bu)
+        new.append(x)
+    new_points, new_values = evaluate(np.array(new))
+    new_points, new_values = list(new_points), list(new_values)
+    calls = len(new)
+
+    # contraction, then a random point, where the new point is worse than the worst one
+    for stage in ("contraction", "random"):
+        retry = [i for i, value in enumerate(new_values) if value > worst_value[i]]
+        if not retry:
+            break
+        if stage == "contraction":
+            trial = [centroid[i] - 0.5 * (centroid[i] - worst[i]) for i in retry]
+        else:
+            trial = [random_point(rng, best[i], std, bl, bu) for i in retry]
+        points, values = evaluate(np.array(trial))
+        calls += len(trial)
+        for i, x, value in zip(retry, points, values):
+            new_points[i], new_values[i] = x, value
+
+    for c, sub, x, value in zip(complexes, subs, new_points, new_values):
+        c[0][sub[-1]] = x
+        c[1][sub[-1]] = value
+        order = np.argsort(c[1], kind="stable")
+        c[0], c[1] = c[0][order], c[1][order]
+    return calls
+
+
+def sceua(evaluate, bl, bu, x0, ngs, maxn, kstop, pcento, peps, seed, progress):
+    """
+    Minimize evaluate over the box [bl, bu] with SCE-UA.
+
+    Returns (best point, best value, reason of the stop). progress is called
+    after every loop with (loop, points, values).
+    """
+    rng = np.random.default_rng(seed)
+    n = bl.size
+    npg, nspl = 2 * n + 1, 2 * n + 1
+    npt = ngs * npg
+    bound = bu - bl
+
+    points = bl + rng.random((npt, n)) * bound
+    if x0 is not None:
+        points[0] = x0
+    points, values = evaluate(points)
+    icall = npt
+    order = np.argsort(values, kind="stable")
+    points, values = points[order], values[order]
+    if not np.isfinite(values[0]):
+        raise RuntimeError("every run of the initial population failed")
+
+    loop = 0
+    progress(loop, points, values)
+    criteria = [values[0]]
+    while True:
+        spread = np.exp(np.mean(np.log(np.maximum(points.max(axis=0) - points.min(axis=0), 1e-300) / bound)))
+        if icall >= maxn:
+            return points[0], values[0], f"maximum of {maxn} evaluations reached"
+        if spread < peps:
+            return points[0], values[0], f"population converged (parameter range {spread:.3g} < {peps})"
+        if len(criteria) > kstop:
+            recent = criteria[-kstop - 1:]
+            change = abs(recent[0] - recent[-1]) / max(np.mean(np.abs(recent)), 1e-300)
+            if change < pcento:
+                return points[0], values[0], f"less than {100 * pcento:g}% improvement in {kstop} loops"
+
+        loop += 1
+        std = points.std(axis=0)
+        # complex k holds the points k, k + ngs, k + 2 ngs, ... of the sorted population
+        complexes = [[points[k::ngs].copy(), values[k::ngs].copy()] for k in range(ngs)]
+        for _ in range(nspl):
+            icall += cce_step(complexes, rng, bl, bu, std, evaluate)
+            if icall >= maxn:
+                break
+        points = np.concatenate([c[0] for c in complexes])
+        values = np.concatenate([c[1] for c in complexes])
+        order = np.argsort(values, kind="stable")
+        points, values = points[order], values[order]
+        criteria.append(values[0])
+        progress(loop, points, values)
+
+
+def _parse_assignments(items):
+    result = {}
+    for item in items or []:
+        if "=" not in item:
+            raise ValueError(f"expected KEY=VALUE, got {item!r}")
+        key, value = item.split("=", 1)
+        result[key.strip()] = value.strip()
+    return result
+
+
+def project_values(control, project_dir, names):
+    """Current values of the parameters in the project, and the parameter file defining each"""
+    param_dir = os.path.normpath(os.path.join(project_dir, get_str(control, "ParamPath", "./Params/")))
+    sources = {}
+    for name in PARAM_FILES:
+        path = os.path.join(param_dir, name)
+        if os.path.exists(path):
+            sources[path] = read_control(path)
+    values, files = {}, {}
+    for key in names:
+        for path, params in sources.items():
+            if key.upper() in params:
+                files[key] = path
+                values[key] = params[key.upper()]
+                if params.get(key.upper() + "TYPE", "").lower() == "distributed":
+                    print(f"Warning: {key} is Distributed in {path}, its value is not used by the model")
+                break
+        else:
+            values[key] = control.get(key.upper())
+    return values, files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate model parameters with SCE-UA and parallel runs")
+    parser.add_argument("--spec", help="JSON file describing the calibration")
+    parser.add_argument("--binary", help="model executable (default: from the spec)")
+    parser.add_argument("--control", help="control file of the project (default: Control.Project)")
+    parser.add_argument("--output", help="calibration directory (default: Calibration)")
+    parser.add_argument("--param", nargs="+", metavar="KEY=LOW,HIGH", help="parameter to calibrate and its range")
+    parser.add_argument("--set", nargs="+", metavar="KEY=VALUE", help="fixed setting of every run")
+    parser.add_argument("--cores", type=int, help="threads available to the runs (default: all cores)")
+    parser.add_argument("--objective", choices=sorted(OBJECTIVES), help="score to maximize (default: nsce)")
+    parser.add_argument("--outlet", help="outlet scored (default: OutletName)")
+    parser.add_argument("--ngs", type=int, help="number of complexes")
+    parser.add_argument("--maxn", type=int, help="maximum number of evaluations")
+    parser.add_argument("--kstop", type=int, help="loops over which the improvement is measured")
+    parser.add_argument("--pcento", type=float, help="stop below this relative improvement in kstop loops")
+    parser.add_argument("--peps", type=float, help="stop when the population spans less than this fraction")
+    parser.add_argument("--seed", type=int, help="random seed (default: iseed)")
+    parser.add_argument("--digits", type=int, default=6, help="significant digits of the parameters (default: 6)")
+    parser.add_argument("--keep-runs", action="store_true", help="keep the run directories")
+    parser.add_argument("--write", action="store_true", help="write the best parameters to the project files")
+    args = parser.parse_args()
+
+    spec = {}
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+    try:
+        parameters = {key: [float(v) for v in value.split(",")]
+                      for key, value in _parse_assignments(args.param).items()}
+        fixed = _parse_assignments(args.set)
+    except ValueError as e:
+        parser.error(str(e))
+    parameters = dict(spec.get("parameters", {}), **parameters)
+    if not parameters:
+        parser.error("give the parameters to calibrate with --param or in the spec")
+    for key, bounds in parameters.items():
+        if len(bounds) != 2 or not bounds[0] < bounds[1]:
+            parser.error(f"the range of {key} must be LOW,HIGH with LOW < HIGH")
+
+    spec_dir = os.path.dirname(os.path.abspath(args.spec)) if args.spec else os.getcwd()
+    control_path = args.control or os.path.join(spec_dir, spec.get("control", "Control.Project"))
+    output_dir = os.path.abspath(args.output or os.path.join(spec_dir, spec.get("output", "Calibration")))
+    binary = args.binary or (os.path.join(spec_dir, spec["binary"]) if "binary" in spec else None)
+    cores = args.cores or spec.get("cores") or os.cpu_count() or 1
+    if not binary:
+        parser.error("give the model executable with --binary or in the spec")
+    binary = os.path.abspath(binary)
+    if not os.access(binary, os.X_OK):
+        parser.error(f"{binary} is not an executable")
+
+    project_dir = os.path.dirname(os.path.abspath(control_path))
+    with open(control_path) as f:
+        base_text = f.read()
+    control = parse_control(base_text.splitlines())
+
+    # SCE-UA settings: command line, spec, Calibrations.txt of cali_SCEUA, defaults
+    calib_file = os.path.join(project_dir, get_str(control, "CalibPath", "./Calibs/"), "Calibrations.txt")
+    calib = read_control(calib_file) if os.path.exists(calib_file) else {}
+    sce = {}
+    for key, default in SCE_DEFAULTS.items():
+        value = getattr(args, "seed" if key == "iseed" else key)
+        if value is None:
+            value = spec.get(key)
+        if value is None:
+            value = (get_float if isinstance(default, float) else get_int)(calib, key, default)
+        sce[key] = value
+
+    settings = {"RunStyle": "simu", "ModelCore": "Hydro"}
+    settings.update({key: "no" for key in control if key.startswith("GOVAR_")})
+    settings.update({key: str(value) for key, value in spec.get("set", {}).items()})
+    settings.update(fixed)
+    run_control = parse_control(base_text.splitlines())
+    for key, value in settings.items():
+        run_control[key.upper()] = value
+    outlet = args.outlet or spec.get("outlet") or get_str(run_control, "OutletName", "")
+    if not outlet:
+        print("Error: no OutletName in the control file, give --outlet")
+        return 1
+    try:
+        mark = get_str(run_control, "TimeMark").lower()
+        warmup = datetime.datetime.strptime(get_str(run_control, "WarmupDate"), DATE_FORMATS[mark])
+    except (KeyError, ValueError):
+        warmup = None
+    objective = args.objective or spec.get("objective", "nsce")
+    if objective not in OBJECTIVES:
+        parser.error(f"objective must be one of {', '.join(sorted(OBJECTIVES))}")
+
+    names = list(parameters)
+    bl = np.array([parameters[key][0] for key in names])
+    bu = np.array([parameters[key][1] for key in names])
+    current, files = project_values(control, project_dir, names)
+    try:
+        x0 = np.array([float(current[key]) for key in names])
+        x0 = x0 if np.all((x0 >= bl) & (x0 <= bu)) else None
+    except (TypeError, ValueError):
+        x0 = None
+
+    os.makedirs(output_dir, exist_ok=True)
+    evaluate = Evaluator(names, binary, base_text, project_dir, settings, output_dir, cores, objective,
+                         outlet, warmup, args.digits, args.keep_runs)
+    print(f"SCE-UA of {len(names)} parameters with {sce['ngs']} complexes of {2 * len(names) + 1} points, "
+          f"at most {sce['maxn']} evaluations, {cores} cores, {len(evaluate.cache)} vectors in the cache")
+
+    history = []
+
+    def progress(loop, points, values):
+        best = -values[0] if np.isfinite(values[0]) else None
+        evaluate.loop = loop + 1
+        history.append({"loop": loop, "evaluations": evaluate.count, "simulated": evaluate.simulated,
+                        "best_objective": best})
+        print(f"Loop {loop}: {evaluate.count} evaluations ({evaluate.simulated} simulated), "
+              f"best {objective} {best if best is None else round(best, 5)}")
+
+    # a batch scheduler stops jobs with SIGTERM; handle it like Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        best_x, best_value, reason = sceua(evaluate, bl, bu, x0, sce["ngs"], sce["maxn"], sce["kstop"],
+                                           sce["pcento"], sce["peps"], sce["iseed"], progress)
+    except KeyboardInterrupt:
+        print("\nInterrupted; run again with the same settings to resume from the cache")
+        return 130
+    except RuntimeError as e:
+        print(f"Error: {e}, see the run.log files under {os.path.join(output_dir, 'runs')}")
+        return 1
+
+    key = evaluate.key(best_x)
+    entry = evaluate.cache[key]
+    best = dict(zip(names, key))
+    with open(os.path.join(output_dir, "calibration.json"), "w") as f:
+        json.dump({"best": best, "scores": entry["scores"], "objective": objective, "stop": reason,
+                   "evaluations": evaluate.count, "simulated": evaluate.simulated, "sce": sce,
+                   "parameters": parameters, "settings": settings, "loops": history}, f, indent=2)
+    print(f"Stopped: {reason}")
+    print("Best parameters: " + ", ".join(f"{name} = {value}" for name, value in best.items()))
+    print("NSCE = {nsce:.4f}, Bias = {bias:.2f}%, CC = {cc:.4f}".format(**entry["scores"]))
+
+    if args.write:
+        for path in sorted(set(files.values())):
+            shutil.copy2(path, path + ".bak")
+            with open(path) as f:
+                text = f.read()
+            for name, value in best.items():
+                if files.get(name) == path:
+                    text = set_control_value(text, name, value)
+            with open(path, "w") as f:
+                f.write(text)
+            print(f"Written the best parameters to {path} (previous one in {path}.bak)")
+        missing = [name for name in names if name not in files]
+        if missing:
+            print(f"Not written (not in a parameter file): {', '.join(missing)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
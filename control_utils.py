@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Read the model's "Key = Value" control files (Control.Project, Params/*.txt).
+
+Keys are matched without regard to case and the first occurrence wins,
+like XXWReadLineStr in CREST_Main_Pre.f90. Lines starting with '#' and
+text after a '#' are comments; double quotes around values are removed.
+"""
+
+import re
+
+
+def parse_control(lines):
+    """Return {KEY: value string} from the lines of a control file"""
+    control = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        key = key.strip().upper()
+        value = value.split("#", 1)[0].strip()
+        if value.startswith('"'):
+            value = value[1:].split('"', 1)[0]
+        elif value:
+            value = value.split()[0]
+        if key and key not in control:
+            control[key] = value
+    return control
+
+
+def read_control(path):
+    """Read a control file into {KEY: value string}"""
+    with open(path, 'r') as f:
+        return parse_control(f.readlines())
+
+
+def _get(control, key, default, convert):
+    value = control.get(key.upper())
+    if value is None or value == "":
+        if default is not None:
+            return default
+        raise KeyError(f"Key {key} not found in control file")
+    return convert(value)
+
+
+def get_str(control, key, default=None):
+    return _get(control, key, default, str)
+
+
+def get_int(control, key, default=None):
+    return _get(control, key, default, lambda value: int(float(value)))
+
+
+def get_float(control, key, default=None):
+    return _get(control, key, default, float)
+
+
+def get_bool(control, key, default=None):
+    return _get(control, key, default, lambda value: value.lower() in ("yes", "y", "true", "1"))
+
+
+def hydro_grid(control):
+    """Grid description of the hydrological domain"""
+    return {
+        "ncols": get_int(control, "NCols_Hydro"),
+        "nrows": get_int(control, "NRows_Hydro"),
+        "xllcorner": get_float(control, "XLLCorner_Hydro"),
+        "yllcorner": get_float(control, "YLLCorner_Hydro"),
+        "cellsize": get_float(control, "CellSize_Hydro"),
+        "nodata_value": get_float(control, "NoData_value", -9999.0),
+    }
+
+
+def land_grid(control):
+    """Grid description of the landslide domain"""
+    return {
+        "ncols": get_int(control, "NCols_Land"),
+        "nrows": get_int(control, "NRows_Land"),
+        "xllcorner": get_float(control, "XLLCorner_Land"),
+        "yllcorner": get_float(control, "YLLCorner_Land"),
+        "cellsize": get_float(control, "CellSize_Land"),
+        "nodata_value": get_float(control, "NoData_value", -9999.0),
+    }
+
+
+def set_control_value(text, key, value):
+    """
+    Return the text of a control file with the value of key replaced.
+
+    The layout of the line (spacing, trailing comment) is kept. A key that
+    is not present is appended at the end.
+    """
+    pattern = re.compile(r'^(\s*' + re.escape(key) + r'\s*=\s*)("[^"]*"|[^\s#]*)', re.IGNORECASE | re.MULTILINE)
+    if isinstance(value, str) and ("/" in value or "\\" in value or " " in value):
+        value = f'"{value}"'
+    new_text, count = pattern.subn(lambda m: m.group(1) + str(value), text, count=1)
+    if count == 0:
+        if new_text and not new_text.endswith("\n"):
+            new_text += "\n"
+        new_text += f"{key}\t=\t{value}\n"
+    return new_text
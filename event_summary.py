@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Per-cell event summaries of Result_all.h5 in one streaming pass.
+
+Every statistic is a running accumulator updated step by step on the
+stored grids (int32 value*100 with -9999 for NoData by default, or as set
+by the storage attributes of the datasets), so no variable is ever loaded
+whole:
+
+    VAR:min            smallest value              -> <VAR>_min
+    VAR:max            largest value               -> <VAR>_max
+    VAR:argmax         date of the largest value   -> <VAR>_peak_time
+    VAR:argmin         date of the smallest value  -> <VAR>_min_time
+    VAR:below:T        hours with value < T        -> <VAR>_hours_below_<T>
+    VAR:above:T        hours with value > T        -> <VAR>_hours_above_<T>
+
+The default set is the landslide event summary: FS3D:min, FS3D:below:1.0,
+PF:max, R:max and R:argmax.
+
+Work is split into blocks of rows. On files whose chunks cover whole
+frames (the per-step layout of Export_HDF5) a row block would still
+decompress every frame, so there the blocks are ranges of steps instead and
+the partial accumulators are merged; files from result_rechunk.py are
+split by rows along their chunks.
+
+Results go to a new file with the groups of the source, their
+georeferencing attributes, min/max in the source type and encoding (with
+its scale_factor, add_offset and NoData_Value attributes), hours as
+float32 and dates as float64 date digits (-9999 where a cell never had
+data).
+
+Usage:
+    python event_summary.py Results/Result_all.h5 -o Results/Event_summary.h5 --workers 8
+    python event_summary.py Results/Result_all.h5 --stat SM:max FS3D:below:1.2 --start 2024-09-05 --stop 2024-09-07
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+
+import h5py
+import numpy as np
+
+from result_reader import NODATA_VALUE, VALUE_FACTOR, ResultReader
+
+DEFAULT_STATS = ["FS3D:min", "FS3D:below:1.0", "PF:max", "R:max", "R:argmax"]
+
+
+def parse_stat(text):
+    """"FS3D:below:1.0" -> ("FS3D", "below", 1.0)"""
+    fields = text.split(":")
+    if len(fields) == 2 and fields[1] in ("min", "max", "argmin", "argmax"):
+        return fields[0], fields[1], None
+    if len(fields) == 3 and fields[1] in ("below", "above"):
+        return fields[0], fields[1], float(fields[2])
+    raise ValueError(f"bad statistic {text!r}, expected VAR:min|max|argmin|argmax or VAR:below|above:T")
+
+
+def output_name(var, kind, threshold):
+    if kind in ("below", "above"):
+        return f"{var}_hours_{kind}_{threshold:g}"
+    return {"min": f"{var}_min", "max": f"{var}_max",
+            "argmax": f"{var}_peak_time", "argmin": f"{var}_min_time"}[kind]
+
+
+class Accumulator:
+    """Running statistics of one variable over a block of rows"""
+
+    def __init__(self, stats, shape, data_encoding=(NODATA_VALUE, VALUE_FACTOR, 0.0), dtype=np.int32):
+        self.stats = stats
+        self.nodata_value, self.factor, self.offset = data_encoding
+        self.valid = np.zeros(shape, dtype=bool)
+        kinds = {kind for kind, _ in stats}
+        # extremes are kept on the stored values, exact for integer types
+        if np.issubdtype(dtype, np.integer):
+            self.work_dtype = np.int64
+            top, bottom = np.iinfo(np.int64).max, np.iinfo(np.int64).min
+        else:
+            self.work_dtype = np.float64
+            top, bottom = np.inf, -np.inf
+        self.low = np.full(shape, top, dtype=self.work_dtype) if kinds & {"min", "argmin"} else None
+        self.low_at = np.full(shape, -1) if "argmin" in kinds else None
+        self.high = np.full(shape, bottom, dtype=self.work_dtype) if kinds & {"max", "argmax"} else None
+        self.high_at = np.full(shape, -1) if "argmax" in kinds else None
+        self.counts = {(kind, t): np.zeros(shape, dtype=np.int32)
+                       for kind, t in stats if kind in ("below", "above")}
+
+    def update(self, raw, position):
+        valid = raw != self.nodata_value
+        self.valid |= valid
+        values = raw.astype(self.work_dtype)
+        if self.low is not None:
+            lower = valid & (values < self.low)
+            self.low[lower] = values[lower]
+            if self.low_at is not None:
+                self.low_at[lower] = position
+        if self.high is not None:
+            higher = valid & (values > self.high)
+            self.high[higher] = values[higher]
+            if self.high_at is not None:
+                self.high_at[higher] = position
+        if self.counts:
+            # compare decoded values so a threshold of 1.0 means FS < 1.0
+            decoded = raw / self.factor + self.offset
+        for (kind, t), count in self.counts.items():
+            count += valid & ((decoded < t) if kind == "below" else (decoded > t))
+
+    def merge(self, other, rows=None):
+        """
+        Fold in the accumulator of another block.
+
+        other covers rows (first, last+1) of this one (all rows if None) and
+        any range of steps; on equal extremes the earlier step wins, so the
+        order the blocks arrive in does not matter.
+        """
+        sel = np.s_[:] if rows is None else np.s_[rows[0]:rows[1]]
+        self.valid[sel] |= other.valid
+        if self.low is not None:
+            low = self.low[sel]
+            lower = other.low < low
+            if self.low_at is not None:
+                low_at = self.low_at[sel]
+                lower |= (other.low == low) & (other.low_at >= 0) & ((low_at < 0) | (other.low_at < low_at))
+                low_at[lower] = other.low_at[lower]
+            low[lower] = other.low[lower]
+        if self.high is not None:
+            high = self.high[sel]
+            higher = other.high > high
+            if self.high_at is not None:
+                high_at = self.high_at[sel]
+                higher |= (other.high == high) & (other.high_at >= 0) & ((high_at < 0) | (other.high_at < high_at))
+                high_at[higher] = other.high_at[higher]
+            high[higher] = other.high[higher]
+        for key, count in self.counts.items():
+            count[sel] += other.counts[key]
+
+
+def _summarize_block(task):
+    """Accumulate var over rows (first, last+1) and the given step positions"""
+    path, var, stats, rows, positions = task
+    with ResultReader(path, cache_size=0) as reader:
+        acc = Accumulator(stats, (rows[1] - rows[0], reader.grid(var).ncols),
+                          reader.encoding(var), reader.file[reader.entries(var)[0][1]].dtype)
+        for position in positions:
+            acc.update(reader.raw_frame(var, position, rows), position)
+    return var, rows, acc
+
+
+def plan_blocks(reader, var, positions, workers):
+    """Split var into (rows, positions) blocks along its storage chunks"""
+    nrows = reader.grid(var).nrows
+    chunk_rows = reader.chunk_rows(var)
+    if chunk_rows < nrows:
+        # rows of whole chunks, about four blocks per worker
+        n_chunks = -(-nrows // chunk_rows)
+        per_block = max(1, -(-n_chunks // (workers * 4)))
+        return [((r0, min(nrows, r0 + per_block * chunk_rows)), positions)
+                for r0 in range(0, nrows, per_block * chunk_rows)]
+    n_blocks = max(1, min(len(positions), workers * 4))
+    return [((0, nrows), list(block)) for block in np.array_split(positions, n_blocks) if len(block)]
+
+
+def step_hours(times):
+    """Length of one step in hours, from the spacing of the steps"""
+    if len(times) < 2:
+        return 1.0
+    deltas = np.diff([t.timestamp() for t in times]) / 3600.0
+    return float(np.median(deltas))
+
+
+def summarize(path, stat_specs, output, workers=1, start=None, stop=None, verbose=True):
+    """Compute the statistics of stat_specs and write them to output"""
+    by_var = {}
+    for var, kind, threshold in stat_specs:
+        by_var.setdefault(var, [])
+        if (kind, threshold) not in by_var[var]:
+            by_var[var].append((kind, threshold))
+
+    with ResultReader(path, cache_size=0) as reader:
+        missing = [var for var in by_var if var not in reader]
+        if missing:
+            raise KeyError(f"variables {missing} not in {path}; found {reader.variables}")
+        tasks = []
+        info = {}
+        for var, stats in by_var.items():
+            view = reader[var][start:stop]
+            if not view.positions:
+                raise ValueError(f"{var} has no steps between {start} and {stop}")
+            info[var] = {"group": reader.group_of(var), "grid": reader.grid(var),
+                         "encoding": reader.encoding(var), "dtype": reader.file[reader.entries(var)[0][1]].dtype,
+                         "storage": {key: value for key, value in reader.file[reader.entries(var)[0][1]].attrs.items()
+                                     if key in ("scale_factor", "add_offset", "NoData_Value")},
+                         "times": view.times, "digits": np.array(reader.time_digits(var)),
+                         "attrs": dict(reader.file[reader.group_of(var)].attrs)}
+            for rows, positions in plan_blocks(reader, var, view.positions, workers):
+                tasks.append((path, var, stats, rows, positions))
+
+    results = {}
+    if workers <= 1:
+        partials = map(_summarize_block, tasks)
+    else:
+        pool = multiprocessing.Pool(workers)
+        partials = pool.imap_unordered(_summarize_block, tasks)
+    try:
+        for var, rows, acc in partials:
+            if var not in results:
+                grid = info[var]["grid"]
+                results[var] = Accumulator(by_var[var], (grid.nrows, grid.ncols),
+                                           info[var]["encoding"], info[var]["dtype"])
+            results[var].merge(acc, rows)
+    finally:
+        if workers > 1:
+            pool.close()
+            pool.join()
+
+    with h5py.File(output, "w") as out:
+        for var, acc in results.items():
+            meta = info[var]
+            group = out.require_group(meta["group"] or "/")
+            for key, value in meta["attrs"].items():
+                group.attrs[key] = value
+            hours = step_hours(meta["times"])
+            for kind, threshold in by_var[var]:
+                name = output_name(var, kind, threshold)
+                data = _finish(acc, kind, threshold, hours, meta["digits"], meta["dtype"])
+                dset = group.create_dataset(name, data=data, compression="gzip", shuffle=True)
+                dset.attrs["Variable"] = var
+                dset.attrs["Statistic"] = kind if threshold is None else f"{kind} {threshold:g}"
+                dset.attrs["StartTime"] = meta["times"][0].strftime("%Y-%m-%d %H:%M:%S")
+                dset.attrs["EndTime"] = meta["times"][-1].strftime("%Y-%m-%d %H:%M:%S")
+                if kind in ("min", "max"):
+                    for key, value in meta["storage"].items():
+                        dset.attrs[key] = value
+                if verbose:
+                    nodata = meta["encoding"][0] if kind in ("min", "max") else NODATA_VALUE
+                    print(f"{group.name.rstrip('/')}/{name}: {data.dtype}, "
+                          f"{int(np.count_nonzero(data != nodata))} cells with data")
+    return output
+
+
+def _finish(acc, kind, threshold, hours, digits, dtype):
+    """Final raster of one statistic, NoData where the cell never had data"""
+    if kind == "min":
+        return np.where(acc.valid, acc.low, acc.nodata_value).astype(dtype)
+    if kind == "max":
+        return np.where(acc.valid, acc.high, acc.nodata_value).astype(dtype)
+    if kind in ("argmin", "argmax"):
+        at = acc.low_at if kind == "argmin" else acc.high_at
+        return np.where(acc.valid & (at >= 0), digits[np.maximum(at, 0)], NODATA_VALUE)
+    count = acc.counts[(kind, threshold)]
+    return np.where(acc.valid, count * np.float32(hours), NODATA_VALUE).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-cell event summaries of Result_all.h5")
+    parser.add_argument("source", help="result file (per-step or stacked layout)")
+    parser.add_argument("-o", "--output", help="summary file (default: Event_summary.h5 next to the source)")
+    parser.add_argument("--stat", nargs="+", default=DEFAULT_STATS,
+                        help=f"statistics VAR:KIND[:T] (default: {' '.join(DEFAULT_STATS)})")
+    parser.add_argument("--start", help="first time of the event, e.g. 2024-09-05")
+    parser.add_argument("--stop", help="last time of the event (inclusive)")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes (default: 1)")
+    args = parser.parse_args()
+
+    try:
+        specs = [parse_stat(text) for text in args.stat]
+    except ValueError as e:
+        parser.error(str(e))
+    output = args.output or os.path.join(os.path.dirname(args.source), "Event_summary.h5")
+    if os.path.abspath(output) == os.path.abspath(args.source):
+        parser.error("the output must not overwrite the source file")
+    try:
+        summarize(args.source, specs, output, workers=args.workers, start=args.start, stop=args.stop)
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Written {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,189 +1,146 @@
+#!/usr/bin/env python3
+"""
+Clamp negative values of the PET forcing files to 0.
+
+Every PETs/pet*.asc file is read once with asc_utils, its valid cells are
+clamped in bulk (NoData cells keep their NODATA_value) and the result is
+written to PETs_fixed/ with the same file name. Files are processed in
+parallel and the per-file counts come from that single read, so no
+verification pass over the output is needed.
+
+The script never prompts: pass --update-control to point PETPath of
+Control.Project at the fixed files.
+"""
+
+import argparse
+import glob
 import os
 import re
-import glob
-import shutil
 
-def fix_pet_file(input_filepath, output_filepath):
+from asc_utils import clamp_asc, map_files
+
+
+def fix_pet_file(input_filepath, output_filepath, lower=0.0, upper=None):
     """Fix negative values in a single PET file and save to new location"""
-    print(f"Processing {os.path.basename(input_filepath)}...")
-    
-    try:
-        # Read the original file
-        with open(input_filepath, 'r') as f:
-            lines = f.readlines()
-        
-        if len(lines) < 6:
-            print(f"  ⚠️ Warning: File has less than 6 lines (header expected)")
-            return False
-        
-        # Keep header (first 6 lines), process data lines
-        header = lines[:6]
-        data_lines = lines[6:]
-        
-        # Count negative values found
-        negative_count = 0
-        processed_lines = []
-        
-        for line_num, line in enumerate(data_lines, start=7):
-            original_line = line
-            # Replace any negative number (including scientific notation) with 0
-            # Pattern matches: -123, -123.456, -1.23e-4, -1.23E+5, etc.
-            processed_line = re.sub(r'-\d+\.?\d*([eE][-+]?\d+)?', '0', line)
-            
-            # Count how many negative values were replaced in this line
-            negative_count += len(re.findall(r'-\d+\.?\d*([eE][-+]?\d+)?', original_line))
-            processed_lines.append(processed_line)
-        
-        # Create output directory if it doesn't exist
-        os.makedirs(os.path.dirname(output_filepath), exist_ok=True)
-        
-        # Write to new file
-        with open(output_filepath, 'w') as f:
-            f.writelines(header + processed_lines)
-        
-        print(f"  ✅ Fixed {negative_count} negative values → {os.path.basename(output_filepath)}")
-        return True
-        
-    except Exception as e:
-        print(f"  ❌ Error processing file: {e}")
-        return False
+    return clamp_asc(input_filepath, output_filepath, lower=lower, upper=upper)
 
-def verify_no_negatives(filepath):
-    """Verify that no negative values remain in the file"""
-    try:
-        with open(filepath, 'r') as f:
-            content = f.read()
-        
-        # Skip header lines and check for negative numbers in data
-        lines = content.split('\n')
-        data_content = '\n'.join(lines[6:])  # Skip first 6 header lines
-        
-        negative_matches = re.findall(r'-\d+\.?\d*([eE][-+]?\d+)?', data_content)
-        return len(negative_matches) == 0
-    except:
-        return False
 
-def update_control_project(old_path, new_path):
+def update_control_project(old_path, new_path, control_file="Control.Project"):
     """Update the Control.Project file to use the new PETs folder"""
-    control_file = "Control.Project"
-    
     if not os.path.exists(control_file):
         print(f"⚠️ {control_file} not found. You'll need to manually update the PETPath.")
         return False
-    
+
     try:
         # Read the control file
         with open(control_file, 'r') as f:
             content = f.read()
-        
+
         # Update PETPath
         updated_content = re.sub(
             r'PETPath\s*=\s*"[^"]*"',
             f'PETPath\t\t=\t"./{new_path}/pet"',
             content
         )
-        
+
         # Write back to file
         with open(control_file, 'w') as f:
             f.write(updated_content)
-        
+
         print(f"✅ Updated {control_file}: PETPath changed to './{new_path}/pet'")
         return True
-        
+
     except Exception as e:
         print(f"❌ Error updating {control_file}: {e}")
         return False
 
+
+def print_report(result):
+    """One line per file with the counts returned by clamp_asc"""
+    name = os.path.basename(result["file"])
+    if "error" in result:
+        print(f"  ❌ {name}: {result['error']}")
+        return
+    line = f"  ✅ {name}: fixed {result['below']} negative values"
+    if result["above"]:
+        line += f", {result['above']} values above the upper limit"
+    line += f" ({result['nodata']} NoData cells kept"
+    if result["min"] is not None:
+        line += f", original range {result['min']:g} .. {result['max']:g}"
+    print(line + ")")
+
+
 def main():
-    # Directory names
-    original_pets_dir = "PETs"
-    new_pets_dir = "PETs_fixed"
-    
+    parser = argparse.ArgumentParser(description="Clamp negative values of the PET .asc files")
+    parser.add_argument("--input", default="PETs", help="directory with the original PET files")
+    parser.add_argument("--output", default="PETs_fixed", help="directory for the fixed files")
+    parser.add_argument("--pattern", default="pet*.asc", help="file name pattern of the PET files")
+    parser.add_argument("--min", type=float, default=0.0, dest="lower",
+                        help="lower limit of valid cells (default: 0)")
+    parser.add_argument("--max", type=float, default=None, dest="upper",
+                        help="optional upper limit of valid cells")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of processes (default: all cores)")
+    parser.add_argument("--update-control", action="store_true",
+                        help="point PETPath of the control file at the fixed files")
+    parser.add_argument("--control", default="Control.Project", help="control file to update")
+    args = parser.parse_args()
+
+    original_pets_dir = args.input
+    new_pets_dir = args.output
+
     # Check if original PETs directory exists
     if not os.path.exists(original_pets_dir):
         print(f"❌ Directory '{original_pets_dir}' not found!")
         print("Please make sure you're running this script from the correct directory.")
-        return
-    
+        return 1
+
     # Find all PET files in original directory
-    pet_pattern = os.path.join(original_pets_dir, "pet*.asc")
-    pet_files = glob.glob(pet_pattern)
-    
+    pet_pattern = os.path.join(original_pets_dir, args.pattern)
+    pet_files = sorted(glob.glob(pet_pattern))
+
     if not pet_files:
         print(f"❌ No PET files found in '{original_pets_dir}' directory")
         print(f"Looking for pattern: {pet_pattern}")
-        return
-    
+        return 1
+
     print(f"🔍 Found {len(pet_files)} PET files in '{original_pets_dir}'")
-    print(f"📁 Creating new directory: '{new_pets_dir}'")
-    print(f"📋 Original files will be preserved in '{original_pets_dir}'")
+    print(f"📁 Writing fixed files to '{new_pets_dir}'")
     print("=" * 60)
-    
-    # Create new directory
+
     os.makedirs(new_pets_dir, exist_ok=True)
-    
-    success_count = 0
-    
-    # Process each file
-    for pet_file in sorted(pet_files):
-        # Create corresponding output file path
-        filename = os.path.basename(pet_file)
-        output_file = os.path.join(new_pets_dir, filename)
-        
-        if fix_pet_file(pet_file, output_file):
-            success_count += 1
-        print()  # Empty line for readability
-    
+    tasks = [(pet_file, os.path.join(new_pets_dir, os.path.basename(pet_file)), args.lower, args.upper)
+             for pet_file in pet_files]
+    results = map_files(fix_pet_file, tasks, workers=args.workers)
+    for result in results:
+        print_report(result)
+
+    failed = [result for result in results if "error" in result]
+    success_count = len(results) - len(failed)
     print("=" * 60)
     print(f"📊 Processing Summary:")
     print(f"   Original directory: {original_pets_dir} (preserved)")
     print(f"   New directory: {new_pets_dir}")
     print(f"   Total files found: {len(pet_files)}")
     print(f"   Successfully processed: {success_count}")
-    print(f"   Failed: {len(pet_files) - success_count}")
-    
-    if success_count > 0:
-        # Verify results in new directory
-        print(f"\n🔍 Verification of new files:")
-        new_pet_files = glob.glob(os.path.join(new_pets_dir, "pet*.asc"))
-        all_clean = True
-        
-        for pet_file in new_pet_files:
-            if verify_no_negatives(pet_file):
-                print(f"   ✅ {os.path.basename(pet_file)} - No negative values")
-            else:
-                print(f"   ❌ {os.path.basename(pet_file)} - Still has negative values!")
-                all_clean = False
-        
-        if all_clean:
-            print(f"\n🎉 SUCCESS! All PET files have been cleaned of negative values!")
-            print(f"📁 Original files preserved in: {original_pets_dir}")
-            print(f"📁 Fixed files created in: {new_pets_dir}")
-            
-            # Ask user if they want to update Control.Project
-            print(f"\n🔧 Would you like to update Control.Project to use the new PET files?")
-            response = input("Type 'yes' to update automatically, or 'no' to update manually: ").lower().strip()
-            
-            if response in ['yes', 'y']:
-                if update_control_project(original_pets_dir, new_pets_dir):
-                    print(f"\n🚀 Ready to run! Execute: ./iHydroSlide3D")
-                else:
-                    print(f"\n⚠️ Please manually update Control.Project:")
-                    print(f"   Change: PETPath = \"./{original_pets_dir}/pet\"")
-                    print(f"      To: PETPath = \"./{new_pets_dir}/pet\"")
-            else:
-                print(f"\n📝 Manual update required in Control.Project:")
-                print(f"   Change: PETPath = \"./{original_pets_dir}/pet\"")
-                print(f"      To: PETPath = \"./{new_pets_dir}/pet\"")
-        else:
-            print(f"\n⚠️ Some files still contain negative values. Please check manually.")
-    
-    # Show directory structure
-    print(f"\n📂 Directory Structure:")
-    print(f"   {original_pets_dir}/     ← Original PET files (preserved)")
-    print(f"   {new_pets_dir}/     ← Fixed PET files (no negative values)")
+    print(f"   Failed: {len(failed)}")
+    print(f"   Negative values fixed: {sum(result['below'] for result in results if 'error' not in result)}")
+
+    if failed:
+        print(f"\n⚠️ Some files could not be processed, Control.Project was not changed.")
+        return 1
+
+    if args.update_control:
+        if not update_control_project(original_pets_dir, new_pets_dir, args.control):
+            return 1
+    else:
+        print(f"\n📝 To use the fixed files, run with --update-control or change Control.Project:")
+        print(f"   Change: PETPath = \"./{original_pets_dir}/pet\"")
+        print(f"      To: PETPath = \"./{new_pets_dir}/pet\"")
+    return 0
+
 
 if __name__ == "__main__":
     print("🚀 PET Files Negative Value Fixer (Preserve Original)")
     print("=" * 60)
-    main()
\ No newline at end of file
+    raise SystemExit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Resample result grids between the hydrological and the landslide domain.
+
+The model moves grids between domains with GetBfromA/GetBfromA_Int
+(ReadAndWriteMatrix.f90): a target cell takes the value of the source
+cell holding its centre, with the row and column truncated towards zero
+as the Fortran integer assignment does. GridMap computes that mapping
+once from the NCols/NRows/XLLCorner/YLLCorner/CellSize of the two grids
+and applies it to whole (time, row, col) stacks with NumPy indexing:
+
+    from grid_resample import GridMap
+    from result_reader import ResultReader
+
+    with ResultReader("Results/Result_all.h5") as reader:
+        mapping = GridMap.from_reader(reader)              # Hydrology <-> Landslide
+        sm = mapping.to_fine(reader['SM']['2024-09-05'].to_array())
+        fs = reader['FS3D']['2024-09-05'].to_array()       # same steps, same shape as sm
+        unstable = mapping.to_coarse(fs, "unstable")       # share of FS3D < 1 per hydro cell
+        worst = mapping.to_coarse(reader['PF'][0], "max")
+
+to_fine is GetBfromA from the coarse to the fine grid; to_coarse groups the
+fine cells by the coarse cell that holds their centre, the cells to_fine
+fills from it, and reduces each group to its mean, min, max or the
+fraction of cells below a threshold ("unstable", FS3D < 1 by default).
+Fine cells with NaN (or the nodata value given) are left out; coarse cells
+without any valid fine cell are NaN.
+
+The row of a target cell only depends on its row and the column only on
+its column, so a mapping is two index vectors per direction, computed in
+microseconds; they are kept per pair of grids for the life of the process
+rather than written to disk. The groups of fine rows and columns of one
+coarse cell are contiguous, so the reductions combine strided slices along
+the two axes, without any loop over cells or steps.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from result_reader import Grid
+
+REDUCTIONS = ["mean", "min", "max", "unstable"]
+
+
+def _grid_key(grid):
+    return (grid.ncols, grid.nrows, grid.xllcorner, grid.yllcorner, grid.cellsize)
+
+
+@lru_cache(maxsize=16)
+def _index_map(source, target):
+    """
+    Source row of every target row and source column of every target column, -1 outside.
+
+    source and target are _grid_key tuples; the arithmetic is the one of
+    GetBfromA, in double precision and in the same order.
+    """
+    sncols, snrows, sxll, syll, scell = source
+    tncols, tnrows, txll, tyll, tcell = target
+    centre_y = tyll + (tnrows - np.arange(tnrows) - 0.5) * tcell
+    rows = np.trunc((syll + snrows * scell - centre_y) / scell)
+    centre_x = txll + (np.arange(tncols) + 0.5) * tcell
+    cols = np.trunc((centre_x - sxll) / scell)
+    rows = np.where((rows >= 0) & (rows < snrows), rows, -1).astype(np.intp)
+    cols = np.where((cols >= 0) & (cols < sncols), cols, -1).astype(np.intp)
+    rows.setflags(write=False)
+    cols.setflags(write=False)
+    return rows, cols
+
+
+def index_map(source, target):
+    """(rows, cols) of the source cells GetBfromA reads for the target grid, see _index_map"""
+    return _index_map(_grid_key(source), _grid_key(target))
+
+
+def _segments(index):
+    """
+    Groups of a monotone index vector: (first, last+1) of its valid part,
+    and the start, length and value of every group within that part.
+    """
+    valid = np.flatnonzero(index >= 0)
+    if valid.size == 0:
+        empty = np.zeros(0, dtype=np.intp)
+        return (0, 0), empty, empty, empty
+    first, last = valid[0], valid[-1] + 1
+    part = index[first:last]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(part)) + 1))
+    widths = np.diff(np.append(starts, part.size))
+    return (first, last), starts, widths, part[starts]
+
+
+def _reduce_groups(ufunc, data, starts, widths, axis, identity):
+    """
+    ufunc reduction of the groups of data along axis (-2 or -1).
+
+    The k-th cells of all groups are combined at once, as strided slices
+    when the groups have one length (an integer ratio of the cell sizes)
+    and with take otherwise; this is several times faster than
+    ufunc.reduceat along the rows.
+    """
+    def along(index):
+        return (Ellipsis, index, slice(None)) if axis == -2 else (Ellipsis, index)
+
+    if starts.size == 0:
+        shape = list(data.shape)
+        shape[axis] = 0
+        return np.zeros(shape, dtype=data.dtype)
+    width = int(widths.max())
+    if np.all(widths == width):
+        out = data[along(slice(0, None, width))].copy()
+        for k in range(1, width):
+            ufunc(out, data[along(slice(k, None, width))], out=out)
+        return out
+    out = data.take(starts, axis=axis)
+    for k in range(1, width):
+        part = data.take(np.minimum(starts + k, data.shape[axis] - 1), axis=axis)
+        # groups shorter than k + 1 cells take the identity instead
+        short = widths <= k
+        part[along(short)] = identity
+        ufunc(out, part, out=out)
+    return out
+
+
+class GridMap:
+    """Mapping between a coarse grid and a fine grid covering the same area"""
+
+    def __init__(self, coarse, fine):
+        self.coarse = coarse
+        self.fine = fine
+        # coarse cell of every fine cell, as to_fine reads it
+        self.rows, self.cols = index_map(coarse, fine)
+        if np.any(np.diff(self.rows[self.rows >= 0]) < 0) or np.any(np.diff(self.cols[self.cols >= 0]) < 0):
+            raise ValueError(f"{fine} is not a refinement of {coarse}")
+        self._row_groups = _segments(self.rows)
+        self._col_groups = _segments(self.cols)
+
+    @classmethod
+    def from_reader(cls, reader, coarse="Hydrology", fine="Landslide"):
+        """GridMap between two groups of a ResultReader"""
+        return cls(reader.group_grid(coarse), reader.group_grid(fine))
+
+    @classmethod
+    def from_headers(cls, coarse, fine):
+        """GridMap between two ASC grids, from their read_asc headers"""
+        return cls(*(Grid(h["ncols"], h["nrows"], h["xllcorner"], h["yllcorner"], h["cellsize"], h["nodata_value"])
+                     for h in (coarse, fine)))
+
+    def to_fine(self, values, fill=np.nan):
+        """
+        Coarse values (..., nrows, ncols) on the fine grid, as GetBfromA does it.
+
+        Fine cells outside the coarse grid get fill; integer grids (soil
+        classes, masks) need an integer fill, e.g. NODATA_VALUE.
+        """
+        values = np.asarray(values)
+        if values.shape[-2:] != (self.coarse.nrows, self.coarse.ncols):
+            raise ValueError(f"expected (..., {self.coarse.nrows}, {self.coarse.ncols}), got {values.shape}")
+        out = values.take(np.maximum(self.rows, 0), axis=-2).take(np.maximum(self.cols, 0), axis=-1)
+        if np.any(self.rows < 0) or np.any(self.cols < 0):
+            if out.dtype.kind != "f" and np.isnan(fill):
+                out = out.astype(np.float32)
+            out[..., self.rows < 0, :] = fill
+            out[..., :, self.cols < 0] = fill
+        return out
+
+    def to_coarse(self, values, how="mean", threshold=1.0, nodata=None):
+        """
+        Fine values (..., nrows, ncols) reduced to the coarse grid.
+
+        how is one of REDUCTIONS; "unstable" is the fraction of the valid
+        fine cells below threshold. Cells that are NaN or equal to nodata
+        are left out. Returns float32 (float64 for float64 input), NaN
+        where a coarse cell has no valid fine cell.
+        """
+        if how not in REDUCTIONS:
+            raise ValueError(f"unknown reduction {how!r}, expected one of {REDUCTIONS}")
+        values = np.asarray(values)
+        if values.shape[-2:] != (self.fine.nrows, self.fine.ncols):
+            raise ValueError(f"expected (..., {self.fine.nrows}, {self.fine.ncols}), got {values.shape}")
+        dtype = np.float64 if values.dtype == np.float64 else np.float32
+        (r0, r1), row_starts, row_widths, coarse_rows = self._row_groups
+        (c0, c1), col_starts, col_widths, coarse_cols = self._col_groups
+        part = values[..., r0:r1, c0:c1]
+        missing = np.isnan(part) if part.dtype.kind == "f" else np.zeros(part.shape, dtype=bool)
+        if nodata is not None:
+            missing |= part == nodata
+
+        def reduce(ufunc, data, identity=0):
+            rows = _reduce_groups(ufunc, data, row_starts, row_widths, -2, identity)
+            return _reduce_groups(ufunc, rows, col_starts, col_widths, -1, identity)
+
+        counts = reduce(np.add, (~missing).astype(np.int32))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if how == "mean":
+                reduced = reduce(np.add, np.where(missing, 0, part).astype(np.float64)) / counts
+            elif how == "unstable":
+                reduced = reduce(np.add, (~missing & (part < threshold)).astype(np.int32)) / counts
+            else:
+                fill = np.inf if how == "min" else -np.inf
+                reduced = reduce(np.minimum if how == "min" else np.maximum,
+                                 np.where(missing, fill, part).astype(dtype), fill)
+        reduced = reduced.astype(dtype, copy=False)
+        reduced[counts == 0] = np.nan
+
+        out = np.full(values.shape[:-2] + (self.coarse.nrows, self.coarse.ncols), np.nan, dtype=dtype)
+        out[..., coarse_rows[:, None], coarse_cols[None, :]] = reduced
+        return out
+
+    def __repr__(self):
+        return f"GridMap(coarse={self.coarse}, fine={self.fine})"
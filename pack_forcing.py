@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Pack the Rain and PET ASC series into time-indexed HDF5 cubes.
+
+For RainPath = "./Rains/rain" every ./Rains/rain<date>.asc (or .txt) file
+becomes one step of ./Rains/rain.h5:
+
+    Data   (NTimes, NRows, NCols)  values of the ASC files, one chunk per step,
+                                   gzip+shuffle compressed; attributes NCols,
+                                   NRows, XLLCorner, YLLCorner, CellSize and
+                                   NoData_Value from the ASC header
+    Time   (NTimes,)               the <date> digits of each file as float64,
+                                   in increasing order
+
+Setting RainFormat = hdf5 (PETFormat = hdf5) in Control.Project makes the
+model read one hyperslab of the cube per step instead of parsing a text
+file. Steps missing from the cube are handled like missing ASC files.
+
+With --mask only the cells of the mask grid (those that are not NoData,
+e.g. the basin mask of HydroBasicPath) are stored, the layout of
+PackedCells = yes (see packed_grid.py):
+
+    Data   (NTimes, NCells)        the cells of each step, row by row
+    Mask   (NRows, NCols)          1 for the stored cells, 0 elsewhere
+
+and the model reads the others as NoData, so the mask must cover the basin.
+
+The headers are checked against NCols_Hydro/NRows_Hydro/CellSize_Hydro of
+the control file; files are parsed in parallel and written in time order.
+
+Usage:
+    python pack_forcing.py --control Control.Project --kind rain pet --workers 8
+    python pack_forcing.py --kind rain --mask HydroBasics/mask.asc
+"""
+
+import argparse
+import glob
+import math
+import multiprocessing
+import os
+import sys
+
+import h5py
+import numpy as np
+
+from asc_utils import read_asc
+from control_utils import get_str, hydro_grid, read_control
+from packed_grid import PackedGrid
+
+FORCING_KEYS = {"rain": "RainPath", "pet": "PETPath"}
+
+
+def list_series(prefix):
+    """[(date digits, path)] of the files <prefix><digits>.asc/.txt, sorted by date"""
+    series = {}
+    for ext in (".txt", ".asc"):
+        for path in glob.glob(glob.escape(prefix) + "*" + ext):
+            digits = os.path.basename(path)[len(os.path.basename(prefix)):-len(ext)]
+            if digits.isdigit():
+                # an .asc file is preferred over a .txt one, as in ReadMatrixFile
+                series[digits] = path
+    return sorted(series.items(), key=lambda item: int(item[0]))
+
+
+def check_header(header, grid):
+    """Return the reasons a header does not match the model grid"""
+    problems = []
+    if header["ncols"] != grid["ncols"]:
+        problems.append(f"ncols {header['ncols']} != NCols_Hydro {grid['ncols']}")
+    if header["nrows"] != grid["nrows"]:
+        problems.append(f"nrows {header['nrows']} != NRows_Hydro {grid['nrows']}")
+    if not math.isclose(header["cellsize"], grid["cellsize"], rel_tol=1e-6):
+        problems.append(f"cellsize {header['cellsize']} != CellSize_Hydro {grid['cellsize']}")
+    return problems
+
+
+def _read_frame(task):
+    path, dtype = task
+    try:
+        header, data = read_asc(path)
+    except (OSError, ValueError) as e:
+        return path, None, str(e)
+    return path, header, data.astype(dtype)
+
+
+def read_mask(path, grid):
+    """PackedGrid of the cells of an ASC grid that are not NoData"""
+    header, data = read_asc(path)
+    problems = check_header(header, grid)
+    if problems:
+        raise ValueError(f"{path}: " + "; ".join(problems))
+    return PackedGrid(data != header["nodata_value"])
+
+
+def pack_series(prefix, output, grid, workers=None, dtype=np.float32, compression_level=4, packing=None):
+    """
+    Write the series of prefix into the cube output, only the cells of packing when given.
+
+    Returns the number of steps written. Raises ValueError listing every
+    file whose header does not match the grid or that cannot be read; the
+    cube is then removed.
+    """
+    series = list_series(prefix)
+    if not series:
+        raise ValueError(f"no files found for {prefix}*.asc")
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(series)))
+    tasks = [(path, dtype) for _, path in series]
+
+    if packing is None:
+        shape = (len(series), grid["nrows"], grid["ncols"])
+    else:
+        shape = (len(series), packing.ncells)
+    errors = []
+    first_header = None
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        frames = pool.imap(_read_frame, tasks, chunksize=4) if pool else map(_read_frame, tasks)
+        with h5py.File(output, "w") as f:
+            dset = f.create_dataset("Data", shape=shape, dtype=dtype, chunks=(1,) + shape[1:],
+                                    compression="gzip", compression_opts=compression_level,
+                                    shuffle=True)
+            f.create_dataset("Time", data=np.array([float(digits) for digits, _ in series]))
+            if packing is not None:
+                f.create_dataset("Mask", data=packing.mask.astype(np.int32), compression="gzip", shuffle=True)
+            for k, (path, header, data) in enumerate(frames):
+                if header is None:
+                    errors.append(f"{path}: {data}")
+                    continue
+                problems = check_header(header, grid)
+                if problems:
+                    errors.append(f"{path}: " + "; ".join(problems))
+                    continue
+                if first_header is None:
+                    first_header = header
+                dset[k] = data if packing is None else packing.gather(data)
+            if first_header is not None:
+                dset.attrs["NCols"] = np.int32(first_header["ncols"])
+                dset.attrs["NRows"] = np.int32(first_header["nrows"])
+                dset.attrs["XLLCorner"] = np.float64(first_header["xllcorner"])
+                dset.attrs["YLLCorner"] = np.float64(first_header["yllcorner"])
+                dset.attrs["CellSize"] = np.float64(first_header["cellsize"])
+                dset.attrs["NoData_Value"] = np.float64(first_header["nodata_value"])
+                if packing is not None:
+                    dset.attrs["NCells"] = np.int32(packing.ncells)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    if errors:
+        os.remove(output)
+        raise ValueError("\n".join(errors))
+    return len(series)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack Rain/PET ASC series into HDF5 cubes")
+    parser.add_argument("--control", default="Control.Project", help="control file of the project")
+    parser.add_argument("--kind", nargs="+", choices=sorted(FORCING_KEYS), default=["rain", "pet"],
+                        help="series to pack (default: rain pet)")
+    parser.add_argument("--workers", type=int, default=None, help="number of parsing processes (default: all cores)")
+    parser.add_argument("--dtype", choices=["float32", "float64"], default="float32",
+                        help="storage type of the values (default: float32)")
+    parser.add_argument("--mask", help="ASC grid whose cells that are not NoData are the only ones stored")
+    args = parser.parse_args()
+
+    try:
+        control = read_control(args.control)
+        grid = hydro_grid(control)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Error reading {args.control}: {e}")
+        return 1
+    packing = None
+    if args.mask:
+        try:
+            packing = read_mask(args.mask, grid)
+        except (OSError, ValueError) as e:
+            print(f"Error reading the mask: {e}")
+            return 1
+        print(f"Storing the {packing.ncells} cells of {args.mask}")
+
+    # paths in the control file are relative to the project directory
+    project_dir = os.path.dirname(os.path.abspath(args.control))
+    status = 0
+    for kind in args.kind:
+        key = FORCING_KEYS[kind]
+        prefix = os.path.normpath(os.path.join(project_dir, get_str(control, key)))
+        output = prefix + ".h5"
+        print(f"Packing {prefix}*.asc into {output}")
+        try:
+            n = pack_series(prefix, output, grid, workers=args.workers, dtype=np.dtype(args.dtype),
+                            packing=packing)
+        except ValueError as e:
+            print(f"Error packing {key}:\n{e}")
+            status = 1
+            continue
+        print(f"  {n} steps written; set {key.replace('Path', 'Format')} = hdf5 in {args.control} to use it")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Grids stored as vectors of the cells of a mask (PackedCells = yes).
+
+With PackedCells = yes in Control.Project the model writes, for every
+group of Result_all.h5 (and for StateFormat = hdf5 state files), only the
+cells inside the mask: a grid becomes a 1-D vector of NCells values,
+taken row by row from the top, and <Group>/Mask (NRows, NCols) holds 1 for
+those cells and 0 elsewhere, once per file. Forcing cubes packed with
+pack_forcing.py --mask use the same layout.
+
+PackedGrid puts such vectors back on the grid, and gives the part of a
+vector covering a band of rows as a view, so reductions over the cells
+(sums, histograms, thresholds) run on the vector without building the
+grid at all:
+
+    from packed_grid import PackedGrid
+
+    with h5py.File("Results/Result_all.h5", "r") as f:
+        packing = PackedGrid.from_group(f["Landslide"])
+        cells = f["Landslide/GOVar_FS3D_2024090512"][()]   # (NCells,)
+        unstable = np.count_nonzero((cells != -9999) & (cells < 100))
+        grid = packing.scatter(cells)                      # (NRows, NCols), -9999 outside
+"""
+
+import numpy as np
+
+NODATA_VALUE = -9999
+
+
+class PackedGrid:
+    """Cells of a (nrows, ncols) grid selected by a mask, in row-major order"""
+
+    def __init__(self, mask):
+        self.mask = np.asarray(mask) != 0
+        self.mask.setflags(write=False)
+        # positions of the cells in the flattened grid, increasing
+        self.index = np.flatnonzero(self.mask)
+        self.index.setflags(write=False)
+
+    @classmethod
+    def from_group(cls, group):
+        """PackedGrid of an HDF5 group (or file) with a Mask dataset, None when it has none"""
+        if "Mask" not in group:
+            return None
+        return cls(group["Mask"][()])
+
+    @property
+    def shape(self):
+        return self.mask.shape
+
+    @property
+    def ncells(self):
+        return self.index.size
+
+    def scatter(self, cells, fill=NODATA_VALUE, out=None, rows=None):
+        """
+        Put packed values back on the grid.
+
+        cells has the cells as last axis, e.g. (ncells,) or (time, ncells),
+        and the result is (..., nrows, ncols) with fill outside the mask.
+        With rows=(first, last+1), cells are the values of rows_slice(rows)
+        and only that band of rows is built.
+        """
+        cells = np.asarray(cells)
+        r0, r1 = (0, self.shape[0]) if rows is None else rows
+        ncols = self.shape[1]
+        lead = cells.shape[:-1]
+        if out is None:
+            out = np.full(lead + (r1 - r0, ncols), fill, dtype=cells.dtype)
+        else:
+            out[...] = fill
+        # a view of out, which must be C-contiguous when given
+        flat = out.reshape(lead + ((r1 - r0) * ncols,))
+        if rows is None:
+            flat[..., self.index] = cells
+        else:
+            flat[..., self.index[self.rows_slice(rows)] - r0 * ncols] = cells
+        return out
+
+    def gather(self, grid):
+        """Packed values of a (..., nrows, ncols) grid, as the model writes them"""
+        grid = np.asarray(grid)
+        return grid.reshape(grid.shape[:-2] + (-1,))[..., self.index]
+
+    def rows_slice(self, rows):
+        """
+        slice of the packed vector holding the cells of rows (first, last+1).
+
+        Cells are packed row by row, so the cells of a band of rows are
+        contiguous and vector[rows_slice(rows)] is a view, and a dataset
+        read of only those cells.
+        """
+        if rows is None:
+            return slice(0, self.ncells)
+        ncols = self.shape[1]
+        start, stop = np.searchsorted(self.index, [rows[0] * ncols, rows[1] * ncols])
+        return slice(int(start), int(stop))
+
+    def cells_of(self, rows, cols):
+        """Positions in the packed vector of the box rows x cols, -1 where a cell is outside the mask"""
+        r = np.arange(rows[0], rows[1])[:, None]
+        c = np.arange(cols[0], cols[1])[None, :]
+        flat = r * self.shape[1] + c
+        if self.ncells == 0:
+            return np.full(flat.shape, -1)
+        k = np.minimum(np.searchsorted(self.index, flat), self.ncells - 1)
+        return np.where(self.index[k] == flat, k, -1)
+
+    def __repr__(self):
+        return f"PackedGrid(nrows={self.shape[0]}, ncols={self.shape[1]}, ncells={self.ncells})"
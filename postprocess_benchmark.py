@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Time the post-processing scripts on synthetic data, without a real run.
+
+The suite builds a synthetic project in a scratch folder:
+
+    Results/Result_all.h5        the layout of Export_HDF5: groups Meteorology,
+                                 Hydrology and Landslide with the NCols, NRows,
+                                 XLLCorner, YLLCorner and CellSize attributes,
+                                 one GOVar_<Var>_<Date> int32 dataset (value*100,
+                                 gzip+shuffle) per variable and step, with the
+                                 scale_factor, add_offset and NoData_Value
+                                 attributes
+    HydroBasics/Basin_boundary.shp   the outline of the synthetic basin
+    Rains/rain<Date>.asc         rain forcing on the hydrological grid
+    PETs/pet<Date>.asc           PET forcing, with negative cells to clean
+    LandslideBasics/Soil*.asc    integer soil classes on the landslide grid
+
+and times, with the functions the scripts use:
+
+    render          Plot_all.py: every frame of R, W, SM, FS3D, PF, FVolume to JPG
+    video           VideoMaker.py: one video per variable from those JPGs
+    stream_video    Plot_all.py --stream-video --no-jpg: frames straight into videos
+    fixpet          fixpet.py: clamp the negative PET cells of every file
+    reclassify      batch_replace_soil.py / reclassify_asc.py: the soil mapping
+
+The landslide grid covers the hydrological one with --land-factor times
+finer cells. Each benchmark runs --repeat times; the JSON output holds the
+settings, the machine and every time, so runs of the same settings can be
+compared: --compare BASELINE.json reports the ratio of the best times and
+exits with status 1 when one is slower by more than --tolerance.
+
+Usage:
+    python postprocess_benchmark.py --json bench.json
+    python postprocess_benchmark.py --grid 653x607 --land-factor 3 --steps 24 --only fixpet reclassify
+    python postprocess_benchmark.py --json new.json --compare bench.json --tolerance 0.2
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from asc_utils import map_files, write_asc
+from batch_replace_soil import SOIL_MAPPING
+from fixpet import fix_pet_file
+from reclassify_asc import reclassify_files
+from result_reader import NODATA_VALUE, VALUE_FACTOR
+from storage_benchmark import synthetic_steps
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Visualization"))
+import Plot_all  # noqa: E402
+import VideoMaker  # noqa: E402
+
+BENCHMARKS = ["render", "video", "stream_video", "fixpet", "reclassify"]
+# group and value range of every grid output, in the order of g_sGOVarName;
+# R spans decades and is drawn on a log scale
+VARIABLES = {
+    "Rain": ("Meteorology", 0.0, 20.0), "PET": ("Meteorology", 0.0, 0.5),
+    "EPot": ("Meteorology", 0.0, 0.5), "EAct": ("Meteorology", 0.0, 0.5),
+    "W": ("Hydrology", 0.0, 150.0), "SM": ("Hydrology", 0.0, 100.0), "R": ("Hydrology", 0.1, 1000.0),
+    "ExcS": ("Hydrology", 0.0, 5.0), "ExcI": ("Hydrology", 0.0, 5.0),
+    "RS": ("Hydrology", 0.0, 50.0), "RI": ("Hydrology", 0.0, 50.0),
+    "FS3D": ("Landslide", 0.5, 3.5), "PF": ("Landslide", 0.0, 1.0),
+    "FVolume": ("Landslide", 2e5, 5e5), "FArea": ("Landslide", 0.0, 5e4),
+}
+GRID_ORIGIN = (103.5, 21.8)
+
+
+def scaled_steps(var, nrows, ncols, nsteps, seed):
+    """Synthetic steps of one variable in its value range, NoData outside the basin"""
+    lo, hi = VARIABLES[var][1:]
+    steps = []
+    for field in synthetic_steps(nrows, ncols, nsteps, seed):
+        outside = field == NODATA_VALUE
+        u = np.clip((field - 15.0) / 70.0, 0.0, 1.0)
+        values = 10 ** (np.log10(lo) + u * (np.log10(hi) - np.log10(lo))) if var == "R" else lo + u * (hi - lo)
+        steps.append(np.where(outside, NODATA_VALUE, values))
+    return steps
+
+
+def basin_outline(extent, points=361):
+    """Outline of the basin of synthetic_steps in map coordinates"""
+    theta = np.linspace(0, 2 * np.pi, points)
+    radius = 0.42 + 0.05 * np.sin(6 * theta)
+    x = 0.5 + radius * np.cos(theta)
+    y = 0.5 + radius * np.sin(theta)
+    # the first row of the grids is the top one
+    return list(zip(extent[0] + x * (extent[1] - extent[0]), extent[3] - y * (extent[3] - extent[2])))
+
+
+def make_project(folder, nrows, ncols, land_factor, nsteps, soil_files, seed=0):
+    """Write the synthetic project; returns its paths and sizes"""
+    cellsize = 0.01
+    hydro = {"ncols": ncols, "nrows": nrows, "xllcorner": GRID_ORIGIN[0], "yllcorner": GRID_ORIGIN[1],
+             "cellsize": cellsize, "nodata_value": NODATA_VALUE}
+    land = dict(hydro, ncols=ncols * land_factor, nrows=nrows * land_factor, cellsize=cellsize / land_factor)
+    start = datetime.datetime(2024, 9, 5)
+    dates = [(start + datetime.timedelta(hours=k)).strftime("%Y%m%d%H") for k in range(nsteps)]
+
+    paths = {name: os.path.join(folder, name) for name in ("Results", "HydroBasics", "Rains", "PETs",
+                                                           "LandslideBasics")}
+    for path in paths.values():
+        os.makedirs(path, exist_ok=True)
+
+    h5_path = os.path.join(paths["Results"], "Result_all.h5")
+    with h5py.File(h5_path, "w") as h5:
+        for group, grid in (("Meteorology", hydro), ("Hydrology", hydro), ("Landslide", land)):
+            g = h5.create_group(group)
+            g.attrs["NCols"] = grid["ncols"]
+            g.attrs["NRows"] = grid["nrows"]
+            g.attrs["XLLCorner"] = grid["xllcorner"]
+            g.attrs["YLLCorner"] = grid["yllcorner"]
+            g.attrs["CellSize"] = grid["cellsize"]
+        for number, (var, (group, lo, hi)) in enumerate(VARIABLES.items()):
+            grid = land if group == "Landslide" else hydro
+            for date, values in zip(dates, scaled_steps(var, grid["nrows"], grid["ncols"], nsteps, seed + number)):
+                stored = np.where(values == NODATA_VALUE, NODATA_VALUE,
+                                  np.trunc(values * VALUE_FACTOR)).astype(np.int32)
+                dset = h5[group].create_dataset(f"GOVar_{var}_{date}", data=stored, chunks=stored.shape,
+                                                compression="gzip", compression_opts=6, shuffle=True)
+                dset.attrs["scale_factor"] = 1.0 / VALUE_FACTOR
+                dset.attrs["add_offset"] = 0.0
+                dset.attrs["NoData_Value"] = float(NODATA_VALUE)
+
+    extent = [hydro["xllcorner"], hydro["xllcorner"] + ncols * cellsize,
+              hydro["yllcorner"], hydro["yllcorner"] + nrows * cellsize]
+    shp_path = os.path.join(paths["HydroBasics"], "Basin_boundary.shp")
+    with Plot_all.shp.Writer(shp_path, shapeType=Plot_all.shp.POLYGON) as writer:
+        writer.field("NAME", "C")
+        writer.poly([basin_outline(extent)])
+        writer.record("synthetic")
+
+    for kind, steps in (("rain", scaled_steps("Rain", nrows, ncols, nsteps, seed)),
+                        ("pet", scaled_steps("PET", nrows, ncols, nsteps, seed + 1))):
+        for date, values in zip(dates, steps):
+            if kind == "pet":
+                # the interpolated PET has small negative values where it is near zero
+                values = np.where(values == NODATA_VALUE, NODATA_VALUE, values - 0.05)
+            write_asc(os.path.join(paths["Rains" if kind == "rain" else "PETs"], f"{kind}{date}.asc"),
+                      hydro, np.round(values, 4))
+
+    rng = np.random.default_rng(seed)
+    outside = synthetic_steps(land["nrows"], land["ncols"], 1, seed)[0] == NODATA_VALUE
+    soil = []
+    for k in range(soil_files):
+        classes = rng.integers(1, 10, size=outside.shape)
+        path = os.path.join(paths["LandslideBasics"], "Soil.asc" if k == 0 else f"Soil_{k}.asc")
+        write_asc(path, land, np.where(outside, NODATA_VALUE, classes), fmt="%d")
+        soil.append(path)
+
+    return {"h5": h5_path, "shp": shp_path, "pets": sorted(os.path.join(paths["PETs"], name)
+                                                          for name in os.listdir(paths["PETs"])),
+            "soil": soil, "dates": dates, "hydro": hydro, "land": land,
+            "h5_mb": os.path.getsize(h5_path) / 2 ** 20}
+
+
+def fresh_dir(path, subfolders=()):
+    shutil.rmtree(path, ignore_errors=True)
+    for sub in subfolders or [""]:
+        os.makedirs(os.path.join(path, sub), exist_ok=True)
+    return path
+
+
+def run_benchmarks(names, project, folder, workers, repeat, verbose):
+    """{name: [seconds per repeat]} and the item count of every benchmark"""
+    extents = Plot_all.read_extents_h5(project["h5"], verbose=False)
+    boundary = Plot_all.read_boundary(project["shp"])
+    frames = os.path.join(folder, "Frames")
+    rendered = 6 * len(project["dates"])
+
+    def render():
+        fresh_dir(frames, Plot_all.output_folders)
+        return len(Plot_all.render_all(project["h5"], extents, boundary, frames, workers=workers))
+
+    def video():
+        return sum(bool(ok) for ok in VideoMaker.make_videos(frames, Plot_all.output_folders, workers=workers))
+
+    def stream_video():
+        out = fresh_dir(os.path.join(folder, "Stream"), Plot_all.output_folders)
+        return len(Plot_all.stream_all(project["h5"], extents, boundary, out, workers=workers, save_jpg=False))
+
+    def fixpet():
+        out = fresh_dir(os.path.join(folder, "PETs_fixed"))
+        tasks = [(path, os.path.join(out, os.path.basename(path))) for path in project["pets"]]
+        results = map_files(fix_pet_file, tasks, workers=workers)
+        return sum("error" not in result for result in results)
+
+    def reclassify():
+        out = fresh_dir(os.path.join(folder, "Soil_reclassified"))
+        results = reclassify_files(project["soil"], SOIL_MAPPING, output_dir=out, workers=workers)
+        return sum("error" not in result for result in results)
+
+    functions = {"render": render, "video": video, "stream_video": stream_video, "fixpet": fixpet,
+                 "reclassify": reclassify}
+    expected = {"render": rendered, "video": 6, "stream_video": 6, "fixpet": len(project["pets"]),
+                "reclassify": len(project["soil"])}
+    results = []
+    for name in names:
+        times = []
+        for k in range(repeat):
+            if name == "video" and not os.path.isdir(os.path.join(frames, "R")):
+                # the frames are an input of the video benchmark, not part of it
+                with contextlib.redirect_stdout(io.StringIO()):
+                    render()
+            output = io.StringIO()
+            with contextlib.redirect_stdout(sys.stdout if verbose else output):
+                start = time.perf_counter()
+                items = functions[name]()
+                times.append(time.perf_counter() - start)
+        result = {"name": name, "items": items, "expected_items": expected[name], "seconds": times,
+                  "best_s": min(times), "median_s": statistics.median(times),
+                  "per_item_s": min(times) / items if items else None}
+        results.append(result)
+        status = "" if items == expected[name] else f"  ({items} of {expected[name]} items!)"
+        print(f"  {name:<14}{result['best_s']:10.3f} s best {result['median_s']:10.3f} s median "
+              f"{items:6d} items{status}")
+    return results
+
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__, "h5py": h5py.__version__,
+            "matplotlib": Plot_all.matplotlib.__version__, "opencv": Plot_all.cv2.__version__,
+            "platform": platform.platform(), "processor": platform.processor() or platform.machine(),
+            "cpu_count": os.cpu_count()}
+
+
+def compare(results, config, baseline_path, tolerance):
+    """Print the ratios to a baseline run; returns the names of the regressions"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != config:
+        print("Warning: the baseline was run with other settings, the times are not comparable:")
+        for key in sorted(set(config) | set(baseline.get("config", {}))):
+            if config.get(key) != baseline.get("config", {}).get(key):
+                print(f"  {key}: {baseline.get('config', {}).get(key)} -> {config.get(key)}")
+    old = {result["name"]: result for result in baseline.get("results", [])}
+    regressions = []
+    print(f"\nCompared with {baseline_path} (regression above {100 * (1 + tolerance):.0f}%):")
+    for result in results:
+        if result["name"] not in old:
+            continue
+        ratio = result["best_s"] / old[result["name"]]["best_s"] if old[result["name"]]["best_s"] > 0 else 1.0
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(result["name"])
+        print(f"  {result['name']:<14}{old[result['name']]['best_s']:10.3f} s -> {result['best_s']:10.3f} s"
+              f"  {100 * ratio:6.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the post-processing scripts on synthetic data")
+    parser.add_argument("--grid", default="120x110", metavar="ROWSxCOLS",
+                        help="hydrological grid (default: 120x110)")
+    parser.add_argument("--land-factor", type=int, default=3,
+                        help="landslide cells per hydrological cell along each axis (default: 3)")
+    parser.add_argument("--steps", type=int, default=4, help="time steps (default: 4)")
+    parser.add_argument("--soil-files", type=int, default=4, help="soil rasters to reclassify (default: 4)")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="benchmarks to run (default: all)")
+    parser.add_argument("--workers", type=int, default=1, help="processes of the scripts (default: 1)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every benchmark (default: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic fields (default: 0)")
+    parser.add_argument("--workdir", help="new or empty folder of the synthetic project, kept after the run "
+                                          "(default: a temporary one)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary synthetic project and outputs")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="slowdown reported as a regression (default: 0.2, i.e. 20%%)")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the scripts")
+    args = parser.parse_args()
+
+    try:
+        nrows, ncols = (int(n) for n in args.grid.lower().split("x"))
+    except ValueError:
+        parser.error(f"bad grid {args.grid!r}, expected ROWSxCOLS")
+    if min(nrows, ncols, args.land_factor, args.steps, args.repeat, args.soil_files) < 1:
+        parser.error("the grid, --land-factor, --steps, --repeat and --soil-files must be positive")
+    names = args.only or BENCHMARKS
+    config = {"grid": f"{nrows}x{ncols}", "land_factor": args.land_factor, "steps": args.steps,
+              "soil_files": args.soil_files, "workers": args.workers, "seed": args.seed}
+
+    if args.workdir:
+        # a folder given by the user is never deleted, so it must not hold anything else
+        folder = os.path.abspath(args.workdir)
+        if os.path.isdir(folder) and os.listdir(folder):
+            print(f"Error: {folder} is not empty")
+            return 1
+        os.makedirs(folder, exist_ok=True)
+    else:
+        folder = tempfile.mkdtemp(prefix="postprocess_benchmark_")
+    try:
+        start = time.perf_counter()
+        project = make_project(folder, nrows, ncols, args.land_factor, args.steps, args.soil_files, args.seed)
+        print(f"Synthetic project in {folder} ({time.perf_counter() - start:.1f} s): "
+              f"hydro {nrows}x{ncols}, land {project['land']['nrows']}x{project['land']['ncols']}, "
+              f"{args.steps} steps, Result_all.h5 {project['h5_mb']:.1f} MB")
+        results = run_benchmarks(names, project, folder, args.workers, args.repeat, args.verbose)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    report = {"suite": "postprocess", "date": datetime.datetime.now().isoformat(timespec="seconds"),
+              "config": config, "environment": environment(), "result_mb": project["h5_mb"],
+              "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Written {args.json}")
+    if args.compare:
+        try:
+            regressions = compare(results, config, args.compare, args.tolerance)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            return 1
+        if regressions:
+            print(f"Slower than the baseline: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
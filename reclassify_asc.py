@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Reclassify integer ASC rasters (e.g. LandslideBasics/Soil.asc) with a lookup table.
+
+The mapping is applied in one LUT index operation, so all pairs act at the
+same time: with 7:3,8:7 a cell that was 8 ends up as 7, not 3. Classes not
+in the mapping and NoData cells keep their value and their original text.
+Class counts before and after are taken with np.bincount.
+
+Usage:
+    python reclassify_asc.py --map 7:3,8:7,9:6 LandslideBasics/Soil.asc
+    python reclassify_asc.py --map-file soil_map.txt --output-dir Reclassified a.asc b.asc
+
+A mapping file has one "old new" pair per line ("old:new", "old=new" and
+"old,new" also work); text after '#' is ignored. Without --output-dir the
+rasters are rewritten in place after a copy is saved as <file>.backup.
+"""
+
+import argparse
+import os
+import re
+import shutil
+import sys
+
+import numpy as np
+
+from asc_utils import map_files, read_asc_tokens, set_tokens, tokens_to_array, write_asc_tokens
+
+
+def parse_mapping(text):
+    """Parse "7:3,8:7" or the lines of a mapping file into {old: new}"""
+    mapping = {}
+    for line in text.splitlines():
+        line = re.sub(r"\s*[:=]\s*", ":", line.split("#", 1)[0].strip())
+        if not line:
+            continue
+        if ":" in line:
+            pairs = [pair.split(":") for pair in re.split(r"[,;\s]+", line) if pair]
+        else:
+            pairs = [re.split(r"[,\s]+", line)]
+        for pair in pairs:
+            if len(pair) != 2:
+                raise ValueError(f"bad mapping entry: {line!r}")
+            mapping[int(pair[0])] = int(pair[1])
+    return mapping
+
+
+def build_lut(mapping, lo, hi):
+    """Identity lookup table for classes lo..hi with the mapping applied"""
+    lut = np.arange(lo, hi + 1, dtype=np.int64)
+    for old, new in mapping.items():
+        if lo <= old <= hi:
+            lut[old - lo] = new
+    return lut
+
+
+def class_counts(classes, lo):
+    """{class: count} of an array of class codes offset by lo"""
+    counts = np.bincount(classes)
+    present = np.nonzero(counts)[0]
+    return {int(c + lo): int(counts[c]) for c in present}
+
+
+def reclassify_asc(input_path, output_path, mapping):
+    """
+    Apply mapping to the valid cells of an integer raster and write the result.
+
+    Returns a dict with the class counts before and after and the number of
+    cells that changed.
+    """
+    header_lines, header, tokens = read_asc_tokens(input_path)
+    values = tokens_to_array(tokens)
+    valid = values != header["nodata_value"]
+    codes = values[valid]
+    if not np.array_equal(codes, np.round(codes)):
+        raise ValueError(f"{input_path}: not an integer raster")
+    codes = codes.astype(np.int64)
+
+    result = {"file": input_path, "output": output_path, "nodata": int(values.size - codes.size)}
+    if codes.size == 0:
+        write_asc_tokens(output_path, header_lines, tokens)
+        result.update(before={}, after={}, changed=0)
+        return result
+
+    lo, hi = int(codes.min()), int(codes.max())
+    lut = build_lut(mapping, lo, hi)
+    new_codes = lut[codes - lo]
+
+    new_lo = int(new_codes.min())
+    result["before"] = class_counts(codes - lo, lo)
+    result["after"] = class_counts(new_codes - new_lo, new_lo)
+
+    changed = np.zeros(values.shape, dtype=bool)
+    changed[valid] = new_codes != codes
+    result["changed"] = int(np.count_nonzero(changed))
+
+    new_values = np.zeros(values.shape, dtype=np.int64)
+    new_values[valid] = new_codes
+    for new in np.unique(new_values[changed]):
+        tokens = set_tokens(tokens, changed & (new_values == new), str(int(new)).encode())
+
+    write_asc_tokens(output_path, header_lines, tokens)
+    return result
+
+
+def print_report(result):
+    name = result["file"]
+    if "error" in result:
+        print(f"Error processing {name}: {result['error']}")
+        return
+    print(f"{name} -> {result['output']}: {result['changed']} cells changed, "
+          f"{result['nodata']} NoData cells kept")
+    classes = sorted(set(result["before"]) | set(result["after"]))
+    print("  class    before     after")
+    for c in classes:
+        print(f"  {c:5d} {result['before'].get(c, 0):9d} {result['after'].get(c, 0):9d}")
+
+
+def reclassify_files(files, mapping, output_dir=None, backup=True, workers=None):
+    """Reclassify many rasters in one parallel batch"""
+    tasks = []
+    for path in files:
+        if output_dir is None:
+            if backup:
+                shutil.copyfile(path, path + ".backup")
+            tasks.append((path, path, mapping))
+        else:
+            tasks.append((path, os.path.join(output_dir, os.path.basename(path)), mapping))
+    return map_files(reclassify_asc, tasks, workers=workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reclassify integer ASC rasters with a lookup table")
+    parser.add_argument("files", nargs="+", help="rasters to reclassify")
+    parser.add_argument("--map", dest="mapping", help='mapping as "old:new,old:new", e.g. "7:3,8:7,9:6"')
+    parser.add_argument("--map-file", help='file with one "old new" pair per line')
+    parser.add_argument("--output-dir", help="write results here instead of rewriting the files in place")
+    parser.add_argument("--no-backup", action="store_true", help="do not keep <file>.backup when rewriting in place")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    mapping = {}
+    try:
+        if args.map_file:
+            with open(args.map_file, 'r') as f:
+                mapping.update(parse_mapping(f.read()))
+        if args.mapping:
+            mapping.update(parse_mapping(args.mapping))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not mapping:
+        parser.error("no mapping given, use --map or --map-file")
+
+    missing = [path for path in args.files if not os.path.exists(path)]
+    if missing:
+        print(f"Error: File(s) not found: {', '.join(missing)}")
+        return 1
+
+    print("Mapping applied:")
+    for old, new in sorted(mapping.items()):
+        print(f"  {old} → {new}")
+
+    results = reclassify_files(args.files, mapping, output_dir=args.output_dir,
+                               backup=not args.no_backup, workers=args.workers)
+    for result in results:
+        print_report(result)
+    return 1 if any("error" in result for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
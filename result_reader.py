@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+Lazy, indexed access to the Result_all.h5 file written by Export_HDF5.
+
+The datasets are named <Group>/GOVar_<Var>_<Date>, one 2-D grid per
+variable and step. By default they are int32 = value*100 with -9999 for
+NoData; with the GOType/GOScale/GOOffset options of Control.Project they
+may be int16, int32 or float32 with value = stored*scale_factor +
+add_offset, as recorded in the scale_factor, add_offset and NoData_Value
+attributes of every dataset (files without them use the defaults). The
+reader lists the names once, builds a (variable, datetime) index and only
+reads and decodes a frame when it is asked for; decoded frames are kept in
+a small LRU cache.
+
+Files rewritten by result_rechunk.py, and runs with ResultBuffer > 0,
+ResultSWMR or ResultWriterThread, hold one (time, row, col) dataset
+<Group>/GOVar_<Var> per variable instead, with the date digits of the steps
+in <Group>/Time; they are indexed the same way, and time series of single
+pixels or boxes are read from them without decoding whole frames.
+
+    from result_reader import ResultReader
+
+    with ResultReader("Results/Result_all.h5") as reader:
+        reader.variables                    # ['W', 'SM', 'R', 'FS3D', ...]
+        sm = reader['SM']
+        sm.times                            # [datetime(2024, 9, 5, 0), ...]
+        frame = sm['2024-09-05 12']         # 2-D float32 array, NaN for NoData
+        day = sm['2024-09-05':'2024-09-06'] # lazy slice, both days included
+        for when, frame in day.items():
+            ...
+        cube = day.to_array()               # (time, row, col)
+        sm.grid.extent                      # [xmin, xmax, ymin, ymax]
+        times, fs = reader.point_series('FS3D', 104.18, 22.41)
+
+Georeferencing comes from the NCols/NRows/XLLCorner/YLLCorner/CellSize
+attributes of each group, so Control.Project is not needed.
+
+A run with ResultSWMR = yes writes the stacked layout while it runs; open
+it with ResultReader(path, swmr=True) and call refresh() to index the
+steps written since.
+
+With PackedCells = yes the frames are vectors of the cells inside
+<Group>/Mask (see packed_grid.py): (NCells,) per step or (time, NCells)
+stacked. Frames, boxes and series come back on the grid as for the other
+files; cells() and raw_cells() give the vector of one step as stored, for
+statistics over the cells that do not need the grid:
+
+        fs = reader.cells('FS3D', 0)        # 1-D float32, NaN for NoData
+        np.nanmean(fs), np.count_nonzero(fs < 1)
+"""
+
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import h5py
+import numpy as np
+
+from packed_grid import PackedGrid
+
+NODATA_VALUE = -9999
+VALUE_FACTOR = 100
+
+# GOVar_<Var>_<Date>, with <Date> as written by myDtoStr for the TimeMark
+_NAME_PATTERN = re.compile(r"^GOVar_(?P<var>.+)_(?P<date>\d{4}(?:\d{2}){0,5})$")
+# GOVar_<Var> of the stacked layout
+_STACK_PATTERN = re.compile(r"^GOVar_(?P<var>[^_]+)$")
+_DATE_FORMATS = {4: "%Y", 6: "%Y%m", 8: "%Y%m%d", 10: "%Y%m%d%H", 12: "%Y%m%d%H%M", 14: "%Y%m%d%H%M%S"}
+
+
+def parse_date_digits(digits):
+    """datetime of the date part of a dataset name, e.g. 2024090512"""
+    return datetime.strptime(digits, _DATE_FORMATS[len(digits)])
+
+
+def parse_time_label(label):
+    """
+    Return the (first, last) instant covered by a time label.
+
+    Labels can be datetimes, dataset-style digits ("2024090512") or ISO-like
+    strings with any resolution ("2024-09", "2024-09-05", "2024-09-05 12",
+    "2024-09-05T12:30"). A day label covers the whole day, so as a slice
+    end it includes every step of that day.
+    """
+    if isinstance(label, datetime):
+        return label, label
+    if isinstance(label, np.datetime64):
+        label = label.astype("datetime64[us]").item()
+        return label, label
+    text = str(label).strip()
+    if text.isdigit():
+        first = parse_date_digits(text)
+        resolution = len(text)
+    else:
+        fields = [int(field) for field in re.split(r"[-T :/]+", text) if field]
+        if not 1 <= len(fields) <= 6:
+            raise ValueError(f"bad time label: {label!r}")
+        resolution = {1: 4, 2: 6, 3: 8, 4: 10, 5: 12, 6: 14}[len(fields)]
+        # month and day default to 1 for year and month labels
+        first = datetime(*(fields + [1] * (3 - len(fields))))
+    if resolution == 4:
+        last = first.replace(year=first.year + 1)
+    elif resolution == 6:
+        last = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+    else:
+        last = first + {8: timedelta(days=1), 10: timedelta(hours=1),
+                        12: timedelta(minutes=1), 14: timedelta(seconds=1)}[resolution]
+    return first, last - timedelta(microseconds=1)
+
+
+class Grid:
+    """Georeferencing of one group, from its NCols/.../CellSize attributes"""
+
+    def __init__(self, ncols, nrows, xllcorner, yllcorner, cellsize, nodata_value=NODATA_VALUE):
+        self.ncols = int(ncols)
+        self.nrows = int(nrows)
+        self.xllcorner = float(xllcorner)
+        self.yllcorner = float(yllcorner)
+        self.cellsize = float(cellsize)
+        self.nodata_value = nodata_value
+
+    @classmethod
+    def from_attrs(cls, attrs):
+        return cls(attrs["NCols"], attrs["NRows"], attrs["XLLCorner"], attrs["YLLCorner"], attrs["CellSize"])
+
+    @property
+    def extent(self):
+        """[xmin, xmax, ymin, ymax], as used by imshow"""
+        return [self.xllcorner, self.xllcorner + self.ncols * self.cellsize,
+                self.yllcorner, self.yllcorner + self.nrows * self.cellsize]
+
+    @property
+    def x(self):
+        """x coordinates of the cell centres, one per column"""
+        return self.xllcorner + (np.arange(self.ncols) + 0.5) * self.cellsize
+
+    @property
+    def y(self):
+        """y coordinates of the cell centres, one per row (first row is the top one)"""
+        return self.yllcorner + (self.nrows - np.arange(self.nrows) - 0.5) * self.cellsize
+
+    def index_of(self, x, y):
+        """(row, col) of the cell containing the point (x, y), as the model computes OutPix cells"""
+        col = int(np.floor((x - self.xllcorner) / self.cellsize))
+        row = int(np.floor((self.yllcorner + self.nrows * self.cellsize - y) / self.cellsize))
+        if not (0 <= row < self.nrows and 0 <= col < self.ncols):
+            raise IndexError(f"point ({x}, {y}) is outside the grid")
+        return row, col
+
+    def __repr__(self):
+        return (f"Grid(ncols={self.ncols}, nrows={self.nrows}, xllcorner={self.xllcorner}, "
+                f"yllcorner={self.yllcorner}, cellsize={self.cellsize})")
+
+
+def encoding(attrs):
+    """
+    (nodata_value, factor, offset) of a result dataset from its attributes.
+
+    value = stored / factor + offset; datasets written before the storage
+    options have no attributes and are int32 value*100 with -9999 for NoData.
+    """
+    scale = float(attrs.get("scale_factor", 1.0 / VALUE_FACTOR))
+    return (attrs.get("NoData_Value", NODATA_VALUE), 1.0 / scale, float(attrs.get("add_offset", 0.0)))
+
+
+def decode(raw, nodata_value=NODATA_VALUE, factor=VALUE_FACTOR, offset=0.0):
+    """Stored values (value*factor, shifted by offset) to float32 values, NaN for NoData"""
+    values = raw.astype(np.float32)
+    values[raw == nodata_value] = np.nan
+    if factor != 1:
+        values /= np.float32(factor)
+    if offset:
+        values += np.float32(offset)
+    return values
+
+
+class ResultReader:
+    """Index of the variables and steps of a result file"""
+
+    def __init__(self, path, cache_size=32, swmr=False):
+        self.path = path
+        self.file = h5py.File(path, "r", swmr=swmr)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._index = {}
+        self._groups = {}
+        self._grids = {}
+        self._stacks = {}
+        self._encodings = {}
+        self._packings = {}
+        self.file.visititems(self._add_to_index)
+        for var in self._index:
+            self._index[var].sort(key=lambda entry: entry[0])
+
+    def _add_to_index(self, name, obj):
+        if not isinstance(obj, h5py.Dataset):
+            return
+        group, _, dset = name.rpartition("/")
+        match = _NAME_PATTERN.match(dset)
+        if match is not None:
+            var = match.group("var")
+            self._index.setdefault(var, []).append((parse_date_digits(match.group("date")), name, None))
+            self._groups[var] = group
+            return
+        match = _STACK_PATTERN.match(dset)
+        time_name = f"{group}/Time" if group else "Time"
+        packed = (f"{group}/Mask" if group else "Mask") in self.file
+        if match is not None and obj.ndim == (2 if packed else 3) and time_name in self.file:
+            var = match.group("var")
+            times = self.file[time_name][:obj.shape[0]]
+            self._index.setdefault(var, []).extend(
+                (parse_date_digits(f"{int(t)}"), name, k) for k, t in enumerate(times))
+            self._groups[var] = group
+            self._stacks[var] = (name, time_name)
+
+    def refresh(self):
+        """
+        Index the steps appended to the stacked datasets since the last call.
+
+        Returns {var: number of new steps}. A step counts once both its
+        frame and its Time entry are visible; only a file opened with
+        swmr=True sees what the writer flushed after it was opened.
+        """
+        added = {}
+        for var, (name, time_name) in self._stacks.items():
+            dset, time_dset = self.file[name], self.file[time_name]
+            if self.file.swmr_mode:
+                dset.refresh()
+                time_dset.refresh()
+            known = len(self._index[var])
+            n = min(dset.shape[0], time_dset.shape[0])
+            if n > known:
+                self._index[var].extend((parse_date_digits(f"{int(t)}"), name, known + k)
+                                        for k, t in enumerate(time_dset[known:n]))
+                added[var] = n - known
+        return added
+
+    @property
+    def variables(self):
+        return list(self._index)
+
+    def __contains__(self, var):
+        return var in self._index
+
+    def __getitem__(self, var):
+        if var not in self._index:
+            raise KeyError(f"variable {var} not in {self.path}; found {self.variables}")
+        return VariableView(self, var)
+
+    def group_of(self, var):
+        return self._groups[var]
+
+    def group_grid(self, group):
+        """Georeferencing of a group (Meteorology, Hydrology or Landslide)"""
+        if group not in self._grids:
+            self._grids[group] = Grid.from_attrs(self.file[group].attrs)
+        return self._grids[group]
+
+    def grid(self, var):
+        """Georeferencing of the group holding var"""
+        return self.group_grid(self._groups[var])
+
+    def times(self, var):
+        return [entry[0] for entry in self._index[var]]
+
+    def entries(self, var):
+        """[(datetime, dataset name, step in the dataset or None)] of var in time order"""
+        return list(self._index[var])
+
+    def time_digits(self, var):
+        """Date digits of every step of var as float64, at the TimeMark resolution of the file"""
+        digits = []
+        stacked_times = {}
+        for _, name, step in self._index[var]:
+            if step is None:
+                digits.append(float(name.rsplit("_", 1)[1]))
+            else:
+                group = name.rpartition("/")[0]
+                if group not in stacked_times:
+                    stacked_times[group] = self.file[f"{group}/Time" if group else "Time"][()]
+                digits.append(float(stacked_times[group][step]))
+        return digits
+
+    def encoding(self, var):
+        """(nodata_value, factor, offset) of var, see encoding()"""
+        if var not in self._encodings:
+            self._encodings[var] = encoding(self.file[self._index[var][0][1]].attrs)
+        return self._encodings[var]
+
+    def packing(self, var):
+        """PackedGrid of the group holding var, None when its frames are whole grids"""
+        group = self._groups[var]
+        if group not in self._packings:
+            self._packings[group] = PackedGrid.from_group(self.file[group] if group else self.file)
+        return self._packings[group]
+
+    def is_stacked(self, var):
+        """True when all steps of var are in one (time, row, col) dataset"""
+        entries = self._index[var]
+        return all(k is not None and name == entries[0][1] for _, name, k in entries)
+
+    def raw_frame(self, var, position, rows=None):
+        """Stored (undecoded) frame number position of var, or its rows (first, last+1)"""
+        packing = self.packing(var)
+        if packing is None:
+            return self.raw_cells(var, position, rows)
+        return packing.scatter(self.raw_cells(var, position, rows), self.encoding(var)[0], rows=rows)
+
+    def raw_cells(self, var, position, rows=None):
+        """
+        Stored values of frame number position of var as they are in the file.
+
+        For packed files the vector of the cells of the mask (of rows (first,
+        last+1) only, when given), read without building the grid; for the
+        others the frame itself.
+        """
+        _, name, k = self._index[var][position]
+        packing = self.packing(var)
+        if packing is not None:
+            region = packing.rows_slice(rows)
+        else:
+            region = np.s_[:] if rows is None else np.s_[rows[0]:rows[1]]
+        if k is None:
+            return self.file[name][region]
+        return self.file[name][(k, region)]
+
+    def cells(self, var, position):
+        """Decoded values of the cells of frame number position (see raw_cells), NaN for NoData"""
+        return decode(self.raw_cells(var, position), *self.encoding(var))
+
+    def chunk_rows(self, var):
+        """Height of the storage chunks of var (the frame height when unchunked or packed)"""
+        if self.packing(var) is not None:
+            return self.grid(var).nrows
+        dset = self.file[self._index[var][0][1]]
+        return dset.chunks[-2] if dset.chunks else dset.shape[-2]
+
+    def frame(self, var, position):
+        """Decoded frame number position of var, through the LRU cache"""
+        key = (var, position)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        values = decode(self.raw_frame(var, position), *self.encoding(var))
+        values.setflags(write=False)
+        if self.cache_size > 0:
+            self._cache[key] = values
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return values
+
+    def box_series(self, var, rows, cols, start=None, stop=None):
+        """
+        Time series of a box of cells.
+
+        rows and cols are (first, last+1) ranges. Returns (times, values) with
+        values shaped (time, rows, cols); start/stop are time labels as for
+        slicing. On the stacked layout only the chunks of the box are read.
+        """
+        positions = self[var][start:stop].positions
+        times = [self._index[var][p][0] for p in positions]
+        r0, r1 = rows
+        c0, c1 = cols
+        if not positions:
+            return times, np.empty((0, r1 - r0, c1 - c0), dtype=np.float32)
+        packing = self.packing(var)
+        if packing is not None:
+            # clipped to the grid like a slice, the cells of the box lie
+            # between its first and last packed cell
+            r1, c1 = min(r1, packing.shape[0]), min(c1, packing.shape[1])
+            where = packing.cells_of((r0, r1), (c0, c1))
+            inside = where >= 0
+            if not inside.any():
+                nodata = np.full((len(positions), r1 - r0, c1 - c0), self.encoding(var)[0])
+                return times, decode(nodata, *self.encoding(var))
+            lo, hi = int(where[inside].min()), int(where[inside].max()) + 1
+            if self.is_stacked(var):
+                name = self._index[var][0][1]
+                first, last = self._index[var][positions[0]][2], self._index[var][positions[-1]][2]
+                cells = self.file[name][first:last + 1, lo:hi]
+                cells = cells[[self._index[var][p][2] - first for p in positions]]
+            else:
+                cells = np.stack([self.file[self._index[var][p][1]][lo:hi] for p in positions])
+            raw = np.full((len(positions), r1 - r0, c1 - c0), self.encoding(var)[0], dtype=cells.dtype)
+            raw[:, inside] = cells[:, where[inside] - lo]
+        elif self.is_stacked(var):
+            name = self._index[var][0][1]
+            first, last = self._index[var][positions[0]][2], self._index[var][positions[-1]][2]
+            raw = self.file[name][first:last + 1, r0:r1, c0:c1]
+            raw = raw[[self._index[var][p][2] - first for p in positions]]
+        else:
+            raw = np.stack([self.file[self._index[var][p][1]][r0:r1, c0:c1] for p in positions])
+        return times, decode(raw, *self.encoding(var))
+
+    def pixel_series(self, var, row, col, start=None, stop=None):
+        """Time series of one cell as (times, 1-D values)"""
+        times, values = self.box_series(var, (row, row + 1), (col, col + 1), start, stop)
+        return times, values[:, 0, 0]
+
+    def point_series(self, var, x, y, start=None, stop=None):
+        """Time series of the cell containing the point (x, y)"""
+        row, col = self.grid(var).index_of(x, y)
+        return self.pixel_series(var, row, col, start, stop)
+
+    def close(self):
+        self._cache.clear()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class VariableView:
+    """The steps of one variable, addressed by position, time label or time slice"""
+
+    def __init__(self, reader, var, positions=None):
+        self.reader = reader
+        self.var = var
+        self.positions = list(range(len(reader._index[var]))) if positions is None else positions
+
+    @property
+    def times(self):
+        entries = self.reader._index[self.var]
+        return [entries[p][0] for p in self.positions]
+
+    @property
+    def grid(self):
+        return self.reader.grid(self.var)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _locate(self, label):
+        first, last = parse_time_label(label)
+        times = self.times
+        for i, when in enumerate(times):
+            if first <= when <= last:
+                return i
+        raise KeyError(f"{self.var} has no step at {label}")
+
+    def _slice(self, key):
+        if key.step is not None:
+            raise ValueError("time slices do not take a step")
+        times = self.times
+        lo = parse_time_label(key.start)[0] if key.start is not None else None
+        hi = parse_time_label(key.stop)[1] if key.stop is not None else None
+        return [p for p, when in zip(self.positions, times)
+                if (lo is None or when >= lo) and (hi is None or when <= hi)]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if all(isinstance(k, (int, np.integer)) or k is None for k in (key.start, key.stop, key.step)):
+                return VariableView(self.reader, self.var, self.positions[key])
+            return VariableView(self.reader, self.var, self._slice(key))
+        if isinstance(key, (int, np.integer)):
+            return self.reader.frame(self.var, self.positions[key])
+        return self.reader.frame(self.var, self.positions[self._locate(key)])
+
+    def __iter__(self):
+        for p in self.positions:
+            yield self.reader.frame(self.var, p)
+
+    def items(self):
+        """(datetime, frame) pairs in time order"""
+        return zip(self.times, iter(self))
+
+    def to_array(self):
+        """All frames stacked as (time, row, col)"""
+        if not self.positions:
+            grid = self.grid
+            return np.empty((0, grid.nrows, grid.ncols), dtype=np.float32)
+        return np.stack(list(self))
+
+    def __repr__(self):
+        times = self.times
+        span = f"{times[0]} .. {times[-1]}" if times else "empty"
+        return f"<{self.var}: {len(times)} steps, {span}>"
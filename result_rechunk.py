@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Rewrite Result_all.h5 into one time-major dataset per variable, and query it.
+
+Export_HDF5 writes every step of every variable as its own 2-D dataset, so
+a time series of one cell decompresses the whole grid at every step. This
+tool stacks the steps of each variable into <Group>/GOVar_<Var> with shape
+(time, row, col), chunked as (time block, 16, 16) so a pixel series only
+touches a handful of small chunks, and writes the date digits of the steps
+to <Group>/Time. Values keep their stored type and encoding; the dataset
+attributes (scale_factor, add_offset, NoData_Value) and the group
+attributes (NCols, NRows, XLLCorner, YLLCorner, CellSize) are copied.
+Files written with PackedCells = yes keep their packed (time, cell)
+layout, in chunks of --chunk squared cells, and their <Group>/Mask.
+
+The rewrite reads a block of steps at a time; the block length is chosen
+from --memory and is also the time length of the chunks, so every chunk is
+written exactly once and memory stays bounded whatever the run length.
+
+Usage:
+    python result_rechunk.py Results/Result_all.h5 -o Results/Result_series.h5
+    python result_rechunk.py --query Results/Result_series.h5 --var FS3D SM --outpix Control.Project
+    python result_rechunk.py --query Results/Result_series.h5 --var SM --point 104.18 22.41
+
+The files written here are read by result_reader.ResultReader like the
+original one; its pixel_series/point_series/box_series are the query API.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import h5py
+import numpy as np
+
+from control_utils import get_bool, get_float, get_int, get_str, hydro_grid, read_control
+from result_reader import ResultReader
+
+SPATIAL_CHUNK = 16
+MAX_TIME_CHUNK = 1024
+
+
+def time_block(nsteps, nrows, ncols, memory_bytes, itemsize=4):
+    """Number of steps read at once (and time length of the chunks)"""
+    frame_bytes = nrows * ncols * itemsize
+    return int(max(1, min(nsteps, MAX_TIME_CHUNK, memory_bytes // frame_bytes)))
+
+
+def rechunk(source, output, memory_bytes=512 * 2 ** 20, spatial_chunk=SPATIAL_CHUNK,
+            compression="gzip", variables=None, verbose=True):
+    """Write the stacked, time-major copy of source to output"""
+    with ResultReader(source, cache_size=0) as reader, h5py.File(output, "w") as out:
+        src = reader.file
+        groups = {}
+        for var in reader.variables:
+            if variables is None or var in variables:
+                groups.setdefault(reader.group_of(var), []).append(var)
+
+        for group, group_vars in groups.items():
+            out_group = out.require_group(group)
+            for key, value in src[group].attrs.items():
+                out_group.attrs[key] = value
+
+            times = reader.times(group_vars[0])
+            for var in group_vars[1:]:
+                if reader.times(var) != times:
+                    raise ValueError(f"{group}: {var} does not have the same steps as {group_vars[0]}")
+            out_group.create_dataset("Time", data=np.array(reader.time_digits(group_vars[0])))
+            packing = reader.packing(group_vars[0])
+            if packing is not None:
+                out_group.create_dataset("Mask", data=packing.mask.astype(np.int32),
+                                         compression=compression, shuffle=True)
+
+            for var in group_vars:
+                entries = reader.entries(var)
+                first = src[entries[0][1]]
+                nsteps = len(entries)
+                if packing is not None:
+                    # frames of ncells x 1
+                    frame_shape = (first.shape[-1],)
+                    block = time_block(nsteps, 1, frame_shape[0], memory_bytes, first.dtype.itemsize)
+                    chunks = (block, min(spatial_chunk * spatial_chunk, frame_shape[0]))
+                else:
+                    frame_shape = first.shape[-2:]
+                    nrows, ncols = frame_shape
+                    block = time_block(nsteps, nrows, ncols, memory_bytes, first.dtype.itemsize)
+                    chunks = (block, min(spatial_chunk, nrows), min(spatial_chunk, ncols))
+                dset = out_group.create_dataset(f"GOVar_{var}", shape=(nsteps,) + frame_shape,
+                                                dtype=first.dtype, chunks=chunks,
+                                                compression=compression, shuffle=True)
+                for key, value in first.attrs.items():
+                    dset.attrs[key] = value
+                start = time.time()
+                buf = np.empty((block,) + frame_shape, dtype=first.dtype)
+                for t0 in range(0, nsteps, block):
+                    t1 = min(nsteps, t0 + block)
+                    for k in range(t0, t1):
+                        _, name, step = entries[k]
+                        if step is None:
+                            src[name].read_direct(buf, dest_sel=np.s_[k - t0])
+                        else:
+                            src[name].read_direct(buf, np.s_[step], np.s_[k - t0])
+                    dset[t0:t1] = buf[:t1 - t0]
+                if verbose:
+                    print(f"{group}/GOVar_{var}: {nsteps} steps, chunks {chunks}, "
+                          f"{time.time() - start:.1f} s")
+
+
+def outpix_locations(control):
+    """[(name, x, y)] of the OutPix points of a control file"""
+    grid = hydro_grid(control)
+    locations = []
+    use_col_row = get_bool(control, "OutPixColRow", False)
+    for i in range(1, get_int(control, "NOutPixs", 0) + 1):
+        name = get_str(control, f"OutPixName{i}", f"OutPix{i}")
+        if use_col_row:
+            # centre of the hydro cell, so it maps onto any grid
+            x = grid["xllcorner"] + (get_int(control, f"OutPixCol{i}") + 0.5) * grid["cellsize"]
+            y = (grid["yllcorner"] + grid["nrows"] * grid["cellsize"]
+                 - (get_int(control, f"OutPixRow{i}") + 0.5) * grid["cellsize"])
+        else:
+            x = get_float(control, f"OutPixLong{i}")
+            y = get_float(control, f"OutPixLati{i}")
+        locations.append((name, x, y))
+    return locations
+
+
+def print_series(path, variables, locations, start=None, stop=None):
+    """CSV of the time series of the variables at the locations"""
+    with ResultReader(path) as reader:
+        columns = []
+        times = None
+        for var in variables:
+            for name, x, y in locations:
+                t0 = time.perf_counter()
+                when, values = reader.point_series(var, x, y, start, stop)
+                elapsed = (time.perf_counter() - t0) * 1000
+                print(f"# {var} at {name} ({x}, {y}): {len(values)} steps in {elapsed:.1f} ms", file=sys.stderr)
+                times = when if times is None else times
+                columns.append((f"{var}_{name}", values))
+        print("Time," + ",".join(label for label, _ in columns))
+        for k, when in enumerate(times or []):
+            row = [f"{values[k]:g}" if k < len(values) else "" for _, values in columns]
+            print(when.strftime("%Y-%m-%d %H:%M:%S") + "," + ",".join(row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stack Result_all.h5 into time-major datasets, or query them")
+    parser.add_argument("source", nargs="?", help="Result_all.h5 to rewrite")
+    parser.add_argument("-o", "--output", help="stacked file (default: <source>_series.h5)")
+    parser.add_argument("--memory", type=float, default=512,
+                        help="memory for the steps read at once, in MB (default: 512)")
+    parser.add_argument("--chunk", type=int, default=SPATIAL_CHUNK, help="spatial chunk size (default: 16)")
+    parser.add_argument("--compression", choices=["gzip", "lzf", "none"], default="gzip")
+    parser.add_argument("--query", metavar="FILE", help="print time series from FILE instead of rewriting")
+    parser.add_argument("--var", nargs="+", help="variables to rewrite or query")
+    parser.add_argument("--outpix", metavar="CONTROL", help="query the OutPix points of this control file")
+    parser.add_argument("--point", nargs=2, type=float, action="append", metavar=("X", "Y"),
+                        help="query the cell containing X Y (repeatable)")
+    parser.add_argument("--start", help="first time of the query, e.g. 2024-09-05")
+    parser.add_argument("--stop", help="last time of the query (inclusive)")
+    args = parser.parse_args()
+
+    if args.query:
+        locations = []
+        if args.outpix:
+            locations += outpix_locations(read_control(args.outpix))
+        for k, (x, y) in enumerate(args.point or []):
+            locations.append((f"P{k + 1}", x, y))
+        if not args.var or not locations:
+            parser.error("--query needs --var and --outpix or --point")
+        print_series(args.query, args.var, locations, args.start, args.stop)
+        return 0
+
+    if not args.source:
+        parser.error("give the result file to rewrite, or --query")
+    output = args.output or os.path.splitext(args.source)[0] + "_series.h5"
+    if os.path.abspath(output) == os.path.abspath(args.source):
+        parser.error("the output must not overwrite the source file")
+    rechunk(args.source, output, memory_bytes=int(args.memory * 2 ** 20), spatial_chunk=args.chunk,
+            compression=None if args.compression == "none" else args.compression, variables=args.var)
+    print(f"Written {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
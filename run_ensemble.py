@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Run the model for a matrix of scenarios, several runs at a time.
+
+Every scenario gets its own directory under the ensemble directory:
+
+    <output>/<name>/Control.Project   copy of the base control file with the
+                                      scenario keys set and every *Path
+                                      pointing back at the project, except
+                                      ResultPath = ./Results/ and
+                                      ParamPath = ./Params/ (and StatePath =
+                                      ./States/, a copy, if SaveState = yes)
+    <output>/<name>/Params/           the parameter files of the scenario's
+                                      ParamPath (rasters linked, *.txt copied)
+                                      with the scenario keys set
+    <output>/<name>/logs/             the model's own log
+    <output>/<name>/run.log           stdout and stderr of the run
+    <output>/<name>/status.json       settings, state and exit status
+
+A scenario key is written to the parameter file that defines it
+(Parameters_parallel.txt, Parameters_hydro.txt, ...) and otherwise to
+Control.Project, so RainPath, StartDate, NLandThread or RainFact can all
+be varied the same way.
+
+Runs are started in order whenever their threads, max(NHydroThread,
+NLandThread), fit in the free cores; smaller runs further down the list
+fill the gaps. Each run gets OMP_NUM_THREADS set to its thread count.
+
+Running the command again resumes the ensemble: finished runs with the
+same settings are skipped and interrupted ones are started again (failed
+ones too with --retry-failed). A run counts as failed if the model exits
+with an error status or prints an error message, since it stops with
+status 0 on most input errors.
+
+The scenarios come from a JSON file, from the command line or both:
+
+    {
+        "binary": "build/iHydroSlide3D",
+        "output": "Ensemble",
+        "set": {"NHydroThread": 4, "NLandThread": 8},
+        "matrix": {"RainPath": ["./Rains_p50/rain", "./Rains_p90/rain"],
+                   "RainFact": [3, 5]},
+        "runs": [{"name": "sep05", "StartDate": 2024090500},
+                 {"name": "sep06", "StartDate": 2024090600}]
+    }
+
+Every entry of "runs" is combined with every combination of "matrix";
+"set" applies to all runs.
+
+Usage:
+    python run_ensemble.py --spec ensemble.json --cores 32
+    python run_ensemble.py --binary build/iHydroSlide3D --matrix RainFact=3,5,7 --set NLandThread=4
+    python run_ensemble.py --spec ensemble.json --status
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+from control_utils import get_bool, get_int, get_str, parse_control, set_control_value
+
+PARAM_FILES = ["Parameters_parallel.txt", "Parameters_hydro.txt", "Parameters_land.txt"]
+THREAD_KEYS = ["NHydroThread", "NLandThread"]
+STATUS_FILE = "status.json"
+
+# messages printed by the model before it stops with exit status 0
+_ERROR_LINE = re.compile(r"^\s*(\[ERROR\]|Error[:!]|Some errors in your file)", re.MULTILINE)
+
+
+def expand_scenarios(spec):
+    """[(name, {key: value})] of the runs described by spec"""
+    common = spec.get("set", {})
+    matrix = spec.get("matrix", {})
+    runs = spec.get("runs") or [{}]
+    keys = list(matrix)
+    combos = list(itertools.product(*(matrix[key] for key in keys)))
+
+    scenarios = []
+    for run in runs:
+        for combo in combos:
+            settings = dict(common)
+            settings.update(zip(keys, combo))
+            settings.update({key: value for key, value in run.items() if key != "name"})
+            label = run.get("name") or "run"
+            name = f"{len(scenarios):03d}_{label}"
+            scenarios.append((name, {key: str(value) for key, value in settings.items()}))
+    return scenarios
+
+
+class Run:
+    """One scenario: its directory, settings and thread demand"""
+
+    def __init__(self, name, settings, directory):
+        self.name = name
+        self.settings = settings
+        self.directory = directory
+        self.threads = 1
+        self.process = None
+        self.log = None
+        self.started = None
+
+    @property
+    def status_path(self):
+        return os.path.join(self.directory, STATUS_FILE)
+
+    def read_status(self):
+        try:
+            with open(self.status_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_status(self, state, **extra):
+        status = {"name": self.name, "settings": self.settings, "threads": self.threads, "state": state}
+        status.update(extra)
+        tmp = self.status_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(status, f, indent=2)
+        os.replace(tmp, self.status_path)
+
+    def needs_run(self, retry_failed=False):
+        status = self.read_status()
+        if status is None or status.get("settings") != self.settings:
+            return True
+        if status["state"] == "done":
+            return False
+        return status["state"] != "failed" or retry_failed
+
+
+def _rebase(path, project_dir, run_dir):
+    """A path of the project control file as seen from the run directory"""
+    if os.path.isabs(path):
+        return path
+    trailing = path.endswith(("/", "\\"))
+    rebased = os.path.relpath(os.path.join(project_dir, path), run_dir).replace(os.sep, "/")
+    return rebased + "/" if trailing else rebased
+
+
+def _is_path_key(key):
+    return key.upper().endswith("PATH")
+
+
+def prepare_run(run, base_text, project_dir):
+    """Write the control and parameter files of run into a fresh directory"""
+    run_dir = run.directory
+    for sub in ("Results", "logs"):
+        shutil.rmtree(os.path.join(run_dir, sub), ignore_errors=True)
+        os.makedirs(os.path.join(run_dir, sub))
+
+    base = parse_control(base_text.splitlines())
+    param_dir = os.path.join(project_dir, run.settings.get("ParamPath", get_str(base, "ParamPath", "./Params/")))
+    param_texts = {}
+    for name in PARAM_FILES:
+        path = os.path.join(param_dir, name)
+        if os.path.exists(path):
+            with open(path) as f:
+                param_texts[name] = f.read()
+
+    # scenario keys go to the parameter file defining them, else to the control file
+    control_settings = {}
+    for key, value in run.settings.items():
+        for name, text in param_texts.items():
+            if key.upper() in parse_control(text.splitlines()):
+                param_texts[name] = set_control_value(text, key, value)
+                break
+        else:
+            control_settings[key] = value
+
+    text = base_text
+    for key, value in control_settings.items():
+        text = set_control_value(text, key, value)
+    control = parse_control(text.splitlines())
+    for key in control:
+        if _is_path_key(key) and control[key]:
+            text = set_control_value(text, key, _rebase(control[key], project_dir, run_dir))
+    text = set_control_value(text, "ResultPath", "./Results/")
+    text = set_control_value(text, "ParamPath", "./Params/")
+    if get_bool(control, "SaveState", False):
+        # saved states would overwrite each other, so each run keeps its own
+        states = os.path.join(run_dir, "States")
+        shutil.rmtree(states, ignore_errors=True)
+        shutil.copytree(os.path.join(project_dir, get_str(control, "StatePath")), states)
+        text = set_control_value(text, "StatePath", "./States/")
+    with open(os.path.join(run_dir, "Control.Project"), "w") as f:
+        f.write(text)
+
+    run_params = os.path.join(run_dir, "Params")
+    shutil.rmtree(run_params, ignore_errors=True)
+    os.makedirs(run_params)
+    for name in os.listdir(param_dir):
+        source = os.path.join(param_dir, name)
+        target = os.path.join(run_params, name)
+        if name in param_texts:
+            with open(target, "w") as f:
+                f.write(param_texts[name])
+        elif os.path.isfile(source):
+            try:
+                os.symlink(os.path.abspath(source), target)
+            except OSError:
+                shutil.copy2(source, target)
+
+    parallel = parse_control(param_texts.get("Parameters_parallel.txt", "").splitlines())
+    run.threads = max([get_int(parallel, key, 0) for key in THREAD_KEYS] + [1])
+
+
+def run_failed(run, returncode):
+    """Error message of a finished run, or None if it succeeded"""
+    if returncode != 0:
+        return f"exit status {returncode}"
+    try:
+        with open(os.path.join(run.directory, "run.log"), errors="replace") as f:
+            match = _ERROR_LINE.search(f.read())
+    except OSError:
+        return None
+    if match:
+        return "model error: " + match.string[match.start():].splitlines()[0].strip()
+    return None
+
+
+def launch(run, binary):
+    env = dict(os.environ, OMP_NUM_THREADS=str(run.threads))
+    run.log = open(os.path.join(run.directory, "run.log"), "w")
+    run.started = time.time()
+    run.process = subprocess.Popen([binary], cwd=run.directory, env=env,
+                                   stdout=run.log, stderr=subprocess.STDOUT)
+    run.write_status("running", pid=run.process.pid,
+                     start=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run.started)))
+
+
+def finish(run, returncode):
+    run.log.close()
+    elapsed = time.time() - run.started
+    error = run_failed(run, returncode)
+    run.write_status("failed" if error else "done", returncode=returncode,
+                     elapsed=round(elapsed, 1), error=error)
+    print(f"{run.name}: {'FAILED (' + error + ')' if error else 'done'} in {elapsed:.0f} s")
+    return error is None
+
+
+def schedule(runs, binary, cores, poll_interval=0.5):
+    """
+    Run the runs with at most cores threads in use at any time.
+
+    Returns the number of failed runs. On Ctrl-C or SIGTERM the running
+    models are terminated and left in the "running" state, so the next call
+    starts them again.
+    """
+    pending = list(runs)
+    running = []
+    failures = 0
+    try:
+        while pending or running:
+            free = cores - sum(run.threads for run in running)
+            for run in list(pending):
+                if run.threads <= free:
+                    launch(run, binary)
+                    print(f"{run.name}: started with {run.threads} threads")
+                    pending.remove(run)
+                    running.append(run)
+                    free -= run.threads
+            time.sleep(poll_interval)
+            for run in list(running):
+                returncode = run.process.poll()
+                if returncode is not None:
+                    running.remove(run)
+                    failures += not finish(run, returncode)
+    except KeyboardInterrupt:
+        print("Interrupted, stopping the running models; run again to resume")
+        for run in running:
+            run.process.terminate()
+        for run in running:
+            run.process.wait()
+            run.log.close()
+        raise
+    return failures
+
+
+def write_summary(runs, output_dir):
+    """summary.csv with one line per run"""
+    keys = sorted({key for run in runs for key in run.settings})
+    path = os.path.join(output_dir, "summary.csv")
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Run", "State", "Threads", "ReturnCode", "Elapsed_s", "Error"] + keys)
+        for run in runs:
+            status = run.read_status() or {}
+            writer.writerow([run.name, status.get("state", "pending"), run.threads,
+                             status.get("returncode", ""), status.get("elapsed", ""),
+                             status.get("error") or ""] + [run.settings.get(key, "") for key in keys])
+    return path
+
+
+def _parse_assignments(items, multiple):
+    """["KEY=v1,v2"] -> {KEY: [v1, v2]} (or {KEY: v1} if not multiple)"""
+    result = {}
+    for item in items or []:
+        if "=" not in item:
+            raise ValueError(f"expected KEY=VALUE, got {item!r}")
+        key, value = item.split("=", 1)
+        result[key.strip()] = [v.strip() for v in value.split(",")] if multiple else value.strip()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the model for a matrix of scenarios")
+    parser.add_argument("--spec", help="JSON file describing the ensemble")
+    parser.add_argument("--binary", help="model executable (default: from the spec)")
+    parser.add_argument("--control", help="base control file (default: Control.Project)")
+    parser.add_argument("--output", help="ensemble directory (default: Ensemble)")
+    parser.add_argument("--set", nargs="+", metavar="KEY=VALUE", help="setting for every run")
+    parser.add_argument("--matrix", nargs="+", metavar="KEY=V1,V2", help="values to combine")
+    parser.add_argument("--cores", type=int, help="threads available to the runs (default: all cores)")
+    parser.add_argument("--retry-failed", action="store_true", help="run failed runs again")
+    parser.add_argument("--dry-run", action="store_true", help="prepare the run directories only")
+    parser.add_argument("--status", action="store_true", help="print the state of every run and exit")
+    args = parser.parse_args()
+
+    spec = {}
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+    try:
+        spec.setdefault("set", {}).update(_parse_assignments(args.set, False))
+        spec.setdefault("matrix", {}).update(_parse_assignments(args.matrix, True))
+    except ValueError as e:
+        parser.error(str(e))
+
+    # relative paths of the spec are relative to its directory
+    spec_dir = os.path.dirname(os.path.abspath(args.spec)) if args.spec else os.getcwd()
+    control_path = args.control or os.path.join(spec_dir, spec.get("control", "Control.Project"))
+    output_dir = args.output or os.path.join(spec_dir, spec.get("output", "Ensemble"))
+    binary = args.binary or (os.path.join(spec_dir, spec["binary"]) if "binary" in spec else None)
+    cores = args.cores or spec.get("cores") or os.cpu_count() or 1
+
+    project_dir = os.path.dirname(os.path.abspath(control_path))
+    with open(control_path) as f:
+        base_text = f.read()
+    runs = [Run(name, settings, os.path.join(os.path.abspath(output_dir), name))
+            for name, settings in expand_scenarios(spec)]
+
+    if args.status:
+        for run in runs:
+            status = run.read_status() or {}
+            run.threads = status.get("threads", run.threads)
+            print(f"{run.name}: {status.get('state', 'pending')} {status.get('error') or ''}".rstrip())
+        print(f"Summary: {write_summary(runs, output_dir)}")
+        return 0
+
+    if not args.dry_run:
+        if not binary:
+            parser.error("give the model executable with --binary or in the spec")
+        binary = os.path.abspath(binary)
+        if not os.access(binary, os.X_OK):
+            parser.error(f"{binary} is not an executable")
+
+    todo = []
+    for run in runs:
+        os.makedirs(run.directory, exist_ok=True)
+        if not run.needs_run(args.retry_failed):
+            run.threads = run.read_status().get("threads", run.threads)
+            continue
+        prepare_run(run, base_text, project_dir)
+        if run.threads > cores:
+            print(f"Error: {run.name} needs {run.threads} threads, only {cores} cores available")
+            return 1
+        if not args.dry_run:
+            run.write_status("pending")
+        todo.append(run)
+
+    print(f"{len(runs)} runs, {len(runs) - len(todo)} already finished, {len(todo)} to run on {cores} cores")
+    if args.dry_run:
+        for run in todo:
+            print(f"  {run.name}: {run.threads} threads, {run.settings}")
+        return 0
+
+    # a batch scheduler stops jobs with SIGTERM; handle it like Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        failures = schedule(todo, binary, cores)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        print(f"Summary: {write_summary(runs, output_dir)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
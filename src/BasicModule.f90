@@ -50,6 +50,10 @@ module CREST_Project
 
     character(len=10) :: g_ResultFormat
     character(len=200):: g_ResultPath
+    logical          :: g_ResultSWMR ! hdf5 results stacked and written in SWMR mode
+    integer          :: g_ResultBuffer ! steps buffered per variable before a stacked write
+    logical          :: g_ResultWriterThread ! stacked writes on an extra thread
+    logical          :: g_PackedCells ! hdf5 results and states hold only the cells of the masks
 
     character(len=10) :: g_CalibFormat
     character(len=200):: g_CalibPath
@@ -272,6 +276,24 @@ module Landslide_Basic
     integer :: g_NCols_Land
     integer :: g_NRows_Land
     integer :: Npixel_tile, Npixel_residual, ellipsoid_number
+    ! range of the ellipsoids drawn in a tile with adaptive sampling
+    integer :: ellipsoid_min_number, ellipsoid_max_number
+    ! first and last row reached by the ellipsoids of each tile
+    integer, allocatable :: TileRows(:,:)
+
+    ! incremental landslide evaluation: the results of a tile on its rows,
+    ! and the downscaled soil moisture they were computed with
+    type LandTileCache
+        logical :: bValid
+        double precision, allocatable :: SM(:,:)
+        double precision, allocatable :: FS(:,:)
+        double precision, allocatable :: volume(:,:)
+        double precision, allocatable :: area(:,:)
+        double precision, allocatable :: cal_count(:,:)
+        double precision, allocatable :: unstable_count(:,:)
+    end type LandTileCache
+
+    type(LandTileCache), allocatable :: g_TileCache(:)
     integer :: window_extend
     double precision :: g_xllCorner_Land
     double precision :: g_yllCorner_Land
@@ -288,6 +310,10 @@ module Landslide_Basic
     double precision, allocatable :: g_cal_count(:,:)
     double precision, allocatable :: g_unstable_count(:,:)
     double precision :: LandRunTime
+    ! ellipsoids drawn in all tiles and steps, and the number without adaptive sampling
+    integer(kind=8) :: LandEllipsoids, LandEllipsoidsFixed
+    ! tiles evaluated and tiles carried forward by the incremental evaluation
+    integer(kind=8) :: LandTilesRun, LandTilesSkipped
     integer, allocatable :: g_mask_fine(:,:)
 
 
@@ -306,6 +332,25 @@ module LandslideModel_parameters
     integer			 :: ellipse_density
     integer			 :: total_tile_number
     integer	         :: Nthread_Land
+    ! RandomSeed: seed of the ellipsoid random streams, one stream per step and tile
+    integer          :: RandomSeed
+    ! TileSchedule: OpenMP schedule of the tiles (STATIC, DYNAMIC or GUIDED)
+    ! TileChunk: number of tiles a thread takes at a time
+    character(len=200) :: TileSchedule
+    integer          :: TileChunk
+    ! adaptive sampling: a tile stops drawing ellipsoids when none of the
+    ! last stall_ellipses lowered the FS of a pixel and the 95% confidence
+    ! half-width of its failure fraction is below pf_tolerance, drawing
+    ! between min_ellipse_ratio and max_ellipse_ratio times ellipsoid_number
+    logical          :: AdaptiveSampling
+    double precision :: min_ellipse_ratio, max_ellipse_ratio
+    integer          :: stall_ellipses
+    double precision :: pf_tolerance
+    ! incremental evaluation: a tile whose downscaled soil moisture changed
+    ! by at most sm_change_threshold (%) since it was last evaluated keeps
+    ! its results instead of being evaluated again
+    logical          :: IncrementalLandslide
+    double precision :: sm_change_threshold
     double precision :: min_ae, max_ae
     double precision :: min_be, max_be
     double precision :: min_ce, max_ce
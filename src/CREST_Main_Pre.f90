@@ -102,6 +102,8 @@ subroutine ReadProjectFile(bIsError)
     use CREST_Basic
     use SoilDownscale_Basic
     use Landslide_Basic
+    use ResultWriter
+    use Telemetry
 
     implicit none
 
@@ -112,6 +114,7 @@ subroutine ReadProjectFile(bIsError)
     double precision:: dblTemp
     logical :: bIsError
     integer			 :: dtTemp(1:6)
+    type(ResultStorage) :: tStorage
 
     bIsError=.false.
     g_NCols = XXWreadLineInt(g_PrjNP,"NCols_Hydro", error)
@@ -219,6 +222,11 @@ subroutine ReadProjectFile(bIsError)
 
 
     g_ResultPath=XXWReadLineStr(g_PrjNP,"ResultPath", error)
+    g_ResultSWMR=XXWReadLineBln(g_PrjNP,"ResultSWMR", error,"yes")
+    g_ResultBuffer=XXWReadLineInt(g_PrjNP,"ResultBuffer", error)
+    g_ResultWriterThread=XXWReadLineBln(g_PrjNP,"ResultWriterThread", error,"yes")
+    g_PackedCells=XXWReadLineBln(g_PrjNP,"PackedCells", error,"yes")
+    g_Telemetry=XXWReadLineBln(g_PrjNP,"Telemetry", error,"yes")
 
     if(g_sRunStyle(1:4)=="CALI")then
         g_CalibFormat=XXWReadLineStr(g_PrjNP,"CalibFormat",error)
@@ -377,6 +385,23 @@ subroutine ReadProjectFile(bIsError)
                 //trim(g_sGOVarName(i)), &
                 error,"yes")
     end do
+    ! storage of the hdf5 grid outputs: GOType, GOScale, ... for every
+    ! variable, GOType_<Var>, GOScale_<Var>, ... for one of them
+    allocate(g_ResultStorage(lbound(g_sGOVarName,1) &
+            :ubound(g_sGOVarName,1)))
+    call ReadResultStorage("", tStorage)
+    do i=lbound(g_sGOVarName,1),ubound(g_sGOVarName,1)
+        g_ResultStorage(i)=tStorage
+        call ReadResultStorage("_"//trim(g_sGOVarName(i)), g_ResultStorage(i))
+        if(IsResultStorageValid(g_ResultStorage(i)) .eqv. .false.)then
+            write(*,"(1X,A)")  &
+                    "*** Something wrong in the storage settings of GOVar_" // trim(g_sGOVarName(i))
+            write(g_CREST_LogFileID,"(1X,A)")  &
+                    "*** Something wrong in the storage settings of GOVar_" // trim(g_sGOVarName(i))
+            bIsError=.true.
+            return
+        end if
+    end do
     ! Output the specified date
     g_NOutDTs=XXWReadLineInt(g_PrjNP,"NumOfOutputDates", error)
 
@@ -417,6 +442,51 @@ subroutine ReadProjectFile(bIsError)
     return
 end subroutine ReadProjectFile
 
+
+! GOType<Suffix>, GOScale<Suffix>, ... of the project file, the keys that
+! are not there keep the value they have in tStorage
+subroutine ReadResultStorage(sSuffix, tStorage)
+    use CREST_Project
+    use CREST_Basic
+    use ResultWriter
+    implicit none
+    character(*) :: sSuffix
+    type(ResultStorage) :: tStorage
+    character(len=200):: sTemp
+    integer :: error
+
+    sTemp=XXWReadLineStr(g_PrjNP,"GOType"//sSuffix, error)
+    if(len_trim(sTemp)>0)then
+        call UPCASE(sTemp)
+        tStorage%DType=trim(sTemp)
+    end if
+    sTemp=XXWReadLineStr(g_PrjNP,"GOScale"//sSuffix, error)
+    if(len_trim(sTemp)>0)then
+        read(sTemp,*) tStorage%Scale
+    end if
+    sTemp=XXWReadLineStr(g_PrjNP,"GOOffset"//sSuffix, error)
+    if(len_trim(sTemp)>0)then
+        read(sTemp,*) tStorage%Offset
+    end if
+    sTemp=XXWReadLineStr(g_PrjNP,"GOChunkRows"//sSuffix, error)
+    if(len_trim(sTemp)>0)then
+        read(sTemp,*) tStorage%ChunkRows
+    end if
+    sTemp=XXWReadLineStr(g_PrjNP,"GOChunkSteps"//sSuffix, error)
+    if(len_trim(sTemp)>0)then
+        read(sTemp,*) tStorage%ChunkSteps
+    end if
+    sTemp=XXWReadLineStr(g_PrjNP,"GOFilter"//sSuffix, error)
+    if(len_trim(sTemp)>0)then
+        call UPCASE(sTemp)
+        tStorage%Filter=trim(sTemp)
+    end if
+    sTemp=XXWReadLineStr(g_PrjNP,"GOLevel"//sSuffix, error)
+    if(len_trim(sTemp)>0)then
+        read(sTemp,*) tStorage%Level
+    end if
+end subroutine ReadResultStorage
+
 ! read the basic files, e.g., DEM, FDR, FAC....
 subroutine ReadBasicFile(bIsError)
     use CREST_Project
@@ -954,6 +1024,40 @@ subroutine ReadParamFile()
 
         ! here cell_size is the resolution of the landslide map in unit of m
         CellSize_LandInM = XXWReadLineDbl(fileName,"cell_size", error)
+
+        ! adaptive sampling of the ellipsoids, off by default
+        AdaptiveSampling = XXWReadLineBln(fileName,"adaptive_sampling", error,"yes")
+        if (AdaptiveSampling) then
+            min_ellipse_ratio = XXWReadLineDbl(fileName,"min_ellipse_ratio", error)
+            max_ellipse_ratio = XXWReadLineDbl(fileName,"max_ellipse_ratio", error)
+            stall_ellipses = XXWreadLineInt(fileName,"stall_ellipses", error)
+            pf_tolerance = XXWReadLineDbl(fileName,"pf_tolerance", error)
+            if (min_ellipse_ratio <= 0) then
+                min_ellipse_ratio = 0.25
+            end if
+            if (max_ellipse_ratio <= 0) then
+                max_ellipse_ratio = 1.0
+            end if
+            if (stall_ellipses <= 0) then
+                stall_ellipses = 200
+            end if
+            if (pf_tolerance <= 0) then
+                pf_tolerance = 0.02
+            end if
+            if (min_ellipse_ratio > max_ellipse_ratio) then
+                write(*,*) "Error: min_ellipse_ratio is larger than max_ellipse_ratio"
+                stop
+            end if
+        end if
+
+        ! incremental evaluation of the tiles, off by default
+        IncrementalLandslide = XXWReadLineBln(fileName,"incremental_landslide", error,"yes")
+        if (IncrementalLandslide) then
+            sm_change_threshold = XXWReadLineDbl(fileName,"sm_change_threshold", error)
+            if (sm_change_threshold < 0) then
+                sm_change_threshold = 0
+            end if
+        end if
         
     end if
     ! read the parallel setup
@@ -972,6 +1076,28 @@ subroutine ReadParamFile()
         total_tile_number = XXWreadLineInt(fileName,"Tot_tile", error)
         Nthread_Land = XXWreadLineInt(fileName,"NLandThread", error)
 
+        ! the same seed gives the same landslide maps with any number of threads
+        RandomSeed = XXWreadLineInt(fileName,"RandomSeed", error)
+        if (RandomSeed < 0) then
+            ! a new seed for every run; it is logged so the run can be repeated
+            call system_clock(RandomSeed)
+            RandomSeed = mod(RandomSeed, huge(RandomSeed))
+        end if
+        TileSchedule = XXWReadLineStr(fileName,"TileSchedule", error)
+        call UPCASE(TileSchedule)
+        if (trim(TileSchedule) == "") then
+            TileSchedule = "DYNAMIC"
+        end if
+        TileChunk = XXWreadLineInt(fileName,"TileChunk", error)
+        if (TileChunk < 1) then
+            TileChunk = 1
+        end if
+        if (trim(TileSchedule) /= "STATIC" .and. trim(TileSchedule) /= "DYNAMIC" &
+                .and. trim(TileSchedule) /= "GUIDED") then
+            write(*,*) "Error: TileSchedule must be static, dynamic or guided, not ", trim(TileSchedule)
+            stop
+        end if
+
     end if
 
 
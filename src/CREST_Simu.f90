@@ -8,6 +8,8 @@ subroutine CREST_Simu()
     use SoilDownscale_Basic
     use Landslide_Basic
     use LandslideModel_parameters
+    use ResultWriter
+    use Telemetry
 
     implicit none
     double precision :: NSCE, Bias, CC
@@ -16,7 +18,7 @@ subroutine CREST_Simu()
     integer :: RS_SumLoop_start, RS_SumLoop_end, RI_SumLoop_start, RI_SumLoop_end
     integer :: dtTemp(1:6)
     double precision :: HydroTime_start, HydroTime_end
-    logical :: bIsError
+    logical :: bIsError, bWriterThread
     character(14):: strDate
     character(50):: sTemp
     character(len=3):: i_basin_str
@@ -124,6 +126,10 @@ subroutine CREST_Simu()
     ! initial the time tic
     HydroRunTime = 0
     LandRunTime = 0
+    LandEllipsoids = 0
+    LandEllipsoidsFixed = 0
+    LandTilesRun = 0
+    LandTilesSkipped = 0
 
     g_ITMax=myDdIFf(g_TimeMark, g_StartDate, g_EndDate)  &
             / g_TimeStep + 1
@@ -235,10 +241,21 @@ subroutine CREST_Simu()
 
     dtTemp=g_StartDate
 
+    if (g_Telemetry) then
+        call TelemetryOpen(trim(g_ResultPath)//"telemetry.jsonl")
+    end if
 
+    ! with ResultWriterThread the loop runs on the master of a team of two
+    ! threads, the other one writes the buffered hdf5 results (ResultWriter)
+    bWriterThread = g_ResultWriterThread .and. trim(g_ResultFormat)=="HDF5"
+    if (bWriterThread) then
+        call omp_set_max_active_levels(2)
+    end if
 
-
+    !$OMP PARALLEL NUM_THREADS(2) IF(bWriterThread) DEFAULT(SHARED)
+    !$OMP MASTER
     do k=0, ITMax-1
+        call TelemetryStartStep()
         strDate=myDtoStr(dtTemp, g_TimeMark)
 
         P_monitor = (k+1) * 100 / ITMax * 100 / 100
@@ -301,6 +318,7 @@ subroutine CREST_Simu()
                 end where
             end if
         end if
+        call TelemetryMark(TEL_FORCING)
         
         ! calculate the hydrological state of channel pixels
         do i = 1, Npixel_channel
@@ -352,6 +370,7 @@ subroutine CREST_Simu()
 
 
         end do
+        call TelemetryMark(TEL_CHANNEL)
 
 
 
@@ -518,6 +537,7 @@ subroutine CREST_Simu()
         elsewhere
             g_SM = g_NoData_Value
         end where
+        call TelemetryMark(TEL_HYDRO)
 
         ! do the soil downscaling process
         if (g_ModelCore == 3) then
@@ -534,14 +554,18 @@ subroutine CREST_Simu()
             g_unstable_count = 0
             if (g_NOutDTs == 0) then
                 call SoilDownscale_pre(g_SM)
-                call Landslide_module()
+                call TelemetryMark(TEL_DOWNSCALE)
+                call Landslide_module(k)
+                call TelemetryMark(TEL_LANDSLIDE)
 
             else
                 ! only activate the
                 Do i=lbound(g_OutDTIndex,1), ubound(g_OutDTIndex,1)
                     if(g_OutDTIndex(i)==k)then
                         call SoilDownscale_pre(g_SM)
-                        call Landslide_module()
+                        call TelemetryMark(TEL_DOWNSCALE)
+                        call Landslide_module(k)
+                        call TelemetryMark(TEL_LANDSLIDE)
                     end if
                 end do
 
@@ -601,12 +625,16 @@ subroutine CREST_Simu()
 
         end if
 
+        call TelemetryMark(TEL_EXPORT)
+
         if(g_RunStyle==2)then
             ii=g_tCalibSta(g_RegNum)%Row
             jj=g_tCalibSta(g_RegNum)%Col
             g_tCalibSta(g_RegNum)%RSim(k)=Runoff(jj,ii)
         end if
 
+        call TelemetryEndStep(k, strDate, Nthread_hydro, merge(Nthread_Land, 0, g_ModelCore == 3), &
+                trim(g_ResultPath)//"Result_all.h5")
         call myDAdd(g_TimeMark,g_TimeStep,dtTemp)
 
 
@@ -615,6 +643,12 @@ subroutine CREST_Simu()
 
     end do !End loop
 
+    ! the stacked result file stays open during the loop
+    call CloseResultFile()
+    call TelemetryClose()
+    !$OMP END MASTER
+    !$OMP END PARALLEL
+
 
 
     if(g_RunStyle/=2)then
@@ -658,6 +692,16 @@ subroutine CREST_Simu()
     write(g_CREST_LogFileID,*)"Landslide runtime (s): ", LandRunTime
     write(*,*)"Hydrological runtime (s): ", HydroRunTime
     write(*,*)"Landslide runtime (s): ", LandRunTime
+    if (g_ModelCore == 3 .and. AdaptiveSampling) then
+        write(g_CREST_LogFileID,*)"Landslide ellipsoids (adaptive, fixed): ", &
+                LandEllipsoids, LandEllipsoidsFixed
+        write(*,*)"Landslide ellipsoids (adaptive, fixed): ", LandEllipsoids, LandEllipsoidsFixed
+    end if
+    if (g_ModelCore == 3 .and. IncrementalLandslide) then
+        write(g_CREST_LogFileID,*)"Landslide tiles (evaluated, carried forward): ", &
+                LandTilesRun, LandTilesSkipped
+        write(*,*)"Landslide tiles (evaluated, carried forward): ", LandTilesRun, LandTilesSkipped
+    end if
 
     ! deallocate
     deallocate(OneRowA)
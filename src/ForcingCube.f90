@@ -0,0 +1,281 @@
+!ForcingCube---------------------------------------------------
+! Read Rain/PET frames from the HDF5 cubes written by pack_forcing.py
+! (RainFormat/PETFormat = hdf5). A cube <Path>.h5 holds
+!   Data (NCols, NRows, NTimes) with the ASC header as attributes
+!   Time (NTimes)               date digits of every step
+! or, for cubes packed with a mask (pack_forcing.py --mask),
+!   Data (NCells, NTimes) the cells where Mask is 1, column by column
+!   Mask (NCols, NRows)
+! The Time vector of each cube is read once and kept; every step only
+! reads the hyperslab of its own frame.
+! With ResultWriterThread the HDF5 calls must not run while the writer
+! task does. When a result buffer is handed to the writer, the frames of
+! the steps it will take to fill the next buffer are read ahead in one
+! hyperslab (PrefetchForcingCubes, the g_ResultIdleHook of ResultWriter),
+! so the steps read their forcing from memory and never wait for the task.
+module ForcingCube
+    use hdf5
+    use hdf5_utils
+    use ResultWriter, only: WaitResultWriter, g_ResultIdleHook, g_ResultNBufferSteps
+    implicit none
+
+    integer, parameter :: MaxForcingCubes = 4
+
+    type ForcingCubeIndex
+        character(len=200) :: FileName = ""
+        integer :: NCols, NRows, NTimes
+        double precision :: XLLCorner, YLLCorner, CellSize, NoData_Value
+        double precision, allocatable :: Times(:)
+        integer :: NCells = 0                 ! >0 for packed cubes
+        logical, allocatable :: Valid(:,:)    ! Mask/=0 of packed cubes
+        integer :: LastStep = 0
+        ! steps AheadFirst.. AheadFirst+NAhead-1 read ahead, one per column
+        ! of (NCells or NCols*NRows) values
+        double precision, allocatable :: Ahead(:,:)
+        integer :: AheadFirst = 0
+        integer :: NAhead = 0
+    end type ForcingCubeIndex
+
+    type(ForcingCubeIndex), save :: g_ForcingCubes(MaxForcingCubes)
+    integer, save :: g_NForcingCubes = 0
+
+contains
+
+    ! position of FileName in g_ForcingCubes, reading its index the first time
+    integer function OpenForcingCube(FileName, bIsError)
+        character(*) :: FileName
+        logical :: bIsError
+        integer(HID_T) :: file_id
+        integer :: i, dims(1)
+        integer, allocatable :: Mask(:,:)
+        logical :: fExist
+
+        bIsError=.false.
+        do i=1, g_NForcingCubes
+            if(trim(g_ForcingCubes(i)%FileName)==trim(FileName))then
+                OpenForcingCube=i
+                return
+            end if
+        end do
+
+        OpenForcingCube=0
+        inquire(file=trim(FileName), exist=fExist)
+        if(fExist .eqv. .false.)then
+            write(*,*) "Forcing cube not found: " // trim(FileName)
+            bIsError=.true.
+            return
+        end if
+        if(g_NForcingCubes==MaxForcingCubes)then
+            write(*,*) "Too many forcing cubes open: " // trim(FileName)
+            bIsError=.true.
+            return
+        end if
+
+        g_NForcingCubes=g_NForcingCubes+1
+        i=g_NForcingCubes
+        g_ForcingCubes(i)%FileName=trim(FileName)
+        g_ResultIdleHook => PrefetchForcingCubes
+
+        call hdf_set_print_messages(.false.)
+        ! HDF5 is not thread safe, let the result writer finish first
+        call WaitResultWriter()
+        call hdf_open_file(file_id, trim(FileName), STATUS='OLD', ACTION='READ')
+        call hdf_read_attribute(file_id, "Data", "NCols", g_ForcingCubes(i)%NCols)
+        call hdf_read_attribute(file_id, "Data", "NRows", g_ForcingCubes(i)%NRows)
+        call hdf_read_attribute(file_id, "Data", "XLLCorner", g_ForcingCubes(i)%XLLCorner)
+        call hdf_read_attribute(file_id, "Data", "YLLCorner", g_ForcingCubes(i)%YLLCorner)
+        call hdf_read_attribute(file_id, "Data", "CellSize", g_ForcingCubes(i)%CellSize)
+        call hdf_read_attribute(file_id, "Data", "NoData_Value", g_ForcingCubes(i)%NoData_Value)
+        call hdf_get_dims(file_id, "Time", dims)
+        g_ForcingCubes(i)%NTimes=dims(1)
+        allocate(g_ForcingCubes(i)%Times(dims(1)))
+        call hdf_read_dataset(file_id, "Time", g_ForcingCubes(i)%Times)
+        if(hdf_exists(file_id, "Mask"))then
+            allocate(Mask(g_ForcingCubes(i)%NCols, g_ForcingCubes(i)%NRows))
+            call hdf_read_dataset(file_id, "Mask", Mask)
+            g_ForcingCubes(i)%Valid=(Mask/=0)
+            g_ForcingCubes(i)%NCells=count(g_ForcingCubes(i)%Valid)
+            deallocate(Mask)
+        end if
+        call hdf_close_file(file_id)
+
+        OpenForcingCube=i
+        return
+    end function OpenForcingCube
+
+    ! step of the cube holding strDate, 0 if there is none
+    integer function FindForcingStep(iCube, strDate)
+        integer :: iCube
+        character(*) :: strDate
+        double precision :: dDate
+        integer :: k, ios
+
+        FindForcingStep=0
+        read(strDate,*,iostat=ios) dDate
+        if(ios/=0)then
+            return
+        end if
+
+        associate(cube => g_ForcingCubes(iCube))
+            ! steps are read in order, so the next one is tried first
+            k=cube%LastStep+1
+            if(k>=1 .and. k<=cube%NTimes)then
+                if(cube%Times(k)==dDate)then
+                    FindForcingStep=k
+                end if
+            end if
+            if(FindForcingStep==0)then
+                do k=1, cube%NTimes
+                    if(cube%Times(k)==dDate)then
+                        FindForcingStep=k
+                        exit
+                    end if
+                end do
+            end if
+            if(FindForcingStep/=0)then
+                cube%LastStep=FindForcingStep
+            end if
+        end associate
+        return
+    end function FindForcingStep
+
+    subroutine ReadForcingCube(FileName, strDate, dblMatBig, &
+            NCols, NRows, XLLCorner, YLLCorner, &
+            CellSize, NoData_Value, bIsError)
+        character(*) :: FileName, strDate
+        double precision, allocatable :: dblMatBig(:,:)
+        integer :: NCols, NRows
+        double precision :: XLLCorner, YLLCorner, CellSize, NoData_Value
+        logical :: bIsError
+
+        integer :: iCube, iStep, iAhead
+
+        iCube=OpenForcingCube(FileName, bIsError)
+        if(bIsError .eqv. .true.)then
+            return
+        end if
+        iStep=FindForcingStep(iCube, strDate)
+        if(iStep==0)then
+            bIsError=.true.
+            return
+        end if
+
+        NCols=g_ForcingCubes(iCube)%NCols
+        NRows=g_ForcingCubes(iCube)%NRows
+        XLLCorner=g_ForcingCubes(iCube)%XLLCorner
+        YLLCorner=g_ForcingCubes(iCube)%YLLCorner
+        CellSize=g_ForcingCubes(iCube)%CellSize
+        NoData_Value=g_ForcingCubes(iCube)%NoData_Value
+
+        allocate(dblMatBig(0:NCols-1,0:NRows-1))
+
+        associate(cube => g_ForcingCubes(iCube))
+            if(iStep>=cube%AheadFirst .and. iStep<cube%AheadFirst+cube%NAhead)then
+                iAhead=iStep-cube%AheadFirst+1
+            else
+                iAhead=1
+                if(allocated(cube%Ahead))then
+                    deallocate(cube%Ahead)
+                end if
+                cube%NAhead=0
+                allocate(cube%Ahead(CubeFrameSize(iCube), 1))
+                call WaitResultWriter()
+                call ReadCubeSteps(iCube, iStep, 1, cube%Ahead, bIsError)
+            end if
+            if(bIsError .eqv. .false.)then
+                if(cube%NCells>0)then
+                    ! the cells of the step, put back on the grid
+                    dblMatBig=unpack(cube%Ahead(:,iAhead), cube%Valid, NoData_Value)
+                else
+                    dblMatBig=reshape(cube%Ahead(:,iAhead), (/ NCols, NRows /))
+                end if
+            end if
+        end associate
+
+        if(bIsError .eqv. .true.)then
+            deallocate(dblMatBig)
+        end if
+        return
+    end subroutine ReadForcingCube
+
+    ! values of one frame of a cube: its cells, or the whole grid
+    integer function CubeFrameSize(iCube)
+        integer :: iCube
+
+        if(g_ForcingCubes(iCube)%NCells>0)then
+            CubeFrameSize=g_ForcingCubes(iCube)%NCells
+        else
+            CubeFrameSize=g_ForcingCubes(iCube)%NCols*g_ForcingCubes(iCube)%NRows
+        end if
+    end function CubeFrameSize
+
+    ! read NSteps frames from step iFirst on, one per column of Values
+    subroutine ReadCubeSteps(iCube, iFirst, NSteps, Values, bIsError)
+        integer :: iCube, iFirst, NSteps
+        double precision :: Values(:,:)
+        logical :: bIsError
+
+        integer :: hdferror
+        integer(HID_T) :: file_id, dset_id, dspace_id, mspace_id
+        integer(HSIZE_T) :: hs_offset(3), hs_count(3), mdims(2)
+
+        associate(cube => g_ForcingCubes(iCube))
+            call hdf_open_file(file_id, trim(cube%FileName), STATUS='OLD', ACTION='READ')
+            call h5dopen_f(file_id, "Data", dset_id, hdferror)
+            call h5dget_space_f(dset_id, dspace_id, hdferror)
+            if(cube%NCells>0)then
+                hs_offset(1:2)=(/ 0_HSIZE_T, int(iFirst-1, HSIZE_T) /)
+                hs_count(1:2)=(/ int(cube%NCells, HSIZE_T), int(NSteps, HSIZE_T) /)
+                call h5sselect_hyperslab_f(dspace_id, H5S_SELECT_SET_F, hs_offset(1:2), hs_count(1:2), hdferror)
+            else
+                hs_offset=(/ 0_HSIZE_T, 0_HSIZE_T, int(iFirst-1, HSIZE_T) /)
+                hs_count=(/ int(cube%NCols, HSIZE_T), int(cube%NRows, HSIZE_T), int(NSteps, HSIZE_T) /)
+                call h5sselect_hyperslab_f(dspace_id, H5S_SELECT_SET_F, hs_offset, hs_count, hdferror)
+            end if
+            ! the frames side by side, the same values in the same order
+            mdims=(/ int(CubeFrameSize(iCube), HSIZE_T), int(NSteps, HSIZE_T) /)
+            call h5screate_simple_f(2, mdims, mspace_id, hdferror)
+            call h5dread_f(dset_id, H5T_NATIVE_DOUBLE, Values, mdims, hdferror, mspace_id, dspace_id)
+            if(hdferror/=0)then
+                write(*,*) "Some errors in your file: " // trim(cube%FileName)
+                bIsError=.true.
+            end if
+            call h5sclose_f(mspace_id, hdferror)
+            call h5sclose_f(dspace_id, hdferror)
+            call h5dclose_f(dset_id, hdferror)
+            call hdf_close_file(file_id)
+        end associate
+    end subroutine ReadCubeSteps
+
+    ! read ahead the frames of the next g_ResultNBufferSteps steps of every
+    ! cube; called by FlushResultBuffer while no write task runs
+    subroutine PrefetchForcingCubes()
+        integer :: i, NSteps
+        logical :: bIsError
+
+        do i=1, g_NForcingCubes
+            associate(cube => g_ForcingCubes(i))
+                NSteps=min(g_ResultNBufferSteps, cube%NTimes-cube%LastStep)
+                cube%NAhead=0
+                if(NSteps<=0)then
+                    cycle
+                end if
+                if(allocated(cube%Ahead))then
+                    if(size(cube%Ahead, 2)/=NSteps)then
+                        deallocate(cube%Ahead)
+                    end if
+                end if
+                if(.not. allocated(cube%Ahead))then
+                    allocate(cube%Ahead(CubeFrameSize(i), NSteps))
+                end if
+                bIsError=.false.
+                call ReadCubeSteps(i, cube%LastStep+1, NSteps, cube%Ahead, bIsError)
+                if(bIsError .eqv. .false.)then
+                    cube%AheadFirst=cube%LastStep+1
+                    cube%NAhead=NSteps
+                end if
+            end associate
+        end do
+    end subroutine PrefetchForcingCubes
+
+end module ForcingCube
@@ -1,14 +1,18 @@
 
 
-subroutine Landslide_module()
+! step: index of the time step, which selects the random streams of the tiles
+subroutine Landslide_module(step)
+    use CREST_Project
     use CREST_Basic
     use Landslide_Basic
     use LandslideModel_parameters
     use SoilDownscale_Basic
+    use Telemetry
     use OMP_LIB
 
     implicit none
 
+    integer, intent(in) :: step
     integer :: i, j, i_tile, i_ellipsoid, i_window, j_window,&
                  i_return, i_LandMap, j_LandMap, random_center
     integer :: iLoc_coarse, jLoc_coarse, count_ellipse
@@ -43,6 +47,17 @@ subroutine Landslide_module()
     double precision :: x_ellipsoid, y_ellipsoid, z_ellipsoid
     double precision, allocatable :: D_raster(:), SM_InEllipse(:), z_ellipsoid_In(:)
     double precision :: FS_3D, volumn_sum, area_sum
+    ! stream: key of the random draws of one ellipsoid (seed, step, tile, ellipsoid)
+    integer :: stream(4)
+    ! adaptive sampling: ellipsoids drawn in each tile, FS of the pixels
+    ! reached by the tile so far, and the convergence state of the tile
+    integer, allocatable :: tile_draws(:)
+    double precision, allocatable :: FS_tile(:,:)
+    integer :: i_first, i_last, n_valid, n_unstable, last_change
+    double precision :: p_unstable
+    ! incremental evaluation: 1 for the tiles carried forward in this step
+    integer, allocatable :: tile_skipped(:)
+    double precision :: TileTime_start
     ! the tiles include the all tiles in ValidPixel_matrix and the final one
     ! in ValidPixel_matrix_residual
     allocate(ValidPixel_matrix_tile(Npixel_tile, 2))
@@ -52,6 +67,31 @@ subroutine Landslide_module()
     ValidPixel_matrix_tile = g_NoData_Value
     ValidPixel_matrix_ResiduleTile = g_NoData_Value
 
+    allocate(tile_draws(total_tile_number + 1))
+    tile_draws = 0
+    allocate(tile_skipped(total_tile_number + 1))
+    tile_skipped = 0
+    if (g_Telemetry) then
+        call TelemetryTiles(total_tile_number + 1)
+    end if
+
+    ! the pixels are updated with atomic min/max, so mark the pixels not
+    ! calculated yet with the largest FS instead of NoData
+    where (g_FS_3D == g_NoData_Value)
+        g_FS_3D = huge(FS_3D)
+    end where
+
+    ! the tiles differ a lot in cost, so by default a thread takes the next
+    ! tile when it is done instead of a fixed share of them
+    select case (trim(TileSchedule))
+    case ("STATIC")
+        call omp_set_schedule(omp_sched_static, TileChunk)
+    case ("GUIDED")
+        call omp_set_schedule(omp_sched_guided, TileChunk)
+    case default
+        call omp_set_schedule(omp_sched_dynamic, TileChunk)
+    end select
+
     ! record the time
     LandTime_start = OMP_get_wtime()
     !-------------landslide parallel region start-----------------
@@ -63,8 +103,11 @@ subroutine Landslide_module()
     !$OMP&  g_NCols, g_NRows, g_NRows_Land, g_NCols_Land,g_CellSize_Land, g_yllCorner, g_CellSize, &
     !$OMP&  g_xllCorner_Land, g_yllCorner_Land, g_xllCorner, g_NoData_Value, &
     !$OMP&  g_cal_count, g_unstable_count, g_failure_volume, g_failure_area, &
-    !$OMP&  g_FS_3D, c_e) DEFAULT(PRIVATE)
-    !$OMP DO
+    !$OMP&  g_FS_3D, RandomSeed, step, AdaptiveSampling, ellipsoid_min_number, &
+    !$OMP&  ellipsoid_max_number, stall_ellipses, pf_tolerance, tile_draws, &
+    !$OMP&  TileRows, IncrementalLandslide, sm_change_threshold, g_TileCache, tile_skipped, &
+    !$OMP&  LandTime_start, g_Telemetry, g_TelTileThread, g_TelTileStart, g_TelTileSeconds) DEFAULT(PRIVATE)
+    !$OMP DO SCHEDULE(RUNTIME)
     do i_tile = 1, (total_tile_number + 1)
 !        print *, i_tile
 !        print '("Thread: ", i0)', omp_get_thread_num()
@@ -75,12 +118,66 @@ subroutine Landslide_module()
             ValidPixel_matrix_ResiduleTile = ValidPixel_matrix_residual
         end if
 
-        
-        do i_ellipsoid = 1, ellipsoid_number
+        ! which thread runs the tile, when and how long
+        TileTime_start = OMP_get_wtime()
+        if (g_Telemetry) then
+            g_TelTileThread(i_tile) = omp_get_thread_num()
+            g_TelTileStart(i_tile) = TileTime_start - LandTime_start
+        end if
+
+        ! the ellipsoids of a tile reach the rows of the tile and
+        ! window_extend rows around them
+        i_first = TileRows(i_tile, 1)
+        i_last = TileRows(i_tile, 2)
+
+        if (IncrementalLandslide) then
+            ! carry the results of the tile forward when the soil moisture
+            ! of its rows hardly changed since it was last evaluated
+            if (g_TileCache(i_tile)%bValid) then
+                if (maxval(abs(g_SM_fine(:, i_first:i_last) - g_TileCache(i_tile)%SM)) &
+                        <= sm_change_threshold) then
+                    tile_skipped(i_tile) = 1
+                    cycle
+                end if
+            end if
+            g_TileCache(i_tile)%SM = g_SM_fine(:, i_first:i_last)
+            g_TileCache(i_tile)%FS = huge(FS_3D)
+            g_TileCache(i_tile)%volume = g_NoData_Value
+            g_TileCache(i_tile)%area = g_NoData_Value
+            g_TileCache(i_tile)%cal_count = 0
+            g_TileCache(i_tile)%unstable_count = 0
+            g_TileCache(i_tile)%bValid = .true.
+        end if
+
+        if (AdaptiveSampling) then
+            allocate(FS_tile(0:g_NCols_Land-1, i_first:i_last))
+            FS_tile = huge(FS_3D)
+            n_valid = 0
+            n_unstable = 0
+            last_change = 0
+        end if
+
+        do i_ellipsoid = 1, ellipsoid_max_number
+
+            ! adaptive sampling: stop when the tile has settled. Only the
+            ! ellipsoids of this tile are used, so the stop does not depend
+            ! on the other tiles or on the threads
+            if (AdaptiveSampling .and. i_ellipsoid > ellipsoid_min_number) then
+                ! 95% confidence half-width of the failure fraction of the
+                ! tile (Agresti-Coull, also defined without failures)
+                p_unstable = (n_unstable + 2d0) / (n_valid + 4d0)
+                if (i_ellipsoid - 1 - last_change >= stall_ellipses .and. &
+                        1.96d0 * SQRT(p_unstable * (1 - p_unstable) / (n_valid + 4d0)) <= pf_tolerance) then
+                    exit
+                end if
+            end if
+
+            ! the draws of this ellipsoid do not depend on the thread running the tile
+            stream = (/ RandomSeed, step, i_tile, i_ellipsoid /)
 
             ! get the random center in tile
             if (i_tile <= total_tile_number) then
-                call random_uniform_int(0, Npixel_tile, random_center)
+                call random_uniform_int(0, Npixel_tile, stream, 1, random_center)
                 ! make sure the random value won't exceed the range
                 if (random_center > Npixel_tile) then
                     random_center = Npixel_tile
@@ -90,7 +187,7 @@ subroutine Landslide_module()
 
                 end if
             else
-                call random_uniform_int(0, Npixel_residual, random_center)
+                call random_uniform_int(0, Npixel_residual, stream, 1, random_center)
                 ! make sure the random value won't exceed the range
                 if (random_center > Npixel_residual) then
                     random_center = Npixel_residual
@@ -102,9 +199,9 @@ subroutine Landslide_module()
 
 
             ! get the random length and width of ellipsoid
-            call random_uniform_float(min_ae, max_ae, a_e)
-            call random_uniform_float(min_be, max_be, b_e)
-            call random_uniform_float(min_ce, max_ce, c_e)
+            call random_uniform_float(min_ae, max_ae, stream, 2, a_e)
+            call random_uniform_float(min_be, max_be, stream, 3, b_e)
+            call random_uniform_float(min_ce, max_ce, stream, 4, c_e)
 
             ! Note: i, j in ValidPixel_matrix_tile is the index
             ! in g_mask_fine, i.e.,
@@ -264,7 +361,13 @@ subroutine Landslide_module()
                     i_LandMap = i + (i_window - window_extend - 1)
                     j_LandMap = j + (j_window - window_extend - 1)
 
-                    g_cal_count(j_LandMap, i_LandMap) = g_cal_count(j_LandMap, i_LandMap) + 1
+                    if (IncrementalLandslide) then
+                        g_TileCache(i_tile)%cal_count(j_LandMap, i_LandMap) = &
+                                g_TileCache(i_tile)%cal_count(j_LandMap, i_LandMap) + 1
+                    else
+                        !$OMP ATOMIC UPDATE
+                        g_cal_count(j_LandMap, i_LandMap) = g_cal_count(j_LandMap, i_LandMap) + 1
+                    end if
 
                     z_grid = z_single_all(j_window, i_window)
                     x_transition = all_x_transition(j_window, i_window)
@@ -321,6 +424,12 @@ subroutine Landslide_module()
                     ellipse_i, ellipse_j, window_extend, &
                     main_aspect, main_slope, c_e)
 
+            if (AdaptiveSampling) then
+                n_valid = n_valid + 1
+                if (FS_3D < 1) then
+                    n_unstable = n_unstable + 1
+                end if
+            end if
 
             ! update FS_3D value in regional FS map
 
@@ -329,34 +438,52 @@ subroutine Landslide_module()
                 i_LandMap = i + (ellipse_i(i_return) - window_extend - 1)
                 j_LandMap = j + (ellipse_j(i_return) - window_extend - 1)
 
-                ! count the unstable situation
-                if (FS_3D < 1) then
-
-                    g_unstable_count(j_LandMap, i_LandMap) = &
-                            g_unstable_count(j_LandMap, i_LandMap) + 1
-                    ! update the volume map (seek the maximum volume)
-                    if (g_failure_volume(j_LandMap, i_LandMap) < volumn_sum ) then
-                        g_failure_volume(j_LandMap, i_LandMap) = volumn_sum
+                if (IncrementalLandslide) then
+                    ! the results of the tile alone, combined with the
+                    ! other tiles after the parallel region
+                    if (FS_3D < 1) then
+                        g_TileCache(i_tile)%unstable_count(j_LandMap, i_LandMap) = &
+                                g_TileCache(i_tile)%unstable_count(j_LandMap, i_LandMap) + 1
+                        g_TileCache(i_tile)%volume(j_LandMap, i_LandMap) = &
+                                max(g_TileCache(i_tile)%volume(j_LandMap, i_LandMap), volumn_sum)
+                        g_TileCache(i_tile)%area(j_LandMap, i_LandMap) = &
+                                max(g_TileCache(i_tile)%area(j_LandMap, i_LandMap), area_sum)
                     end if
+                    g_TileCache(i_tile)%FS(j_LandMap, i_LandMap) = &
+                            min(g_TileCache(i_tile)%FS(j_LandMap, i_LandMap), FS_3D)
 
-                    if (g_failure_area(j_LandMap, i_LandMap) < area_sum ) then
-                        g_failure_area(j_LandMap, i_LandMap) = area_sum
-                    end if
+                else
+                    ! the tiles overlap at their borders, so the pixels are
+                    ! updated atomically; counts, maxima and minima do not
+                    ! depend on the order of the updates
+                    ! count the unstable situation
+                    if (FS_3D < 1) then
+
+                        !$OMP ATOMIC UPDATE
+                        g_unstable_count(j_LandMap, i_LandMap) = &
+                                g_unstable_count(j_LandMap, i_LandMap) + 1
+                        ! update the volume map (seek the maximum volume)
+                        !$OMP ATOMIC UPDATE
+                        g_failure_volume(j_LandMap, i_LandMap) = &
+                                max(g_failure_volume(j_LandMap, i_LandMap), volumn_sum)
+
+                        !$OMP ATOMIC UPDATE
+                        g_failure_area(j_LandMap, i_LandMap) = &
+                                max(g_failure_area(j_LandMap, i_LandMap), area_sum)
 
+                    end if
+                    ! keep the smaller FS of the previous and the current landslide
+                    !$OMP ATOMIC UPDATE
+                    g_FS_3D(j_LandMap, i_LandMap) = min(g_FS_3D(j_LandMap, i_LandMap), FS_3D)
                 end if
-                ! compare the previous FS and new FS for pixel
-                if (g_FS_3D(j_LandMap, i_LandMap) == g_NoData_Value ) then 
-                    ! The pixel is calculated for the first time
-                    g_FS_3D(j_LandMap, i_LandMap) = FS_3D
-                else
-                    ! The pixel has been counted at least once and needs to be calculated iteratively
-                    ! get the smaller FS
-                    if ( g_FS_3D(j_LandMap, i_LandMap) > FS_3D ) then
-                        ! and the FS value is smaller than current landslide.
-                        ! So keep the old value and go to the next loop
-                        g_FS_3D(j_LandMap, i_LandMap) =  FS_3D
+
+                ! a new pixel or a lower FS in the tile: not settled yet
+                if (AdaptiveSampling) then
+                    if (FS_3D < FS_tile(j_LandMap, i_LandMap)) then
+                        FS_tile(j_LandMap, i_LandMap) = FS_3D
+                        last_change = i_ellipsoid
                     end if
-                end if 
+                end if
 
 
             end do
@@ -370,14 +497,70 @@ subroutine Landslide_module()
             
 
         end do
+        ! the loop ends with i_ellipsoid one past the last ellipsoid drawn
+        tile_draws(i_tile) = i_ellipsoid - 1
+
+        if (AdaptiveSampling) then
+            deallocate(FS_tile)
+        end if
+
+        if (g_Telemetry) then
+            g_TelTileSeconds(i_tile) = OMP_get_wtime() - TileTime_start
+        end if
 
     end do
     !$OMP END DO
     !$OMP END PARALLEL
     !-------------Landslide parallel region end-----------------
+
+    if (IncrementalLandslide) then
+        ! combine the tiles evaluated now and the tiles carried forward
+        do i_tile = 1, total_tile_number + 1
+            if (.not. g_TileCache(i_tile)%bValid) then
+                cycle
+            end if
+            i_first = TileRows(i_tile, 1)
+            i_last = TileRows(i_tile, 2)
+            g_cal_count(:, i_first:i_last) = g_cal_count(:, i_first:i_last) &
+                    + g_TileCache(i_tile)%cal_count
+            g_unstable_count(:, i_first:i_last) = g_unstable_count(:, i_first:i_last) &
+                    + g_TileCache(i_tile)%unstable_count
+            g_failure_volume(:, i_first:i_last) = max(g_failure_volume(:, i_first:i_last), &
+                    g_TileCache(i_tile)%volume)
+            g_failure_area(:, i_first:i_last) = max(g_failure_area(:, i_first:i_last), &
+                    g_TileCache(i_tile)%area)
+            g_FS_3D(:, i_first:i_last) = min(g_FS_3D(:, i_first:i_last), g_TileCache(i_tile)%FS)
+        end do
+    end if
     LandTime_end = OMP_get_wtime()
     LandRunTime = LandRunTime + (LandTime_end - LandTime_start)
 
+    where (g_FS_3D == huge(FS_3D))
+        g_FS_3D = g_NoData_Value
+    end where
+
+    if (g_Telemetry) then
+        g_TelTileDraws = tile_draws
+        g_TelTileSkipped = tile_skipped
+    end if
+
+    LandEllipsoids = LandEllipsoids + sum(int(tile_draws, 8))
+    LandEllipsoidsFixed = LandEllipsoidsFixed + int(ellipsoid_number, 8) * (total_tile_number + 1)
+    if (AdaptiveSampling) then
+        ! the ellipsoids drawn in each tile, the last one is the residual tile
+        write(g_CREST_LogFileID,"(2X, A, g0, A, *(1X, g0))") "Landslide step ", step, &
+                " ellipsoids per tile:", tile_draws
+    end if
+    deallocate(tile_draws)
+
+    if (IncrementalLandslide) then
+        LandTilesSkipped = LandTilesSkipped + sum(tile_skipped)
+        LandTilesRun = LandTilesRun + (total_tile_number + 1 - sum(tile_skipped))
+        write(g_CREST_LogFileID,"(2X, A, g0, A, g0, A, g0, A)") "Landslide step ", step, ": ", &
+                sum(tile_skipped), " of ", total_tile_number + 1, " tiles carried forward"
+    end if
+    deallocate(tile_skipped)
+
 
     where (g_cal_count > 0)
         g_probability = g_unstable_count / g_cal_count
@@ -391,28 +574,79 @@ end subroutine Landslide_module
 
 
 
+! The random values of the ellipsoids are counter based: a draw is a hash
+! of its key (seed, step, tile, ellipsoid) and its number in the ellipsoid,
+! not the next value of a generator shared by the threads. A tile draws the
+! same ellipsoids whichever thread runs it and in whatever order, so runs
+! with the same RandomSeed give the same maps with any number of threads.
+
 ! this subroutine return the random value ranges from a and b
 ! for example, given a = 0 and b = 3, the output random values are:
 ! x = 1, x = 2, x = 3 (uniform distribution)
-subroutine random_uniform_int(a,b,x)
+subroutine random_uniform_int(a,b,stream,draw,x)
     implicit none
     integer, intent(in) :: a,b
+    integer, intent(in) :: stream(4), draw
     integer, intent(out) :: x
-    real :: u, r
-    call random_number(r)
+    double precision :: u, r
+    call random_stream_number(stream, draw, r)
     u = 1 - r
     x = INT((b-a)*u + a) + 1
     return
 end subroutine random_uniform_int
 
-subroutine random_uniform_float(a,b,x)
+subroutine random_uniform_float(a,b,stream,draw,x)
     implicit none
     double precision, intent(in) :: a,b
+    integer, intent(in) :: stream(4), draw
     double precision, intent(out) :: x
     double precision :: u, r
-    call random_number(r)
+    call random_stream_number(stream, draw, r)
     u = 1 - r
     x = (b-a)*u + a
     return
 end subroutine random_uniform_float
 
+! r in [0, 1) with 53 random bits, from two 32-bit hashes of the key
+subroutine random_stream_number(stream, draw, r)
+    implicit none
+    integer, intent(in) :: stream(4), draw
+    double precision, intent(out) :: r
+    integer(kind=8), parameter :: mask32 = 4294967295_8
+    integer(kind=8) :: h1, h2
+    integer :: n
+
+    h1 = 608135816_8
+    do n = 1, 4
+        h1 = hash32(ieor(h1, iand(int(stream(n), 8), mask32)))
+    end do
+    h1 = hash32(ieor(h1, iand(int(draw, 8), mask32)))
+    h2 = hash32(ieor(h1, 2654435769_8))
+
+    r = (dble(ishft(h1, -5)) * 67108864d0 + dble(ishft(h2, -6))) / 9007199254740992d0
+    return
+
+contains
+
+    ! bijective 32-bit mixing (xor-shift-multiply), the values are kept in
+    ! 64-bit integers below 2**32
+    integer(kind=8) function hash32(x)
+        integer(kind=8), intent(in) :: x
+        integer(kind=8) :: h
+        h = iand(x, mask32)
+        h = ieor(h, ishft(h, -16))
+        h = mul32(h, 2146121005_8)
+        h = ieor(h, ishft(h, -15))
+        h = mul32(h, 2221713035_8)
+        h = ieor(h, ishft(h, -16))
+        hash32 = h
+    end function hash32
+
+    ! a*b modulo 2**32 for a, b below 2**32, without overflowing 64 bits
+    integer(kind=8) function mul32(a, b)
+        integer(kind=8), intent(in) :: a, b
+        mul32 = iand(iand(a, 65535_8) * b &
+                + ishft(iand(ishft(a, -16) * iand(b, 65535_8), 65535_8), 16), mask32)
+    end function mul32
+
+end subroutine random_stream_number
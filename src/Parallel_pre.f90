@@ -215,6 +215,15 @@ subroutine Parallel_land_pre()
     ! calculate the total potential number of landslide in each tile
     ellipsoid_number = INT(ellipse_density * 16 * As_tile / &
             (pi * (min_ae + max_ae) * (min_be + max_be)))
+    ! with adaptive sampling a tile draws from ellipsoid_min_number up to
+    ! ellipsoid_max_number ellipsoids, otherwise always ellipsoid_number
+    if (AdaptiveSampling) then
+        ellipsoid_min_number = max(1, NINT(min_ellipse_ratio * ellipsoid_number))
+        ellipsoid_max_number = max(ellipsoid_min_number, NINT(max_ellipse_ratio * ellipsoid_number))
+    else
+        ellipsoid_min_number = ellipsoid_number
+        ellipsoid_max_number = ellipsoid_number
+    end if
     ! define the window extend for following calculation
     if (max_ae > max_be) then
         window_extend = NINT(max_ae / CellSize_LandInM * 2)
@@ -259,6 +268,34 @@ subroutine Parallel_land_pre()
         end do
 
     end do
+    ! the rows reached by the ellipsoids of each tile, the last tile is
+    ! the residual one
+    allocate(TileRows(total_tile_number + 1, 2))
+    do i = 1, total_tile_number
+        TileRows(i, 1) = max(0, minval(ValidPixel_matrix(i,:,1)) - window_extend)
+        TileRows(i, 2) = min(g_NRows_Land - 1, maxval(ValidPixel_matrix(i,:,1)) + window_extend)
+    end do
+    if (Npixel_residual > 0) then
+        TileRows(total_tile_number + 1, 1) = max(0, minval(ValidPixel_matrix_residual(:,1)) - window_extend)
+        TileRows(total_tile_number + 1, 2) = min(g_NRows_Land - 1, &
+                maxval(ValidPixel_matrix_residual(:,1)) + window_extend)
+    else
+        TileRows(total_tile_number + 1, :) = (/ 0, -1 /)
+    end if
+
+    if (IncrementalLandslide) then
+        allocate(g_TileCache(total_tile_number + 1))
+        do i = 1, total_tile_number + 1
+            g_TileCache(i)%bValid = .false.
+            allocate(g_TileCache(i)%SM(0:g_NCols_Land-1, TileRows(i,1):TileRows(i,2)))
+            allocate(g_TileCache(i)%FS(0:g_NCols_Land-1, TileRows(i,1):TileRows(i,2)))
+            allocate(g_TileCache(i)%volume(0:g_NCols_Land-1, TileRows(i,1):TileRows(i,2)))
+            allocate(g_TileCache(i)%area(0:g_NCols_Land-1, TileRows(i,1):TileRows(i,2)))
+            allocate(g_TileCache(i)%cal_count(0:g_NCols_Land-1, TileRows(i,1):TileRows(i,2)))
+            allocate(g_TileCache(i)%unstable_count(0:g_NCols_Land-1, TileRows(i,1):TileRows(i,2)))
+        end do
+    end if
+
     ! prepare the Cartesian coordinate system
     allocate(x_all(0:g_NCols_Land-1,0:g_NRows_Land-1))
     allocate(y_all(0:g_NCols_Land-1,0:g_NRows_Land-1))
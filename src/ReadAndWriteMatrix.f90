@@ -88,6 +88,7 @@ subroutine ReadMatrixFile(FileName_In, dblMat, &
         strDate_In)
 
     use CREST_Project
+    use ForcingCube
     implicit none
 
     character(*):: FileName_In,sFileFormat_In
@@ -150,6 +151,15 @@ subroutine ReadMatrixFile(FileName_In, dblMat, &
             return
         end if
 
+    case ("HDF5","H5") !--------------------------------------------
+        ! one frame of the time-indexed cube written by pack_forcing.py
+        call ReadForcingCube(trim(FileName_In)// ".h5", trim(strDate), dblMatBig, &
+                NCols, NRows,XLLCorner,YLLCorner, &
+                CellSize,NoData_Value,bIsError)
+        if(bIsError .eqv. .true.)then
+            return
+        end if
+
     case default
         write(*,*) "ERROR!!! This version does not use this Format!"
         bIsError=.true.
@@ -1030,6 +1040,7 @@ subroutine Export_HDF5(strDate,Rain,PET,EPot,EAct, &
     use Landslide_Basic
     use hdf5_utils
     use hdf5
+    use ResultWriter
     implicit none
     character*(*) strDate
     logical :: bIsError
@@ -1048,14 +1059,22 @@ subroutine Export_HDF5(strDate,Rain,PET,EPot,EAct, &
     double precision :: RS(0:g_NCols-1,0:g_NRows-1)
     double precision :: EAct(0:g_NCols-1,0:g_NRows-1)
     double precision :: Runoff(0:g_NCols-1,0:g_NRows-1)
-    integer :: dblTemp(0:g_NCols-1,0:g_NRows-1)
-    integer :: dblTemp_Land(0:g_NCols_Land-1,0:g_NRows_Land-1)
+    double precision :: dblTemp(0:g_NCols-1,0:g_NRows-1)
+    double precision :: dblTemp_Land(0:g_NCols_Land-1,0:g_NRows_Land-1)
 
 
     ! don't print the HDF5 write message
     call hdf_set_print_messages(.false.)
 
-    if (HDF5_WriteCount == 1) then ! HDF5 file does not exist, then create it
+    if (g_ResultSWMR .or. g_ResultBuffer > 0 .or. g_ResultWriterThread) then
+        ! stacked file kept open for the whole run
+        if (HDF5_WriteCount == 1) then
+            call CreateStackedResult(bIsError)
+            if (bIsError) then
+                stop
+            end if
+        end if
+    elseif (HDF5_WriteCount == 1) then ! HDF5 file does not exist, then create it
         H5_STATUS = "NEW"
         call hdf_open_file(file_id, trim(g_ResultPath)//"Result_all.h5", &
                 STATUS = H5_STATUS, ACTION='WRITE')
@@ -1081,6 +1100,13 @@ subroutine Export_HDF5(strDate,Rain,PET,EPot,EAct, &
         call hdf_write_attribute(file_id, "Landslide", "XLLCorner", g_xllCorner_Land)
         call hdf_write_attribute(file_id, "Landslide", "YLLCorner", g_yllCorner_Land)
         call hdf_write_attribute(file_id, "Landslide", "CellSize", g_CellSize_Land)
+        if (g_PackedCells) then
+            call WriteResultMask(file_id, "Meteorology", g_Mask/=g_NoData_Value)
+            call WriteResultMask(file_id, "Hydrology", g_Mask/=g_NoData_Value)
+            if (g_ModelCore == 3) then
+                call WriteResultMask(file_id, "Landslide", g_mask_fine/=g_NoData_Value)
+            end if
+        end if
     else
         H5_STATUS = "OLD"
         call hdf_open_file(file_id, trim(g_ResultPath)//"Result_all.h5", &
@@ -1092,99 +1118,85 @@ subroutine Export_HDF5(strDate,Rain,PET,EPot,EAct, &
     ! rain
     if(g_bGOVar(0))then
         where(g_Mask/=g_NoData_Value)
-            dblTemp=Rain/g_TimeStep * 100
+            dblTemp=Rain/g_TimeStep
         elsewhere
             dblTemp=g_NoData_Value
         end where
 
         ! write the datasets
-        call hdf_write_dataset(file_id, "Meteorology/"//"GOVar_"  &
-                //trim(g_sGOVarName(0)) // "_" //trim(strDate), &
-                dblTemp, filter='gzip+shuffle')
+        call PutGrid("Meteorology", 0, dblTemp)
     end if
 
     ! PET
     if(g_bGOVar(1))then
         where(g_Mask/=g_NoData_Value)
-            dblTemp=PET/g_TimeStep * 100
+            dblTemp=PET/g_TimeStep
         elsewhere
             dblTemp=g_NoData_Value
         end where
 
         ! write the datasets
-        call hdf_write_dataset(file_id, "Meteorology/"//"GOVar_"  &
-                //trim(g_sGOVarName(1)) // "_" //trim(strDate), &
-                dblTemp, filter='gzip+shuffle')
+        call PutGrid("Meteorology", 1, dblTemp)
     end if
 
     ! EPOT
     if(g_bGOVar(2))then
         where(g_Mask/=g_NoData_Value)
-            dblTemp=EPot/g_TimeStep * 100
+            dblTemp=EPot/g_TimeStep
         elsewhere
             dblTemp=g_NoData_Value
         end where
 
         ! write the datasets
-        call hdf_write_dataset(file_id, "Meteorology/"//"GOVar_"  &
-                //trim(g_sGOVarName(2)) // "_" //trim(strDate), &
-                dblTemp, filter='gzip+shuffle')
+        call PutGrid("Meteorology", 2, dblTemp)
     end if
 
     ! EAct
     if(g_bGOVar(3))then
         where(g_Mask/=g_NoData_Value)
-            dblTemp=EAct/g_TimeStep * 100
+            dblTemp=EAct/g_TimeStep
         elsewhere
             dblTemp=g_NoData_Value
         end where
 
         ! write the datasets
-        call hdf_write_dataset(file_id, "Meteorology/"//"GOVar_"  &
-                //trim(g_sGOVarName(3)) // "_" //trim(strDate), &
-                dblTemp, filter='gzip+shuffle')
+        call PutGrid("Meteorology", 3, dblTemp)
     end if
 
     ! W
     if(g_bGOVar(4))then
         where(g_Mask/=g_NoData_Value)
-            dblTemp=W * 100
+            dblTemp=W
         elsewhere
             dblTemp=g_NoData_Value
         end where
 
         ! write the datasets
-        call hdf_write_dataset(file_id, "Hydrology/"//"GOVar_"  &
-                //trim(g_sGOVarName(4)) // "_" //trim(strDate), &
-                dblTemp, filter='gzip+shuffle')
+        call PutGrid("Hydrology", 4, dblTemp)
     end if
 
     ! SM
     if(g_bGOVar(5))then
         where(g_Mask/=g_NoData_Value)
-            dblTemp=SM * 100
+            dblTemp=SM
         elsewhere
             dblTemp=g_NoData_Value
         end where
 
         ! write the datasets
-        call hdf_write_dataset(file_id, "Hydrology/"//"GOVar_"  &
-                //trim(g_sGOVarName(5)) // "_" //trim(strDate), &
-                dblTemp, filter='gzip+shuffle')
+        call PutGrid("Hydrology", 5, dblTemp)
     end if
 
     ! Runoff
     if(g_bGOVar(6))then
         where(g_Mask/=g_NoData_Value)
-            dblTemp=Runoff * 100
+            dblTemp=Runoff
         elsewhere
             dblTemp=g_NoData_Value
         end where
 
         ! write the datasets
-        call hdf_write_dataset(file_id, "Hydrology/"//"GOVar_"  &
-                //trim(g_sGOVarName(6)) // "_" //trim(strDate), &
-                dblTemp, filter='gzip+shuffle')
+        call PutGrid("Hydrology", 6, dblTemp)
     end if
 
 
@@ -1192,57 +1204,49 @@ subroutine Export_HDF5(strDate,Rain,PET,EPot,EAct, &
     ! ExcS
     if(g_bGOVar(7))then
         where(g_Mask/=g_NoData_Value)
-            dblTemp=ExcS/g_TimeStep * 100
+            dblTemp=ExcS/g_TimeStep
         elsewhere
             dblTemp=g_NoData_Value
         end where
 
         ! write the datasets
-        call hdf_write_dataset(file_id, "Hydrology/"//"GOVar_"  &
-                //trim(g_sGOVarName(7)) // "_" //trim(strDate), &
-                dblTemp, filter='gzip+shuffle')
+        call PutGrid("Hydrology", 7, dblTemp)
     end if
 
     ! ExcI
     if(g_bGOVar(8))then
         where(g_Mask/=g_NoData_Value)
-            dblTemp=ExcI/g_TimeStep * 100
+            dblTemp=ExcI/g_TimeStep
         elsewhere
             dblTemp=g_NoData_Value
         end where
 
         ! write the datasets
-        call hdf_write_dataset(file_id, "Hydrology/"//"GOVar_"  &
-                //trim(g_sGOVarName(8)) // "_" //trim(strDate), &
-                dblTemp, filter='gzip+shuffle')
+        call PutGrid("Hydrology", 8, dblTemp)
     end if
 
     ! RS
     if(g_bGOVar(9))then
         where(g_Mask/=g_NoData_Value)
-            dblTemp=RS/g_TimeStep * 100
+            dblTemp=RS/g_TimeStep
         elsewhere
             dblTemp=g_NoData_Value
         end where
 
         ! write the datasets
-        call hdf_write_dataset(file_id, "Hydrology/"//"GOVar_"  &
-                //trim(g_sGOVarName(9)) // "_" //trim(strDate), &
-                dblTemp, filter='gzip+shuffle')
+        call PutGrid("Hydrology", 9, dblTemp)
     end if
 
     ! RI
     if(g_bGOVar(10))then
         where(g_Mask/=g_NoData_Value)
-            dblTemp=RI/g_TimeStep * 100
+            dblTemp=RI/g_TimeStep
         elsewhere
             dblTemp=g_NoData_Value
         end where
 
         ! write the datasets
-        call hdf_write_dataset(file_id, "Hydrology/"//"GOVar_"  &
-                //trim(g_sGOVarName(10)) // "_" //trim(strDate), &
-                dblTemp, filter='gzip+shuffle')
+        call PutGrid("Hydrology", 10, dblTemp)
     end if
 
     ! only when using HYDROSLIDE3D will output following variables
@@ -1251,63 +1255,151 @@ subroutine Export_HDF5(strDate,Rain,PET,EPot,EAct, &
         ! FS3D
         if(g_bGOVar(11))then
             where(g_mask_fine/=g_NoData_Value .and. g_FS_3D /=g_NoData_Value)
-                dblTemp_Land = g_FS_3D * 100
+                dblTemp_Land = g_FS_3D
             elsewhere
                 dblTemp_Land = g_NoData_Value
             end where
 
             ! write the datasets
-            call hdf_write_dataset(file_id, "Landslide/"//"GOVar_"  &
-                    //trim(g_sGOVarName(11)) // "_" //trim(strDate), &
-                    dblTemp_Land, filter='gzip+shuffle')
+            call PutGrid("Landslide", 11, dblTemp_Land)
         end if
 
         ! failure probability
         if(g_bGOVar(12))then
             where(g_mask_fine/=g_NoData_Value .and. g_probability /=g_NoData_Value)
-                dblTemp_Land = g_probability * 100
+                dblTemp_Land = g_probability
             elsewhere
                 dblTemp_Land = g_NoData_Value
             end where
 
             ! write the datasets
-            call hdf_write_dataset(file_id, "Landslide/"//"GOVar_"  &
-                    //trim(g_sGOVarName(12)) // "_" //trim(strDate), &
-                    dblTemp_Land, filter='gzip+shuffle')
+            call PutGrid("Landslide", 12, dblTemp_Land)
         end if
 
         ! failure volume
         if(g_bGOVar(13))then
             where(g_mask_fine/=g_NoData_Value .and. g_failure_volume /=g_NoData_Value)
-                dblTemp_Land = g_failure_volume * 100
+                dblTemp_Land = g_failure_volume
             elsewhere
                 dblTemp_Land = g_NoData_Value
             end where
 
             ! write the datasets
-            call hdf_write_dataset(file_id, "Landslide/"//"GOVar_"  &
-                    //trim(g_sGOVarName(13)) // "_" //trim(strDate), &
-                    dblTemp_Land, filter='gzip+shuffle')
+            call PutGrid("Landslide", 13, dblTemp_Land)
         end if
 
         ! failure area
         if(g_bGOVar(14))then
             where(g_mask_fine/=g_NoData_Value .and. g_failure_area /=g_NoData_Value)
-                dblTemp_Land = g_failure_area * 100
+                dblTemp_Land = g_failure_area
             elsewhere
                 dblTemp_Land = g_NoData_Value
             end where
 
             ! write the datasets
-            call hdf_write_dataset(file_id, "Landslide/"//"GOVar_"  &
-                    //trim(g_sGOVarName(14)) // "_" //trim(strDate), &
-                    dblTemp_Land, filter='gzip+shuffle')
+            call PutGrid("Landslide", 14, dblTemp_Land)
         end if
 
     end if
 
-    ! close the h5 file
-    call hdf_close_file(file_id)
+    if (g_ResultIsOpen) then
+        ! written once ResultBuffer steps are buffered
+        call EndResultStep(strDate)
+    else
+        ! close the h5 file
+        call hdf_close_file(file_id)
+    end if
+
+contains
+
+    ! write one grid as its own dataset, or as the next step of its stack,
+    ! stored as set by the GO storage options of the variable; with
+    ! PackedCells only the cells of the mask of the group are written
+    subroutine PutGrid(sGroup, iVar, dblMat)
+        character(*) :: sGroup
+        integer :: iVar
+        double precision :: dblMat(:,:)
+        double precision, allocatable :: dblCells(:,:)
+
+        if (g_PackedCells) then
+            if (sGroup == "Landslide") then
+                dblCells = reshape(pack(dblMat, g_mask_fine/=g_NoData_Value), &
+                        (/ count(g_mask_fine/=g_NoData_Value), 1 /))
+            else
+                dblCells = reshape(pack(dblMat, g_Mask/=g_NoData_Value), &
+                        (/ count(g_Mask/=g_NoData_Value), 1 /))
+            end if
+        else
+            dblCells = dblMat
+        end if
+
+        if (g_ResultIsOpen) then
+            call WriteResultFrame(sGroup//"/GOVar_"//trim(g_sGOVarName(iVar)), dblCells, g_NoData_Value)
+        else
+            call WriteResultGrid(file_id, sGroup//"/"//"GOVar_"  &
+                    //trim(g_sGOVarName(iVar)) // "_" //trim(strDate), &
+                    dblCells, g_NoData_Value, g_ResultStorage(iVar), g_PackedCells)
+        end if
+        deallocate(dblCells)
+    end subroutine PutGrid
+
+    ! create the groups and the stacks of every output variable, then start SWMR
+    subroutine CreateStackedResult(bIsError)
+        logical :: bIsError
+        integer :: i, NHydroCols, NHydroRows, NLandCols, NLandRows
+
+        call CreateResultFile(trim(g_ResultPath)//"Result_all.h5", g_ResultBuffer, &
+                g_ResultWriterThread, bIsError)
+        if (bIsError) then
+            return
+        end if
+        call AddResultGroup("Meteorology", g_NCols, g_NRows, g_xllCorner, g_yllCorner, g_CellSize)
+        call AddResultGroup("Hydrology", g_NCols, g_NRows, g_xllCorner, g_yllCorner, g_CellSize)
+        call AddResultGroup("Landslide", g_NCols_Land, g_NRows_Land, &
+                g_xllCorner_Land, g_yllCorner_Land, g_CellSize_Land)
+        if (g_PackedCells) then
+            ! frames of NCells x 1 values
+            NHydroCols = count(g_Mask/=g_NoData_Value)
+            NHydroRows = 1
+            call WriteResultMask(g_ResultFileID, "Meteorology", g_Mask/=g_NoData_Value)
+            call WriteResultMask(g_ResultFileID, "Hydrology", g_Mask/=g_NoData_Value)
+        else
+            NHydroCols = g_NCols
+            NHydroRows = g_NRows
+        end if
+        do i = 0, 3
+            if (g_bGOVar(i)) then
+                call AddResultStack("Meteorology/GOVar_"//trim(g_sGOVarName(i)), NHydroCols, NHydroRows, &
+                        g_ResultStorage(i), g_NoData_Value, g_PackedCells)
+            end if
+        end do
+        do i = 4, 10
+            if (g_bGOVar(i)) then
+                call AddResultStack("Hydrology/GOVar_"//trim(g_sGOVarName(i)), NHydroCols, NHydroRows, &
+                        g_ResultStorage(i), g_NoData_Value, g_PackedCells)
+            end if
+        end do
+        if (g_ModelCore == 3) then
+            if (g_PackedCells) then
+                NLandCols = count(g_mask_fine/=g_NoData_Value)
+                NLandRows = 1
+                call WriteResultMask(g_ResultFileID, "Landslide", g_mask_fine/=g_NoData_Value)
+            else
+                NLandCols = g_NCols_Land
+                NLandRows = g_NRows_Land
+            end if
+            do i = 11, 14
+                if (g_bGOVar(i)) then
+                    call AddResultStack("Landslide/GOVar_"//trim(g_sGOVarName(i)), &
+                            NLandCols, NLandRows, g_ResultStorage(i), g_NoData_Value, g_PackedCells)
+                end if
+            end do
+        end if
+        if (g_ResultSWMR) then
+            call StartResultSWMR(bIsError)
+        end if
+    end subroutine CreateStackedResult
+
 
 end subroutine Export_HDF5
 
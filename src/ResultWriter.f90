@@ -0,0 +1,672 @@
+!ResultWriter--------------------------------------------------
+! Storage of the grid outputs in Result_all.h5.
+! Every variable is stored with its ResultStorage (GOType, GOScale,
+! GOOffset, GOChunkRows, GOChunkSteps, GOFilter and GOLevel in
+! Control.Project): INT16 or INT32 as (value-Offset)/Scale truncated, or
+! FLOAT32 as is, NoData as NoData. The datasets carry the attributes
+! scale_factor, add_offset and NoData_Value, so value = stored*scale_factor
+! + add_offset for every cell that is not NoData_Value.
+! WriteResultGrid writes one grid as its own dataset (the per-step layout).
+! With PackedCells = yes a group holds only the cells of its mask: the
+! grids are packed into vectors (column by column of the Fortran arrays,
+! i.e. row by row of the file) and <Group>/Mask, written once by
+! WriteResultMask, has 1 for the packed cells and 0 elsewhere.
+! The stacked layout is kept open for the whole run (ResultBuffer > 0,
+! ResultSWMR = yes or ResultWriterThread = yes). The file holds
+!   <Group>/GOVar_<Var> (NCols, NRows, NTimes) one extendible dataset per
+!                       variable, (NCells, NTimes) when packed
+!   <Group>/Time (NTimes)  date digits of every step
+! Every dataset is created before the first step (SWMR forbids creating
+! objects once writing has started). The frames of a step are encoded into
+! a buffer of NBufferSteps steps per variable; a full buffer is written
+! with one extend and one hyperslab per dataset, then the file is flushed,
+! so a reader opened with swmr=True sees every written step while the
+! model is still running.
+! With bWriterThread the buffer is written by an OpenMP task while the
+! model fills a second buffer. CREST_Simu runs the time loop on the master
+! of a team of two threads, so the task runs on the other thread and the
+! compression overlaps the computation of the next steps. HDF5 is not
+! thread safe: other HDF5 calls of the loop wait for the task with
+! WaitResultWriter first. Reads that come at every step (the forcing cubes)
+! are done by g_ResultIdleHook instead, which FlushResultBuffer calls
+! between the end of one task and the start of the next, so they do not
+! wait for the writer.
+module ResultWriter
+    use iso_c_binding
+    use hdf5
+    use hdf5_utils
+    use Telemetry
+    implicit none
+
+    integer, parameter :: MaxResultStacks = 16
+    integer, parameter :: MaxResultGroups = 4
+    integer, parameter :: ResultTimeChunk = 256
+
+    ! how one output variable is stored, the defaults are the original
+    ! int32 value*100 in one gzip+shuffle chunk per grid
+    type ResultStorage
+        character(len=10) :: DType = "INT32"      ! INT16, INT32 or FLOAT32
+        double precision :: Scale = 0.01d0        ! value = stored*Scale + Offset
+        double precision :: Offset = 0d0
+        integer :: ChunkRows = 0                  ! rows per chunk, 0: whole grid
+        integer :: ChunkSteps = 1                 ! steps per chunk of the stacked layout
+        character(len=20) :: Filter = "GZIP+SHUFFLE" ! GZIP+SHUFFLE, GZIP or NONE
+        integer :: Level = 6
+    end type ResultStorage
+
+    type ResultStack
+        character(len=100) :: Name = ""
+        integer(HID_T) :: DsetID
+        integer :: NCols, NRows                   ! NCells and 1 for packed vectors
+        integer :: Rank = 2                       ! of one frame, 1 for packed vectors
+        type(ResultStorage) :: Storage
+        ! (NCols, NRows, NBufferSteps, buffer), the one of Storage%DType
+        integer(kind=4), allocatable :: IntBuffer(:,:,:,:)
+        integer(kind=2), allocatable :: ShortBuffer(:,:,:,:)
+        real(kind=4), allocatable :: RealBuffer(:,:,:,:)
+        ! frames with values out of the range of the type, warned once
+        integer :: NClampedFrames = 0
+    end type ResultStack
+
+    ! storage of every grid output variable, by GOVar index
+    type(ResultStorage), allocatable, save :: g_ResultStorage(:)
+
+    integer(HID_T), save :: g_ResultFileID
+    logical, save :: g_ResultIsOpen = .false.
+    logical, save :: g_ResultIsSWMR = .false.
+    logical, save :: g_ResultThreaded = .false.
+    integer, save :: g_ResultNSteps = 0          ! steps handed to the writer
+    integer, save :: g_ResultNBufferSteps = 1
+    integer, save :: g_ResultNBuffered = 0       ! steps in the current buffer
+
+    abstract interface
+        subroutine ResultIdleHook()
+        end subroutine ResultIdleHook
+    end interface
+    ! HDF5 work of the model done while no write task runs (ForcingCube)
+    procedure(ResultIdleHook), pointer, save :: g_ResultIdleHook => null()
+    integer, save :: g_ResultCurBuffer = 1
+    integer, save :: g_NResultStacks = 0
+    integer, save :: g_NResultGroups = 0
+    type(ResultStack), target, save :: g_ResultStacks(MaxResultStacks)
+    integer(HID_T), save :: g_ResultTimeIDs(MaxResultGroups)
+    double precision, allocatable, save :: g_ResultTimeBuffer(:,:)
+
+    interface
+        ! not wrapped by the Fortran API of HDF5 1.10
+        integer(c_int) function H5Fstart_swmr_write(file_id) bind(C, name="H5Fstart_swmr_write")
+            import :: c_int, HID_T
+            integer(HID_T), value :: file_id
+        end function H5Fstart_swmr_write
+    end interface
+
+contains
+
+    ! check the settings of one variable, after reading them from Control.Project
+    logical function IsResultStorageValid(Storage)
+        type(ResultStorage) :: Storage
+
+        IsResultStorageValid=.true.
+        select case (trim(Storage%DType))
+            case ("INT16", "INT32", "FLOAT32")
+            case default
+                IsResultStorageValid=.false.
+        end select
+        select case (trim(Storage%Filter))
+            case ("GZIP+SHUFFLE", "GZIP", "NONE")
+            case default
+                IsResultStorageValid=.false.
+        end select
+        if(Storage%Scale<=0 .or. Storage%ChunkRows<0 .or. Storage%ChunkSteps<1 &
+                .or. Storage%Level<0 .or. Storage%Level>9)then
+            IsResultStorageValid=.false.
+        end if
+    end function IsResultStorageValid
+
+    ! HDF5 type of the stored values
+    integer(HID_T) function ResultTypeID(Storage)
+        type(ResultStorage) :: Storage
+
+        select case (trim(Storage%DType))
+            case ("INT16")
+                ResultTypeID=h5kind_to_type(2, H5_INTEGER_KIND)
+            case ("FLOAT32")
+                ResultTypeID=H5T_NATIVE_REAL
+            case default
+                ResultTypeID=H5T_NATIVE_INTEGER
+        end select
+    end function ResultTypeID
+
+    ! bytes of one stored value
+    integer function ResultTypeBytes(Storage)
+        type(ResultStorage) :: Storage
+
+        select case (trim(Storage%DType))
+            case ("INT16")
+                ResultTypeBytes=2
+            case default
+                ResultTypeBytes=4
+        end select
+    end function ResultTypeBytes
+
+    ! dataset creation properties: chunks of ChunkRows whole rows of a grid
+    ! (and ChunkSteps steps when bStacked, the last dimension) and the filter
+    integer(HID_T) function ResultCreatePList(Storage, rank, dims, bStacked)
+        type(ResultStorage) :: Storage
+        integer :: rank
+        integer(HSIZE_T) :: dims(:)
+        logical :: bStacked
+        integer(HSIZE_T) :: chunks(3)
+        integer :: hdferror, FrameRank
+
+        chunks(1:rank)=dims(1:rank)
+        FrameRank=rank
+        if(bStacked)then
+            chunks(rank)=Storage%ChunkSteps
+            FrameRank=rank-1
+        end if
+        if(Storage%ChunkRows>0 .and. FrameRank==2)then
+            chunks(2)=min(int(Storage%ChunkRows, HSIZE_T), dims(2))
+        end if
+
+        call h5pcreate_f(H5P_DATASET_CREATE_F, ResultCreatePList, hdferror)
+        call h5pset_chunk_f(ResultCreatePList, rank, chunks(1:rank), hdferror)
+        select case (trim(Storage%Filter))
+            case ("GZIP+SHUFFLE")
+                call h5pset_shuffle_f(ResultCreatePList, hdferror)
+                call h5pset_deflate_f(ResultCreatePList, Storage%Level, hdferror)
+            case ("GZIP")
+                call h5pset_deflate_f(ResultCreatePList, Storage%Level, hdferror)
+        end select
+    end function ResultCreatePList
+
+    ! scale_factor, add_offset and NoData_Value of DsetName
+    subroutine WriteResultStorageAttrs(loc_id, DsetName, Storage, NoData)
+        integer(HID_T) :: loc_id
+        character(*) :: DsetName
+        type(ResultStorage) :: Storage
+        double precision :: NoData
+
+        if(trim(Storage%DType)=="FLOAT32")then
+            call hdf_write_attribute(loc_id, DsetName, "scale_factor", 1d0)
+            call hdf_write_attribute(loc_id, DsetName, "add_offset", 0d0)
+        else
+            call hdf_write_attribute(loc_id, DsetName, "scale_factor", Storage%Scale)
+            call hdf_write_attribute(loc_id, DsetName, "add_offset", Storage%Offset)
+        end if
+        call hdf_write_attribute(loc_id, DsetName, "NoData_Value", NoData)
+    end subroutine WriteResultStorageAttrs
+
+    ! stored values of a grid, limited to the range of the type; NClamped
+    ! is the number of values out of that range. A value stored as the
+    ! NoData code would be read back as NoData, it is moved one unit
+    ! towards zero instead.
+    subroutine EncodeResultInt(Values, NoData, Storage, IntMat, NClamped)
+        double precision :: Values(:,:)
+        double precision :: NoData
+        type(ResultStorage) :: Storage
+        integer(kind=4) :: IntMat(:,:)
+        integer :: NClamped
+        double precision :: Factor, Limit
+        integer(kind=4) :: NoDataCode
+
+        Factor=1d0/Storage%Scale
+        Limit=huge(IntMat)
+        NoDataCode=int(NoData, 4)
+        NClamped=count(Values/=NoData .and. abs((Values-Storage%Offset)*Factor)>=Limit+1d0)
+        where(Values/=NoData)
+            IntMat=int(max(min((Values-Storage%Offset)*Factor, Limit), -Limit), 4)
+        elsewhere
+            IntMat=NoDataCode
+        end where
+        where(Values/=NoData .and. IntMat==NoDataCode)
+            IntMat=IntMat-sign(1_4, NoDataCode)
+        end where
+    end subroutine EncodeResultInt
+
+    subroutine EncodeResultShort(Values, NoData, Storage, ShortMat, NClamped)
+        double precision :: Values(:,:)
+        double precision :: NoData
+        type(ResultStorage) :: Storage
+        integer(kind=2) :: ShortMat(:,:)
+        integer :: NClamped
+        double precision :: Factor, Limit
+        integer(kind=2) :: NoDataCode
+
+        Factor=1d0/Storage%Scale
+        Limit=huge(ShortMat)
+        NoDataCode=int(NoData, 2)
+        NClamped=count(Values/=NoData .and. abs((Values-Storage%Offset)*Factor)>=Limit+1d0)
+        where(Values/=NoData)
+            ShortMat=int(max(min((Values-Storage%Offset)*Factor, Limit), -Limit), 2)
+        elsewhere
+            ShortMat=NoDataCode
+        end where
+        where(Values/=NoData .and. ShortMat==NoDataCode)
+            ShortMat=ShortMat-sign(1_2, NoDataCode)
+        end where
+    end subroutine EncodeResultShort
+
+    ! warning for the values of DsetName the encoding had to clamp
+    subroutine WarnResultClamped(DsetName, Storage, NClamped)
+        character(*) :: DsetName
+        type(ResultStorage) :: Storage
+        integer :: NClamped
+        character(len=12) :: strCount
+
+        write(strCount,'(I12)') NClamped
+        write(*,*) "Warning: " // trim(adjustl(strCount)) // " values of " // trim(DsetName) // &
+                " out of the " // trim(Storage%DType) // " range of GOScale and GOOffset, clamped"
+    end subroutine WarnResultClamped
+
+    ! write Values (NoData where there is no value) as the 2-D dataset DsetName,
+    ! or as a 1-D one with bVector (Values is then (NCells, 1))
+    subroutine WriteResultGrid(loc_id, DsetName, Values, NoData, Storage, bVector)
+        integer(HID_T) :: loc_id
+        character(*) :: DsetName
+        double precision :: Values(:,:)
+        double precision :: NoData
+        type(ResultStorage) :: Storage
+        logical, optional :: bVector
+        integer(kind=4), allocatable, target :: IntMat(:,:)
+        integer(kind=2), allocatable, target :: ShortMat(:,:)
+        real(kind=4), allocatable, target :: RealMat(:,:)
+        integer(HID_T) :: space_id, plist_id, dset_id
+        integer(HSIZE_T) :: dims(2)
+        type(c_ptr) :: f_ptr
+        integer :: hdferror, rank, NClamped
+
+        dims=shape(Values, kind=HSIZE_T)
+        rank=2
+        if(present(bVector))then
+            if(bVector) rank=1
+        end if
+        select case (trim(Storage%DType))
+            case ("INT16")
+                allocate(ShortMat(dims(1), dims(2)))
+                call EncodeResultShort(Values, NoData, Storage, ShortMat, NClamped)
+                f_ptr=c_loc(ShortMat)
+            case ("FLOAT32")
+                allocate(RealMat(dims(1), dims(2)))
+                RealMat=real(Values, 4)
+                f_ptr=c_loc(RealMat)
+            case default
+                allocate(IntMat(dims(1), dims(2)))
+                call EncodeResultInt(Values, NoData, Storage, IntMat, NClamped)
+                f_ptr=c_loc(IntMat)
+        end select
+        if(trim(Storage%DType)/="FLOAT32" .and. NClamped>0)then
+            call WarnResultClamped(DsetName, Storage, NClamped)
+        end if
+
+        plist_id=ResultCreatePList(Storage, rank, dims, .false.)
+        call h5screate_simple_f(rank, dims(1:rank), space_id, hdferror)
+        call h5dcreate_f(loc_id, trim(DsetName), ResultTypeID(Storage), space_id, dset_id, &
+                hdferror, dcpl_id=plist_id)
+        call h5dwrite_f(dset_id, ResultTypeID(Storage), f_ptr, hdferror)
+        g_TelBytes=g_TelBytes+product(dims)*ResultTypeBytes(Storage)
+        call h5dclose_f(dset_id, hdferror)
+        call h5sclose_f(space_id, hdferror)
+        call h5pclose_f(plist_id, hdferror)
+
+        call WriteResultStorageAttrs(loc_id, DsetName, Storage, NoData)
+    end subroutine WriteResultGrid
+
+    ! <GroupName>/Mask, 1 for the cells kept in the packed vectors, and the
+    ! number of these cells as the NCells attribute of the group
+    subroutine WriteResultMask(loc_id, GroupName, Valid)
+        integer(HID_T) :: loc_id
+        character(*) :: GroupName
+        logical :: Valid(:,:)
+        integer, allocatable :: Mask(:,:)
+
+        allocate(Mask(size(Valid, 1), size(Valid, 2)))
+        Mask=merge(1, 0, Valid)
+        if(len_trim(GroupName)==0)then
+            call hdf_write_dataset(loc_id, "Mask", Mask, filter="gzip+shuffle")
+        else
+            call hdf_write_dataset(loc_id, trim(GroupName)//"/Mask", Mask, filter="gzip+shuffle")
+        end if
+        call hdf_write_attribute(loc_id, trim(GroupName), "NCells", count(Valid))
+        deallocate(Mask)
+    end subroutine WriteResultMask
+
+    ! create the file in the latest format, which SWMR requires
+    subroutine CreateResultFile(FileName, NBufferSteps, bWriterThread, bIsError)
+        character(*) :: FileName
+        integer :: NBufferSteps
+        logical :: bWriterThread
+        logical :: bIsError
+        integer(HID_T) :: fapl_id
+        integer :: hdferror
+
+        if(g_ResultIsOpen)then
+            call CloseResultFile()
+        end if
+
+        ! hdf_close_file must not close the library under the open file
+        call hdf_set_close_library(.false.)
+        call h5open_f(hdferror)
+        call h5pcreate_f(H5P_FILE_ACCESS_F, fapl_id, hdferror)
+        call h5pset_libver_bounds_f(fapl_id, H5F_LIBVER_LATEST_F, H5F_LIBVER_LATEST_F, hdferror)
+        call h5fcreate_f(trim(FileName), H5F_ACC_TRUNC_F, g_ResultFileID, hdferror, &
+                access_prp=fapl_id)
+        call h5pclose_f(fapl_id, hdferror)
+
+        bIsError=(hdferror<0)
+        if(bIsError)then
+            write(*,*) "Could not create the result file: " // trim(FileName)
+            call hdf_set_close_library(.true.)
+            return
+        end if
+        g_ResultIsOpen=.true.
+        g_ResultIsSWMR=.false.
+        g_ResultThreaded=bWriterThread
+        g_ResultNSteps=0
+        g_ResultNBufferSteps=max(NBufferSteps, 1)
+        g_ResultNBuffered=0
+        g_ResultCurBuffer=1
+        g_NResultStacks=0
+        g_NResultGroups=0
+        if(allocated(g_ResultTimeBuffer))then
+            deallocate(g_ResultTimeBuffer)
+        end if
+        allocate(g_ResultTimeBuffer(g_ResultNBufferSteps, NResultBuffers()))
+    end subroutine CreateResultFile
+
+    ! two buffers with the writer thread: one is filled while the other is written
+    integer function NResultBuffers()
+        if(g_ResultThreaded)then
+            NResultBuffers=2
+        else
+            NResultBuffers=1
+        end if
+    end function NResultBuffers
+
+    ! group with the georeferencing attributes and an empty Time dataset
+    subroutine AddResultGroup(GroupName, NCols, NRows, XLLCorner, YLLCorner, CellSize)
+        character(*) :: GroupName
+        integer :: NCols, NRows
+        double precision :: XLLCorner, YLLCorner, CellSize
+        integer(HID_T) :: space_id, plist_id, dset_id
+        integer(HSIZE_T) :: dims(1), maxdims(1), chunks(1)
+        integer :: hdferror
+
+        call hdf_create_group(g_ResultFileID, GroupName)
+        call hdf_write_attribute(g_ResultFileID, GroupName, "NCols", NCols)
+        call hdf_write_attribute(g_ResultFileID, GroupName, "NRows", NRows)
+        call hdf_write_attribute(g_ResultFileID, GroupName, "XLLCorner", XLLCorner)
+        call hdf_write_attribute(g_ResultFileID, GroupName, "YLLCorner", YLLCorner)
+        call hdf_write_attribute(g_ResultFileID, GroupName, "CellSize", CellSize)
+
+        dims=0
+        maxdims=H5S_UNLIMITED_F
+        chunks=ResultTimeChunk
+        call h5screate_simple_f(1, dims, space_id, hdferror, maxdims)
+        call h5pcreate_f(H5P_DATASET_CREATE_F, plist_id, hdferror)
+        call h5pset_chunk_f(plist_id, 1, chunks, hdferror)
+        call h5dcreate_f(g_ResultFileID, trim(GroupName)//"/Time", H5T_NATIVE_DOUBLE, &
+                space_id, dset_id, hdferror, dcpl_id=plist_id)
+        call h5pclose_f(plist_id, hdferror)
+        call h5sclose_f(space_id, hdferror)
+
+        g_NResultGroups=g_NResultGroups+1
+        g_ResultTimeIDs(g_NResultGroups)=dset_id
+    end subroutine AddResultGroup
+
+    ! empty extendible dataset DsetName (e.g. "Hydrology/GOVar_SM"); with
+    ! bVector its frames are vectors of NCols cells (NRows is 1)
+    subroutine AddResultStack(DsetName, NCols, NRows, Storage, NoData, bVector)
+        character(*) :: DsetName
+        integer :: NCols, NRows
+        type(ResultStorage) :: Storage
+        double precision :: NoData
+        logical, optional :: bVector
+        integer(HID_T) :: space_id, plist_id, dset_id
+        integer(HSIZE_T) :: dims(3), maxdims(3)
+        integer :: hdferror, NBuffers, rank
+
+        if(g_NResultStacks==MaxResultStacks)then
+            write(*,*) "Too many result variables: " // trim(DsetName)
+            return
+        end if
+
+        rank=2
+        if(present(bVector))then
+            if(bVector) rank=1
+        end if
+        if(rank==1)then
+            dims(1:2)=(/ int(NCols, HSIZE_T), 0_HSIZE_T /)
+            maxdims(1:2)=(/ int(NCols, HSIZE_T), H5S_UNLIMITED_F /)
+        else
+            dims=(/ int(NCols, HSIZE_T), int(NRows, HSIZE_T), 0_HSIZE_T /)
+            maxdims=(/ int(NCols, HSIZE_T), int(NRows, HSIZE_T), H5S_UNLIMITED_F /)
+        end if
+        call h5screate_simple_f(rank+1, dims(1:rank+1), space_id, hdferror, maxdims(1:rank+1))
+        plist_id=ResultCreatePList(Storage, rank+1, dims, .true.)
+        call h5dcreate_f(g_ResultFileID, trim(DsetName), ResultTypeID(Storage), &
+                space_id, dset_id, hdferror, dcpl_id=plist_id)
+        call h5pclose_f(plist_id, hdferror)
+        call h5sclose_f(space_id, hdferror)
+        call WriteResultStorageAttrs(g_ResultFileID, DsetName, Storage, NoData)
+
+        g_NResultStacks=g_NResultStacks+1
+        associate(stack => g_ResultStacks(g_NResultStacks))
+            stack%Name=trim(DsetName)
+            stack%DsetID=dset_id
+            stack%NCols=NCols
+            stack%NRows=NRows
+            stack%Rank=rank
+            stack%Storage=Storage
+            NBuffers=NResultBuffers()
+            select case (trim(Storage%DType))
+                case ("INT16")
+                    allocate(stack%ShortBuffer(NCols, NRows, g_ResultNBufferSteps, NBuffers))
+                case ("FLOAT32")
+                    allocate(stack%RealBuffer(NCols, NRows, g_ResultNBufferSteps, NBuffers))
+                case default
+                    allocate(stack%IntBuffer(NCols, NRows, g_ResultNBufferSteps, NBuffers))
+            end select
+        end associate
+    end subroutine AddResultStack
+
+    ! from here on readers can follow the file, but no object can be added
+    subroutine StartResultSWMR(bIsError)
+        logical :: bIsError
+
+        bIsError=(H5Fstart_swmr_write(g_ResultFileID)<0)
+        if(bIsError)then
+            write(*,*) "Could not start SWMR writing of the result file"
+        else
+            g_ResultIsSWMR=.true.
+        end if
+    end subroutine StartResultSWMR
+
+    ! encode Values into the buffer as the frame of the current step of DsetName
+    subroutine WriteResultFrame(DsetName, Values, NoData)
+        character(*) :: DsetName
+        double precision :: Values(:,:)
+        double precision :: NoData
+        integer :: i, iStep, iBuffer, NClamped
+
+        do i=1, g_NResultStacks
+            if(trim(g_ResultStacks(i)%Name)==trim(DsetName))then
+                exit
+            end if
+        end do
+        if(i>g_NResultStacks)then
+            write(*,*) "Result variable not created: " // trim(DsetName)
+            return
+        end if
+
+        iStep=g_ResultNBuffered+1
+        iBuffer=g_ResultCurBuffer
+        NClamped=0
+        associate(stack => g_ResultStacks(i))
+            select case (trim(stack%Storage%DType))
+                case ("INT16")
+                    call EncodeResultShort(Values, NoData, stack%Storage, &
+                            stack%ShortBuffer(:,:,iStep,iBuffer), NClamped)
+                case ("FLOAT32")
+                    stack%RealBuffer(:,:,iStep,iBuffer)=real(Values, 4)
+                case default
+                    call EncodeResultInt(Values, NoData, stack%Storage, &
+                            stack%IntBuffer(:,:,iStep,iBuffer), NClamped)
+            end select
+            if(NClamped>0)then
+                if(stack%NClampedFrames==0)then
+                    call WarnResultClamped(trim(DsetName) // " (first frame, the others are counted at the end)", &
+                            stack%Storage, NClamped)
+                end if
+                stack%NClampedFrames=stack%NClampedFrames+1
+            end if
+            g_TelBytes=g_TelBytes+size(Values, kind=8)*ResultTypeBytes(stack%Storage)
+        end associate
+    end subroutine WriteResultFrame
+
+    ! close the step with its date; a full buffer goes to the file
+    subroutine EndResultStep(strDate)
+        character(*) :: strDate
+
+        g_ResultNBuffered=g_ResultNBuffered+1
+        read(strDate,*) g_ResultTimeBuffer(g_ResultNBuffered,g_ResultCurBuffer)
+        if(g_ResultNBuffered==g_ResultNBufferSteps)then
+            call FlushResultBuffer()
+        end if
+    end subroutine EndResultStep
+
+    ! hand the buffered steps to the writer and switch to the other buffer
+    subroutine FlushResultBuffer()
+        integer :: iBuffer, iFirst, NSteps
+
+        if(g_ResultNBuffered==0)then
+            return
+        end if
+        iBuffer=g_ResultCurBuffer
+        iFirst=g_ResultNSteps
+        NSteps=g_ResultNBuffered
+
+        if(g_ResultThreaded)then
+            ! the previous task writes the other buffer, which is filled next
+            call WaitResultWriter()
+            if(associated(g_ResultIdleHook))then
+                call g_ResultIdleHook()
+            end if
+            !$OMP TASK FIRSTPRIVATE(iBuffer, iFirst, NSteps)
+            call WriteResultBuffer(iBuffer, iFirst, NSteps)
+            !$OMP END TASK
+            g_ResultCurBuffer=3-g_ResultCurBuffer
+        else
+            call WriteResultBuffer(iBuffer, iFirst, NSteps)
+        end if
+
+        g_ResultNSteps=g_ResultNSteps+NSteps
+        g_ResultNBuffered=0
+    end subroutine FlushResultBuffer
+
+    ! wait until the writer thread has written everything handed to it
+    subroutine WaitResultWriter()
+        if(g_ResultThreaded)then
+            !$OMP TASKWAIT
+        end if
+    end subroutine WaitResultWriter
+
+    ! write NSteps steps of buffer iBuffer at step iFirst of every dataset
+    subroutine WriteResultBuffer(iBuffer, iFirst, NSteps)
+        integer :: iBuffer, iFirst, NSteps
+        integer(HID_T) :: space_id, mem_id
+        integer(HSIZE_T) :: dims(3), offset(3), counts(3)
+        integer(HSIZE_T) :: tdims(1), toffset(1), tcounts(1)
+        type(c_ptr) :: f_ptr
+        integer :: i, hdferror, rank
+
+        do i=1, g_NResultStacks
+            associate(stack => g_ResultStacks(i))
+                ! the steps are the last dimension, after the frame ones
+                rank=stack%Rank+1
+                dims=(/ int(stack%NCols, HSIZE_T), int(stack%NRows, HSIZE_T), &
+                        int(iFirst+NSteps, HSIZE_T) /)
+                offset=(/ 0_HSIZE_T, 0_HSIZE_T, int(iFirst, HSIZE_T) /)
+                counts=(/ dims(1), dims(2), int(NSteps, HSIZE_T) /)
+                if(rank==2)then
+                    dims(2)=dims(3)
+                    offset(2)=offset(3)
+                    counts(2)=counts(3)
+                end if
+                call h5dset_extent_f(stack%DsetID, dims(1:rank), hdferror)
+
+                ! the first NSteps frames of a buffer are contiguous
+                select case (trim(stack%Storage%DType))
+                    case ("INT16")
+                        f_ptr=c_loc(stack%ShortBuffer(1,1,1,iBuffer))
+                    case ("FLOAT32")
+                        f_ptr=c_loc(stack%RealBuffer(1,1,1,iBuffer))
+                    case default
+                        f_ptr=c_loc(stack%IntBuffer(1,1,1,iBuffer))
+                end select
+
+                call h5dget_space_f(stack%DsetID, space_id, hdferror)
+                call h5sselect_hyperslab_f(space_id, H5S_SELECT_SET_F, offset(1:rank), &
+                        counts(1:rank), hdferror)
+                call h5screate_simple_f(rank, counts(1:rank), mem_id, hdferror)
+                call h5dwrite_f(stack%DsetID, ResultTypeID(stack%Storage), f_ptr, hdferror, &
+                        mem_space_id=mem_id, file_space_id=space_id)
+                call h5sclose_f(mem_id, hdferror)
+                call h5sclose_f(space_id, hdferror)
+            end associate
+        end do
+
+        ! the dates last, so a reader never sees a date without its frames
+        tdims=int(iFirst+NSteps, HSIZE_T)
+        toffset=int(iFirst, HSIZE_T)
+        tcounts=int(NSteps, HSIZE_T)
+        do i=1, g_NResultGroups
+            call h5dset_extent_f(g_ResultTimeIDs(i), tdims, hdferror)
+            call h5dget_space_f(g_ResultTimeIDs(i), space_id, hdferror)
+            call h5sselect_hyperslab_f(space_id, H5S_SELECT_SET_F, toffset, tcounts, hdferror)
+            call h5screate_simple_f(1, tcounts, mem_id, hdferror)
+            call h5dwrite_f(g_ResultTimeIDs(i), H5T_NATIVE_DOUBLE, &
+                    g_ResultTimeBuffer(1:NSteps,iBuffer), tcounts, hdferror, &
+                    mem_space_id=mem_id, file_space_id=space_id)
+            call h5sclose_f(mem_id, hdferror)
+            call h5sclose_f(space_id, hdferror)
+        end do
+
+        if(g_ResultIsSWMR)then
+            call h5fflush_f(g_ResultFileID, H5F_SCOPE_GLOBAL_F, hdferror)
+        end if
+    end subroutine WriteResultBuffer
+
+    ! write the steps still buffered and close the file
+    subroutine CloseResultFile()
+        integer :: i, hdferror
+        character(len=12) :: strCount
+
+        if(.not. g_ResultIsOpen)then
+            return
+        end if
+        call FlushResultBuffer()
+        call WaitResultWriter()
+        do i=1, g_NResultStacks
+            if(g_ResultStacks(i)%NClampedFrames>0)then
+                write(strCount,'(I12)') g_ResultStacks(i)%NClampedFrames
+                write(*,*) "Warning: " // trim(adjustl(strCount)) // " frames of " // &
+                        trim(g_ResultStacks(i)%Name) // " had values clamped to the range of " // &
+                        trim(g_ResultStacks(i)%Storage%DType)
+            end if
+            call h5dclose_f(g_ResultStacks(i)%DsetID, hdferror)
+            if(allocated(g_ResultStacks(i)%IntBuffer)) deallocate(g_ResultStacks(i)%IntBuffer)
+            if(allocated(g_ResultStacks(i)%ShortBuffer)) deallocate(g_ResultStacks(i)%ShortBuffer)
+            if(allocated(g_ResultStacks(i)%RealBuffer)) deallocate(g_ResultStacks(i)%RealBuffer)
+        end do
+        do i=1, g_NResultGroups
+            call h5dclose_f(g_ResultTimeIDs(i), hdferror)
+        end do
+        deallocate(g_ResultTimeBuffer)
+        call hdf_set_close_library(.true.)
+        call hdf_close_file(g_ResultFileID)
+        g_ResultIsOpen=.false.
+        g_ResultIsSWMR=.false.
+    end subroutine CloseResultFile
+
+end module ResultWriter
@@ -0,0 +1,189 @@
+!Telemetry-----------------------------------------------------
+! Per-step timing and counters of the simulation (Telemetry = yes in
+! Control.Project), one JSON object per line in <ResultPath>telemetry.jsonl:
+!   {"step": 1, "date": "2024090500", "wall_s": ...,
+!    "phases": {"read_forcing": ..., "channel": ..., "hydro": ...,
+!               "soil_downscale": ..., "landslide": ..., "export": ...,
+!               "other": ...},
+!    "threads": {"hydro": 8, "land": 8},
+!    "ellipsoids": ..., "tiles_skipped": ...,
+!    "bytes_encoded": ..., "result_file_bytes": ...,
+!    "tiles": [{"tile": 1, "thread": 0, "start_s": ..., "seconds": ...,
+!               "ellipsoids": ..., "skipped": false}, ...]}
+! The phases are wall seconds between the marks of CREST_Simu (TelemetryMark
+! at the end of each phase), "other" is the rest of the step. "tiles" lists
+! the landslide tiles of the step with the thread that ran each one, its
+! start after the start of the landslide region and its duration, and is
+! empty in steps without landslide evaluation. bytes_encoded is the size of
+! the grids handed to HDF5 in the step (before compression), and
+! result_file_bytes the size of Result_all.h5 after the step.
+! telemetry_report.py turns the file into phase breakdowns and load
+! imbalance charts.
+module Telemetry
+    use OMP_LIB
+    implicit none
+
+    integer, parameter :: TEL_FORCING = 1
+    integer, parameter :: TEL_CHANNEL = 2
+    integer, parameter :: TEL_HYDRO = 3
+    integer, parameter :: TEL_DOWNSCALE = 4
+    integer, parameter :: TEL_LANDSLIDE = 5
+    integer, parameter :: TEL_EXPORT = 6
+    integer, parameter :: TEL_NPHASES = 6
+    character(len=14), parameter :: TelPhaseNames(TEL_NPHASES) = (/ "read_forcing  ", &
+            "channel       ", "hydro         ", "soil_downscale", "landslide     ", "export        " /)
+
+    logical, save :: g_Telemetry = .false.
+    integer, save :: g_TelFileID
+    logical, save :: g_TelOpened = .false.
+    double precision, save :: g_TelStepStart, g_TelLastMark
+    double precision, save :: g_TelPhases(TEL_NPHASES)
+    ! bytes of the encoded grids handed to HDF5, counted by ResultWriter
+    integer(kind=8), save :: g_TelBytes = 0
+
+    ! the tiles of the last landslide evaluation of the step
+    logical, save :: g_TelLandRan = .false.
+    integer, allocatable, save :: g_TelTileThread(:)
+    integer, allocatable, save :: g_TelTileDraws(:)
+    integer, allocatable, save :: g_TelTileSkipped(:)
+    double precision, allocatable, save :: g_TelTileStart(:)
+    double precision, allocatable, save :: g_TelTileSeconds(:)
+
+contains
+
+    ! open (replace) the telemetry file
+    subroutine TelemetryOpen(FileName)
+        character(*) :: FileName
+        integer :: error
+
+        open(newunit=g_TelFileID, file=trim(FileName), status="replace", &
+                action="write", form="formatted", iostat=error)
+        if(error/=0)then
+            write(*,*) "Telemetry file cannot be created: " // trim(FileName)
+            g_Telemetry = .false.
+        else
+            g_TelOpened = .true.
+        end if
+    end subroutine TelemetryOpen
+
+    ! the tiles of the landslide module, kept for the record of the step
+    subroutine TelemetryTiles(NTiles)
+        integer :: NTiles
+
+        if(allocated(g_TelTileThread))then
+            if(size(g_TelTileThread)/=NTiles)then
+                deallocate(g_TelTileThread, g_TelTileDraws, g_TelTileSkipped, &
+                        g_TelTileStart, g_TelTileSeconds)
+            end if
+        end if
+        if(.not. allocated(g_TelTileThread))then
+            allocate(g_TelTileThread(NTiles), g_TelTileDraws(NTiles), g_TelTileSkipped(NTiles), &
+                    g_TelTileStart(NTiles), g_TelTileSeconds(NTiles))
+        end if
+        g_TelTileThread = -1
+        g_TelTileDraws = 0
+        g_TelTileSkipped = 0
+        g_TelTileStart = 0
+        g_TelTileSeconds = 0
+        g_TelLandRan = .true.
+    end subroutine TelemetryTiles
+
+    subroutine TelemetryStartStep()
+        if(.not. g_Telemetry)then
+            return
+        end if
+        g_TelStepStart = OMP_get_wtime()
+        g_TelLastMark = g_TelStepStart
+        g_TelPhases = 0
+        g_TelBytes = 0
+        g_TelLandRan = .false.
+    end subroutine TelemetryStartStep
+
+    ! the time since the previous mark belongs to phase iPhase
+    subroutine TelemetryMark(iPhase)
+        integer :: iPhase
+        double precision :: now
+
+        if(.not. g_Telemetry)then
+            return
+        end if
+        now = OMP_get_wtime()
+        g_TelPhases(iPhase) = g_TelPhases(iPhase) + (now - g_TelLastMark)
+        g_TelLastMark = now
+    end subroutine TelemetryMark
+
+    ! write the record of step k (0-based in CREST_Simu, 1-based in the file)
+    subroutine TelemetryEndStep(k, strDate, NHydroThreads, NLandThreads, ResultFile)
+        integer :: k, NHydroThreads, NLandThreads
+        character(*) :: strDate, ResultFile
+        double precision :: wall
+        integer(kind=8) :: FileBytes
+        integer :: i, NTiles
+        logical :: bExists
+
+        if(.not. g_Telemetry .or. .not. g_TelOpened)then
+            return
+        end if
+        wall = OMP_get_wtime() - g_TelStepStart
+        FileBytes = -1
+        inquire(file=trim(ResultFile), exist=bExists)
+        if(bExists)then
+            inquire(file=trim(ResultFile), size=FileBytes)
+        end if
+
+        write(g_TelFileID, "(A,G0,A,A,A,A)", advance="no") '{"step": ', k+1, &
+                ', "date": "', trim(strDate), '", "wall_s": ', TelReal(wall)
+        write(g_TelFileID, "(A)", advance="no") ', "phases": {'
+        do i=1, TEL_NPHASES
+            write(g_TelFileID, "(A,A,A,A)", advance="no") '"', trim(TelPhaseNames(i)), '": ', &
+                    TelReal(g_TelPhases(i))
+            write(g_TelFileID, "(A)", advance="no") ', '
+        end do
+        write(g_TelFileID, "(A,A,A)", advance="no") '"other": ', &
+                TelReal(max(0d0, wall - sum(g_TelPhases))), '}'
+        write(g_TelFileID, "(A,G0,A,G0,A)", advance="no") ', "threads": {"hydro": ', NHydroThreads, &
+                ', "land": ', NLandThreads, '}'
+
+        NTiles = 0
+        if(g_TelLandRan)then
+            NTiles = size(g_TelTileThread)
+            write(g_TelFileID, "(A,G0,A,G0)", advance="no") ', "ellipsoids": ', &
+                    sum(int(g_TelTileDraws, 8)), ', "tiles_skipped": ', sum(g_TelTileSkipped)
+        else
+            write(g_TelFileID, "(A)", advance="no") ', "ellipsoids": 0, "tiles_skipped": 0'
+        end if
+        write(g_TelFileID, "(A,G0,A,G0)", advance="no") ', "bytes_encoded": ', g_TelBytes, &
+                ', "result_file_bytes": ', FileBytes
+
+        write(g_TelFileID, "(A)", advance="no") ', "tiles": ['
+        do i=1, NTiles
+            if(i>1)then
+                write(g_TelFileID, "(A)", advance="no") ', '
+            end if
+            write(g_TelFileID, "(A,G0,A,G0,A,A,A,A,A,G0,A,A,A)", advance="no") '{"tile": ', i, &
+                    ', "thread": ', g_TelTileThread(i), ', "start_s": ', TelReal(g_TelTileStart(i)), &
+                    ', "seconds": ', TelReal(g_TelTileSeconds(i)), ', "ellipsoids": ', g_TelTileDraws(i), &
+                    ', "skipped": ', trim(merge("true ", "false", g_TelTileSkipped(i)==1)), '}'
+        end do
+        write(g_TelFileID, "(A)") ']}'
+        flush(g_TelFileID)
+    end subroutine TelemetryEndStep
+
+    subroutine TelemetryClose()
+        if(g_TelOpened)then
+            close(g_TelFileID)
+            g_TelOpened = .false.
+        end if
+    end subroutine TelemetryClose
+
+    ! a JSON number for a time in seconds
+    function TelReal(x) result(str)
+        double precision :: x
+        character(len=:), allocatable :: str
+        character(len=24) :: buf
+
+        write(buf, "(ES16.9)") x
+        str = trim(adjustl(buf))
+    end function TelReal
+
+end module Telemetry
@@ -42,6 +42,7 @@ module HDF5_utils
   public :: hdf_create_dataset
   public :: hdf_write_vector_to_dataset, hdf_read_vector_from_dataset
   public :: HID_T, hdf_set_print_messages, hdf_set_default_filter
+  public :: hdf_set_close_library
 
   
   !>  \brief Generic interface to write a dataset
@@ -216,6 +217,11 @@ module HDF5_utils
   !
   logical :: hdf_print_messages = .false.
 
+  ! hdf_close_file also closes the HDF5 library (h5close_f), which closes every
+  ! id still open; it is kept open while a file stays open across calls
+  logical :: hdf_close_library = .true.
+  logical :: hdf_library_open = .false.
+
   ! 
   character(len=32) :: hdf_default_filter = 'none'
   integer :: hdf_gzip_level = 6  ! 0-9
@@ -238,6 +244,19 @@ contains
 
   end subroutine hdf_set_print_messages
 
+  !>  \brief Sets the value of hdf_close_library
+  !>
+  !>  By default, hdf_close_file closes the HDF5 library after the file.
+  !>  By setting it to .false., the library (and other open ids) stays
+  !>  open until it is set back to .true. and a file is closed.
+  subroutine hdf_set_close_library(val_close_library)
+
+    logical, intent(in) :: val_close_library  !<  new value for hdf_close_library
+
+    hdf_close_library = val_close_library
+
+  end subroutine hdf_set_close_library
+
   !>  \brief Sets the value of hdf_print_messages
   !>
   !>  
@@ -368,7 +387,10 @@ contains
     end if
     
     ! open hdf5 interface
-    call h5open_f(hdferror)
+    if (.not. hdf_library_open) then
+       call h5open_f(hdferror)
+       hdf_library_open = .true.
+    end if
     !write(*,'(A20,I0)') "h5open: ", hdferror
 
     ! set defaults
@@ -416,7 +438,10 @@ contains
     call h5fclose_f(file_id, hdferror)
     !write(*,'(A20,I0)') "h5fclose: ", hdferror
 
-    call h5close_f(hdferror)
+    if (hdf_close_library) then
+       call h5close_f(hdferror)
+       hdf_library_open = .false.
+    end if
 
   end subroutine hdf_close_file
 
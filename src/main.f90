@@ -103,6 +103,16 @@ program CREST_Main
         write(*,"(2X, A, g0)") "Total tile number for landslide: ", total_tile_number
         write(*,"(2X, A, g0)") "Thread for landslide: ", Nthread_Land
         write(*,"(2X, A, g0)") "ellipse density: ", ellipse_density
+        write(*,"(2X, A, g0)") "Random seed for landslide: ", RandomSeed
+        write(*,"(2X, A, A, A, g0)") "Tile schedule: ", trim(TileSchedule), ", ", TileChunk
+        if (AdaptiveSampling) then
+            write(*,"(2X, A, g0, A, g0, A, g0, A, g0)") "Adaptive sampling: ellipsoid ratio ", &
+                    min_ellipse_ratio, " to ", max_ellipse_ratio, ", stall ", stall_ellipses, &
+                    ", PF tolerance ", pf_tolerance
+        end if
+        if (IncrementalLandslide) then
+            write(*,"(2X, A, g0)") "Incremental landslide, SM change threshold (%): ", sm_change_threshold
+        end if
 
     end if
     ! save to the log file
@@ -119,6 +129,16 @@ program CREST_Main
         write(g_CREST_LogFileID,"(2X, A, g0)") "Total tile numbber for landslide: ", total_tile_number
         write(g_CREST_LogFileID,"(2X, A, g0)") "Thread for landslide: ", Nthread_Land
         write(g_CREST_LogFileID,"(2X, A, g0)") "ellipse density: ", ellipse_density
+        write(g_CREST_LogFileID,"(2X, A, g0)") "Random seed for landslide: ", RandomSeed
+        write(g_CREST_LogFileID,"(2X, A, A, A, g0)") "Tile schedule: ", trim(TileSchedule), ", ", TileChunk
+        if (AdaptiveSampling) then
+            write(g_CREST_LogFileID,"(2X, A, g0, A, g0, A, g0, A, g0)") "Adaptive sampling: ellipsoid ratio ", &
+                    min_ellipse_ratio, " to ", max_ellipse_ratio, ", stall ", stall_ellipses, &
+                    ", PF tolerance ", pf_tolerance
+        end if
+        if (IncrementalLandslide) then
+            write(g_CREST_LogFileID,"(2X, A, g0)") "Incremental landslide, SM change threshold (%): ", sm_change_threshold
+        end if
 
     end if
 
@@ -327,9 +347,7 @@ subroutine CREST_Forecast_KMDQPF()
     bIsError=.true.
     do while(bIsError)
         strDate=myDtoStr(g_StartDate, g_TimeMark)
-        call InquireMatrixFile(trim(g_StatePath) &
-                // "State_"//trim(strDate)// "_W0",  &
-                bIsError,g_StateFormat,"")
+        call InquireStateFile(trim(strDate),bIsError)
 
         if(myDEqual(g_StartDate,dtStart))then
             bIsError=.false. !Indicate the file exist!
@@ -478,9 +496,7 @@ subroutine CREST_RealTime()
     bIsError=.true.
     do while(bIsError)
         strDate=myDtoStr(g_StartDate, g_TimeMark)
-        call InquireMatrixFile(trim(g_StatePath)  &
-                // "State_"//trim(strDate)// "_W0",  &
-                bIsError,g_StateFormat,"")
+        call InquireStateFile(trim(strDate),bIsError)
 
         if(myDEqual(g_StartDate,dtStart))then
             bIsError=.false. !Indicate the file exist!
@@ -1203,6 +1219,7 @@ end subroutine
 
 subroutine InquireMatrixFile(FileName_In,bIsError,sFileFormat_In, &
         strDate_In)
+    use ForcingCube, only: OpenForcingCube, FindForcingStep
     implicit none
 
     character(*):: FileName_In,sFileFormat_In
@@ -1212,6 +1229,7 @@ subroutine InquireMatrixFile(FileName_In,bIsError,sFileFormat_In, &
     integer :: intTemp
     logical :: bIsError,fExist
     character(len=10) :: sFileFormat
+    integer :: iCube
 
     sFileFormat=trim(adjustl(sFileFormat_In))
     strDate=trim(strDate_In)
@@ -1346,6 +1364,24 @@ subroutine InquireMatrixFile(FileName_In,bIsError,sFileFormat_In, &
             return
         end if
 
+        !##########################################################################
+    case ("HDF5","H5") !--------------------------------------------
+        ! the cube of pack_forcing.py, which must hold a step at strDate
+        FileName=trim(FileName_In)//".h5"
+        inquire(file=trim(Filename), exist=fExist)
+        if(fExist .eqv. .false.)then
+            bIsError=.true.
+            return
+        end if
+        iCube=OpenForcingCube(trim(FileName), bIsError)
+        if(bIsError .eqv. .true.)then
+            return
+        end if
+        if(FindForcingStep(iCube, trim(strDate))==0)then
+            bIsError=.true.
+            return
+        end if
+
         !##########################################################################
     case ("DIAMOND4") !--------------------------------------------
         FileName=trim(FileName_In)//trim(strDate)//".000.TMP"
@@ -1381,6 +1417,11 @@ subroutine SaveStates(strDate,W0,SS0,SI0)
 
     ! Save the State Data
     if(g_SaveState .eqv. .true.)then
+        if(trim(g_StateFormat)=="HDF5" .or. trim(g_StateFormat)=="H5")then
+            call SaveStatesHDF5(strDate,W0,SS0,SI0)
+            return
+        end if
+
         where(g_Mask/=g_NoData_Value)
             dblTemp=W0
         elsewhere
@@ -1415,6 +1456,27 @@ subroutine SaveStates(strDate,W0,SS0,SI0)
     return
 end subroutine SaveStates
 
+! bIsError is .true. when no state was saved for strDate in g_StateFormat
+subroutine InquireStateFile(strDate,bIsError)
+    use CREST_Project
+    use CREST_Basic
+
+    implicit none
+    character*(*) :: strDate
+    logical :: bIsError,fExist
+
+    if(trim(g_StateFormat)=="HDF5" .or. trim(g_StateFormat)=="H5")then
+        inquire(file=trim(g_StatePath)//"State_"//trim(strDate)//".h5", exist=fExist)
+        bIsError=.not. fExist
+        return
+    end if
+
+    call InquireMatrixFile(trim(g_StatePath) &
+            // "State_"//trim(strDate)// "_W0",  &
+            bIsError,g_StateFormat,"")
+    return
+end subroutine InquireStateFile
+
 subroutine LoadStates(strDate,W0,SS0,SI0,bIsError)
     use CREST_Project
     use CREST_Basic
@@ -1426,6 +1488,11 @@ subroutine LoadStates(strDate,W0,SS0,SI0,bIsError)
     double precision :: SS0(0:g_NCols-1,0:g_NRows-1)
     double precision :: SI0(0:g_NCols-1,0:g_NRows-1)
 
+    if(trim(g_StateFormat)=="HDF5" .or. trim(g_StateFormat)=="H5")then
+        call LoadStatesHDF5(strDate,W0,SS0,SI0,bIsError)
+        return
+    end if
+
     call ReadMatrixFile(trim(g_StatePath) &
             // "State_"//trim(strDate)// "_W0", &
             W0,g_NCols, g_NRows,g_XLLCorner,g_YLLCorner, &
@@ -1455,6 +1522,116 @@ subroutine LoadStates(strDate,W0,SS0,SI0,bIsError)
     bIsError=.false.
     return
 end subroutine LoadStates
+
+! StateFormat = hdf5: the three states of a date in State_<date>.h5, as the
+! grids W0, SS0 and SI0 or, with PackedCells, as vectors of the cells of
+! g_Mask with the Mask dataset (see WriteResultMask)
+subroutine SaveStatesHDF5(strDate,W0,SS0,SI0)
+    use CREST_Project
+    use CREST_Basic
+    use hdf5_utils
+    use ResultWriter, only: WaitResultWriter, WriteResultMask
+
+    implicit none
+    character*(*) :: strDate
+    double precision :: W0(0:g_NCols-1,0:g_NRows-1)
+    double precision :: SS0(0:g_NCols-1,0:g_NRows-1)
+    double precision :: SI0(0:g_NCols-1,0:g_NRows-1)
+    logical :: Valid(0:g_NCols-1,0:g_NRows-1)
+    integer(HID_T) :: file_id
+
+    Valid=(g_Mask/=g_NoData_Value)
+
+    ! HDF5 is not thread safe, let the result writer finish first
+    call WaitResultWriter()
+    call hdf_set_print_messages(.false.)
+    call hdf_open_file(file_id, trim(g_StatePath)//"State_"//trim(strDate)//".h5", &
+            STATUS='NEW', ACTION='WRITE')
+    call hdf_write_attribute(file_id, "", "NCols", g_NCols)
+    call hdf_write_attribute(file_id, "", "NRows", g_NRows)
+    call hdf_write_attribute(file_id, "", "XLLCorner", g_XLLCorner)
+    call hdf_write_attribute(file_id, "", "YLLCorner", g_YLLCorner)
+    call hdf_write_attribute(file_id, "", "CellSize", g_CellSize)
+    call hdf_write_attribute(file_id, "", "NoData_Value", g_NoData_Value)
+    if(g_PackedCells .eqv. .true.)then
+        call WriteResultMask(file_id, "", Valid)
+        call hdf_write_dataset(file_id, "W0", pack(W0, Valid), filter="gzip+shuffle")
+        call hdf_write_dataset(file_id, "SS0", pack(SS0, Valid), filter="gzip+shuffle")
+        call hdf_write_dataset(file_id, "SI0", pack(SI0, Valid), filter="gzip+shuffle")
+    else
+        call hdf_write_dataset(file_id, "W0", merge(W0, g_NoData_Value, Valid), &
+                filter="gzip+shuffle")
+        call hdf_write_dataset(file_id, "SS0", merge(SS0, g_NoData_Value, Valid), &
+                filter="gzip+shuffle")
+        call hdf_write_dataset(file_id, "SI0", merge(SI0, g_NoData_Value, Valid), &
+                filter="gzip+shuffle")
+    end if
+    call hdf_close_file(file_id)
+
+    return
+end subroutine SaveStatesHDF5
+
+! read State_<date>.h5, packed or not; the cells outside its Mask are NoData
+subroutine LoadStatesHDF5(strDate,W0,SS0,SI0,bIsError)
+    use CREST_Project
+    use CREST_Basic
+    use hdf5_utils
+    use ResultWriter, only: WaitResultWriter
+
+    implicit none
+    character*(*) :: strDate
+    logical :: bIsError
+    double precision :: W0(0:g_NCols-1,0:g_NRows-1)
+    double precision :: SS0(0:g_NCols-1,0:g_NRows-1)
+    double precision :: SI0(0:g_NCols-1,0:g_NRows-1)
+    integer, allocatable :: Mask(:,:)
+    double precision, allocatable :: dblCells(:)
+    character(len=200):: FileName
+    integer(HID_T) :: file_id
+    integer :: NCols, NRows, dims(1)
+    logical :: fExist
+
+    FileName=trim(g_StatePath)//"State_"//trim(strDate)//".h5"
+    inquire(file=trim(FileName), exist=fExist)
+    if(fExist .eqv. .false.)then
+        bIsError=.true.
+        return
+    end if
+
+    call WaitResultWriter()
+    call hdf_set_print_messages(.false.)
+    call hdf_open_file(file_id, trim(FileName), STATUS='OLD', ACTION='READ')
+    call hdf_read_attribute(file_id, "", "NCols", NCols)
+    call hdf_read_attribute(file_id, "", "NRows", NRows)
+    bIsError=(NCols/=g_NCols .or. NRows/=g_NRows)
+    if(bIsError .eqv. .true.)then
+        write(*,*) "The grid of the states does not match the model: " // trim(FileName)
+        call hdf_close_file(file_id)
+        return
+    end if
+
+    if(hdf_exists(file_id, "Mask"))then
+        allocate(Mask(0:g_NCols-1,0:g_NRows-1))
+        call hdf_read_dataset(file_id, "Mask", Mask)
+        call hdf_get_dims(file_id, "W0", dims)
+        allocate(dblCells(dims(1)))
+        call hdf_read_dataset(file_id, "W0", dblCells)
+        W0=unpack(dblCells, Mask/=0, g_NoData_Value)
+        call hdf_read_dataset(file_id, "SS0", dblCells)
+        SS0=unpack(dblCells, Mask/=0, g_NoData_Value)
+        call hdf_read_dataset(file_id, "SI0", dblCells)
+        SI0=unpack(dblCells, Mask/=0, g_NoData_Value)
+        deallocate(Mask, dblCells)
+    else
+        call hdf_read_dataset(file_id, "W0", W0)
+        call hdf_read_dataset(file_id, "SS0", SS0)
+        call hdf_read_dataset(file_id, "SI0", SI0)
+    end if
+    call hdf_close_file(file_id)
+
+    bIsError=.false.
+    return
+end subroutine LoadStatesHDF5
 !########################################################
 
 
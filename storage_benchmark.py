@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Compare HDF5 storage settings of the grid outputs: file size, write and read time.
+
+The model writes every grid output with the GOType, GOScale, GOOffset,
+GOChunkRows, GOFilter and GOLevel keys of Control.Project. This script
+writes the same steps with h5py under each setting to compare, one dataset
+per step as the model does, and reports the file size, the write and read
+times, the largest decoding error against the double values and the
+number of values clamped to the range of an integer type.
+
+The steps are either synthetic (smooth fields masked to an irregular
+basin, on the hydrological 653x607 and landslide 1959x1821 grids by
+default) or the decoded steps of one variable of an existing result file.
+
+A setting is written TYPE[:SCALE[:FILTER[:LEVEL[:CHUNKROWS]]]], e.g.
+int16:0.001:gzip+shuffle:4:64 or float32::none.
+
+Usage:
+    python storage_benchmark.py
+    python storage_benchmark.py --grid 1959x1821 --steps 24 --settings int32 int16:0.001 float32:1:gzip:1
+    python storage_benchmark.py --source Results/Result_all.h5 --var FS3D --json storage.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from result_reader import NODATA_VALUE, ResultReader, decode
+
+DEFAULT_SETTINGS = ["int32", "int32:0.01:gzip", "int32:0.01:none", "int32:0.01:gzip+shuffle:1",
+                    "int32:0.01:gzip+shuffle:6:64", "int16:0.01", "int16:0.001", "float32"]
+DEFAULT_GRIDS = ["653x607", "1959x1821"]
+TYPES = {"int16": np.int16, "int32": np.int32, "float32": np.float32}
+FILTERS = ["gzip+shuffle", "gzip", "none"]
+
+
+def parse_setting(text):
+    """Storage setting from TYPE[:SCALE[:FILTER[:LEVEL[:CHUNKROWS]]]], defaults as in the model"""
+    fields = text.lower().split(":") + [""] * 4
+    setting = {"type": fields[0], "scale": float(fields[1] or 0.01), "filter": fields[2] or "gzip+shuffle",
+               "level": int(fields[3] or 6), "chunk_rows": int(fields[4] or 0)}
+    if setting["type"] not in TYPES:
+        raise ValueError(f"unknown type {fields[0]!r} in {text!r}, expected one of {', '.join(TYPES)}")
+    if setting["filter"] not in FILTERS:
+        raise ValueError(f"unknown filter {fields[2]!r} in {text!r}, expected one of {', '.join(FILTERS)}")
+    if setting["type"] == "float32":
+        setting["scale"] = 1.0
+    return setting
+
+
+def setting_name(setting):
+    return (f"{setting['type']}:{setting['scale']:g}:{setting['filter']}:{setting['level']}:"
+            f"{setting['chunk_rows']}")
+
+
+def synthetic_steps(nrows, ncols, nsteps, seed=0):
+    """Smooth fields between 0 and 100 masked to an irregular basin, NoData outside"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:1:nrows * 1j, 0:1:ncols * 1j]
+    radius = 0.42 + 0.05 * np.sin(6 * np.arctan2(y - 0.5, x - 0.5))
+    outside = np.hypot(x - 0.5, y - 0.5) > radius
+    phase = rng.uniform(0, 2 * np.pi, 4)
+    steps = []
+    for k in range(nsteps):
+        t = k / max(nsteps, 1)
+        field = (50 + 20 * np.sin(7 * x + phase[0] + t) * np.cos(5 * y + phase[1])
+                 + 10 * np.sin(23 * x * y + phase[2] + 2 * t) + 5 * np.cos(41 * y + phase[3]))
+        field += rng.normal(0, 0.05, field.shape)
+        steps.append(np.where(outside, NODATA_VALUE, field))
+    return steps
+
+
+def source_steps(path, var, nsteps):
+    """Decoded steps of one variable of a result file, NoData kept as NODATA_VALUE"""
+    with ResultReader(path, cache_size=0) as reader:
+        if var not in reader:
+            raise KeyError(f"{var} not in {path}; found {reader.variables}")
+        nodata_value, factor, offset = reader.encoding(var)
+        steps = []
+        for position in range(min(nsteps, len(reader.entries(var)))):
+            raw = reader.raw_frame(var, position)
+            values = decode(raw, nodata_value, factor, offset)
+            steps.append(np.where(raw == nodata_value, NODATA_VALUE, values))
+    return steps
+
+
+def encode(values, setting):
+    """
+    Stored array of a double grid as EncodeResultInt/EncodeResultShort write
+    it, and the number of values clamped to the range of the type.
+    """
+    dtype = TYPES[setting["type"]]
+    nodata = values == NODATA_VALUE
+    if setting["type"] == "float32":
+        return values.astype(dtype), 0
+    limit = np.iinfo(dtype).max
+    scaled = values * (1 / setting["scale"])
+    clamped = int(np.count_nonzero(~nodata & (np.abs(scaled) >= limit + 1)))
+    stored = np.trunc(np.clip(scaled, -limit, limit))
+    # valid values never take the NoData code
+    stored[~nodata & (stored == NODATA_VALUE)] -= np.sign(NODATA_VALUE)
+    return np.where(nodata, NODATA_VALUE, stored).astype(dtype), clamped
+
+
+def write_options(setting, shape):
+    options = {}
+    rows = setting["chunk_rows"] if 0 < setting["chunk_rows"] < shape[0] else shape[0]
+    if setting["filter"] != "none":
+        options = {"chunks": (rows, shape[1]), "compression": "gzip",
+                   "compression_opts": setting["level"], "shuffle": setting["filter"] == "gzip+shuffle"}
+    elif rows < shape[0]:
+        options = {"chunks": (rows, shape[1])}
+    return options
+
+
+def run_setting(steps, setting, folder):
+    """Write and read back the steps with one setting; returns the measures"""
+    path = os.path.join(folder, "storage_benchmark.h5")
+    options = write_options(setting, steps[0].shape)
+    nodata_value = NODATA_VALUE
+    clamped = 0
+    start = time.perf_counter()
+    with h5py.File(path, "w") as h5:
+        group = h5.create_group("Hydrology")
+        for k, values in enumerate(steps):
+            stored, count = encode(values, setting)
+            clamped += count
+            dset = group.create_dataset(f"GOVar_X_{k:010d}", data=stored, **options)
+            dset.attrs["scale_factor"] = setting["scale"]
+            dset.attrs["add_offset"] = 0.0
+            dset.attrs["NoData_Value"] = float(nodata_value)
+    write_time = time.perf_counter() - start
+
+    error = 0.0
+    start = time.perf_counter()
+    with h5py.File(path, "r") as h5:
+        for k, values in enumerate(steps):
+            raw = h5[f"Hydrology/GOVar_X_{k:010d}"][()]
+            decoded = decode(raw, nodata_value, 1 / setting["scale"])
+            valid = values != NODATA_VALUE
+            error = max(error, float(np.max(np.abs(decoded[valid] - values[valid]), initial=0.0)))
+    read_time = time.perf_counter() - start
+    size = os.path.getsize(path)
+    os.remove(path)
+    return {"setting": setting_name(setting), "size_mb": size / 2 ** 20, "write_s": write_time,
+            "read_s": read_time, "max_error": error, "clamped": clamped}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare HDF5 storage settings of the grid outputs")
+    parser.add_argument("--settings", nargs="+", default=DEFAULT_SETTINGS,
+                        help="TYPE[:SCALE[:FILTER[:LEVEL[:CHUNKROWS]]]] (default: a selection)")
+    parser.add_argument("--grid", nargs="+", default=DEFAULT_GRIDS, metavar="ROWSxCOLS",
+                        help="synthetic grids (default: 653x607 1959x1821)")
+    parser.add_argument("--steps", type=int, default=12, help="steps written per setting (default: 12)")
+    parser.add_argument("--source", help="take the steps of --var from this result file instead")
+    parser.add_argument("--var", default="SM", help="variable of --source (default: SM)")
+    parser.add_argument("--tmp", default=None, help="folder of the scratch file (default: system temp)")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        settings = [parse_setting(text) for text in args.settings]
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+
+    cases = []
+    if args.source:
+        try:
+            cases.append((f"{os.path.basename(args.source)}:{args.var}", source_steps(args.source, args.var,
+                                                                                        args.steps)))
+        except (OSError, KeyError) as e:
+            print(f"Error: {e}")
+            return 1
+    else:
+        for grid in args.grid:
+            nrows, ncols = (int(n) for n in grid.lower().split("x"))
+            cases.append((grid, synthetic_steps(nrows, ncols, args.steps)))
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.tmp) as folder:
+        for case, steps in cases:
+            if not steps:
+                print(f"Error: no steps in {case}")
+                return 1
+            print(f"{case}: {len(steps)} steps of {steps[0].shape[0]}x{steps[0].shape[1]}")
+            print(f"  {'setting':<34}{'size MB':>10}{'write s':>10}{'read s':>10}{'max error':>12}{'clamped':>10}")
+            for setting in settings:
+                result = run_setting(steps, setting, folder)
+                result["case"] = case
+                results.append(result)
+                print(f"  {result['setting']:<34}{result['size_mb']:>10.2f}{result['write_s']:>10.3f}"
+                      f"{result['read_s']:>10.3f}{result['max_error']:>12.4g}{result['clamped']:>10}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Written {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Summarize the telemetry of a run (Telemetry = yes in Control.Project).
+
+The model appends one JSON object per time step to
+<ResultPath>telemetry.jsonl: the wall time of the step split into phases
+(read_forcing, channel, hydro, soil_downscale, landslide, export, other),
+the threads, the ellipsoids drawn and tiles carried forward, the bytes
+encoded for HDF5, and for every landslide tile the thread that ran it,
+its start within the landslide region and its duration.
+
+The report gives
+    - the total and share of every phase over the run, as bars,
+    - the slowest steps with their largest phase,
+    - the load imbalance of the landslide threads: the busy time of every
+      thread summed over the steps, and per step max/mean busy time and
+      the idle fraction (1 - busy / (threads x span of the tiles)).
+
+--folded writes the run as folded stacks ("run;phase;thread N;tile M
+microseconds"), the input of flamegraph.pl and speedscope; --plot writes
+phases.png (stacked phase times per step) and imbalance.png (idle
+fraction and max/mean per step); --json writes the summary as JSON.
+
+Usage:
+    python telemetry_report.py Results/telemetry.jsonl
+    python telemetry_report.py Results/telemetry.jsonl --top 20 --folded telemetry.folded
+    python telemetry_report.py Results/telemetry.jsonl --plot Results/Telemetry --json summary.json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+PHASES = ["read_forcing", "channel", "hydro", "soil_downscale", "landslide", "export", "other"]
+BAR_WIDTH = 40
+
+
+def read_telemetry(path):
+    """Step records of a telemetry file, skipping a truncated last line"""
+    records = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Warning: line {number} of {path} is not valid JSON, skipped")
+    return records
+
+
+def thread_busy(record):
+    """Busy seconds of every landslide thread in a step, {thread: seconds}"""
+    busy = {}
+    for tile in record.get("tiles", []):
+        if tile["thread"] >= 0:
+            busy[tile["thread"]] = busy.get(tile["thread"], 0.0) + tile["seconds"]
+    return busy
+
+
+def step_imbalance(record):
+    """(max/mean busy time, idle fraction) of the landslide threads in a step, None without tiles"""
+    tiles = [tile for tile in record.get("tiles", []) if tile["thread"] >= 0]
+    if not tiles:
+        return None
+    busy = thread_busy(record)
+    # threads that took no tile were idle all along
+    threads = max(record["threads"]["land"], len(busy))
+    values = list(busy.values()) + [0.0] * (threads - len(busy))
+    mean = sum(values) / threads
+    span = max(tile["start_s"] + tile["seconds"] for tile in tiles) - min(tile["start_s"] for tile in tiles)
+    ratio = max(values) / mean if mean > 0 else 1.0
+    idle = 1.0 - sum(values) / (threads * span) if span > 0 else 0.0
+    return ratio, max(idle, 0.0)
+
+
+def summarize(records, top):
+    total_wall = sum(record["wall_s"] for record in records)
+    phases = {name: sum(record["phases"].get(name, 0.0) for record in records) for name in PHASES}
+    slowest = sorted(records, key=lambda record: record["wall_s"], reverse=True)[:top]
+    busy = {}
+    imbalance = []
+    for record in records:
+        for thread, seconds in thread_busy(record).items():
+            busy[thread] = busy.get(thread, 0.0) + seconds
+        step = step_imbalance(record)
+        if step is not None:
+            imbalance.append({"step": record["step"], "date": record["date"],
+                              "max_over_mean": step[0], "idle_fraction": step[1]})
+    return {
+        "steps": len(records),
+        "wall_s": total_wall,
+        "phases": {name: {"seconds": seconds, "share": seconds / total_wall if total_wall > 0 else 0.0}
+                   for name, seconds in phases.items()},
+        "ellipsoids": sum(record.get("ellipsoids", 0) for record in records),
+        "tiles_skipped": sum(record.get("tiles_skipped", 0) for record in records),
+        "bytes_encoded": sum(record.get("bytes_encoded", 0) for record in records),
+        "result_file_bytes": records[-1].get("result_file_bytes", -1),
+        "slowest": [{"step": record["step"], "date": record["date"], "wall_s": record["wall_s"],
+                     "largest_phase": max(PHASES, key=lambda name: record["phases"].get(name, 0.0))}
+                    for record in slowest],
+        "thread_busy_s": {str(thread): seconds for thread, seconds in sorted(busy.items())},
+        "imbalance": imbalance,
+    }
+
+
+def report_lines(summary):
+    lines = [f"Steps: {summary['steps']}, wall time {summary['wall_s']:.3f} s", "", "Phases:"]
+    for name in PHASES:
+        phase = summary["phases"][name]
+        bar = "#" * int(round(phase["share"] * BAR_WIDTH))
+        lines.append(f"  {name:<15s}{phase['seconds']:12.3f} s {100 * phase['share']:6.1f}%  {bar}")
+    lines += ["",
+              f"Ellipsoids drawn: {summary['ellipsoids']}, tiles carried forward: {summary['tiles_skipped']}",
+              f"Bytes encoded: {summary['bytes_encoded']}, Result_all.h5: {summary['result_file_bytes']} bytes",
+              "", "Slowest steps:"]
+    for step in summary["slowest"]:
+        lines.append(f"  step {step['step']:6d}  {step['date']}  {step['wall_s']:10.3f} s  ({step['largest_phase']})")
+    if summary["imbalance"]:
+        busy = summary["thread_busy_s"]
+        mean = sum(busy.values()) / len(busy)
+        lines += ["", "Landslide threads, busy time over the run:"]
+        for thread, seconds in busy.items():
+            lines.append(f"  thread {int(thread):3d}  {seconds:12.3f} s  {seconds / mean if mean > 0 else 1.0:6.2f} x mean")
+        ratios = [step["max_over_mean"] for step in summary["imbalance"]]
+        idles = [step["idle_fraction"] for step in summary["imbalance"]]
+        worst = max(summary["imbalance"], key=lambda step: step["idle_fraction"])
+        lines += ["", "Landslide load imbalance per step:",
+                  f"  max/mean busy time: mean {sum(ratios) / len(ratios):.2f}, worst {max(ratios):.2f}",
+                  f"  idle fraction:      mean {100 * sum(idles) / len(idles):.1f}%, "
+                  f"worst {100 * worst['idle_fraction']:.1f}% (step {worst['step']}, {worst['date']})"]
+    return lines
+
+
+def write_folded(records, path):
+    """Folded stacks in microseconds, the landslide phase split into threads and tiles"""
+    stacks = {}
+
+    def add(stack, seconds):
+        micro = int(round(seconds * 1e6))
+        if micro > 0:
+            stacks[stack] = stacks.get(stack, 0) + micro
+
+    for record in records:
+        tiles = [tile for tile in record.get("tiles", []) if tile["thread"] >= 0]
+        for name in PHASES:
+            seconds = record["phases"].get(name, 0.0)
+            if name == "landslide" and tiles:
+                # the tiles overlap in time, so they are shares of the phase
+                # in proportion to their busy time
+                busy = sum(tile["seconds"] for tile in tiles)
+                for tile in tiles:
+                    share = seconds * tile["seconds"] / busy if busy > 0 else 0.0
+                    add(f"run;landslide;thread {tile['thread']};tile {tile['tile']}", share)
+            else:
+                add(f"run;{name}", seconds)
+    with open(path, "w") as f:
+        for stack, micro in stacks.items():
+            f.write(f"{stack} {micro}\n")
+
+
+def plot(records, summary, output_dir):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    os.makedirs(output_dir, exist_ok=True)
+    steps = [record["step"] for record in records]
+    fig, ax = plt.subplots(figsize=(8, 4))
+    bottom = [0.0] * len(records)
+    for name in PHASES:
+        values = [record["phases"].get(name, 0.0) for record in records]
+        ax.bar(steps, values, bottom=bottom, width=1.0, label=name)
+        bottom = [b + v for b, v in zip(bottom, values)]
+    ax.set_xlabel("Step")
+    ax.set_ylabel("Wall time (s)")
+    ax.legend(fontsize=8, ncol=4)
+    fig.tight_layout()
+    fig.savefig(os.path.join(output_dir, "phases.png"), dpi=150)
+    plt.close(fig)
+
+    if summary["imbalance"]:
+        fig, ax = plt.subplots(figsize=(8, 4))
+        x = [step["step"] for step in summary["imbalance"]]
+        ax.plot(x, [100 * step["idle_fraction"] for step in summary["imbalance"]], "o-", ms=3, label="Idle fraction")
+        ax.set_xlabel("Step")
+        ax.set_ylabel("Idle fraction (%)")
+        ax2 = ax.twinx()
+        ax2.plot(x, [step["max_over_mean"] for step in summary["imbalance"]], "s-", ms=3, color="tab:red",
+                 label="Max/mean busy time")
+        ax2.set_ylabel("Max/mean busy time")
+        fig.legend(loc="upper right", fontsize=8)
+        fig.tight_layout()
+        fig.savefig(os.path.join(output_dir, "imbalance.png"), dpi=150)
+        plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the telemetry.jsonl of a run")
+    parser.add_argument("telemetry", help="telemetry file written with Telemetry = yes")
+    parser.add_argument("--top", type=int, default=10, help="slowest steps to list (default: 10)")
+    parser.add_argument("--folded", help="write folded stacks for flamegraph.pl or speedscope")
+    parser.add_argument("--plot", metavar="DIR", help="write phases.png and imbalance.png to DIR")
+    parser.add_argument("--json", help="write the summary as JSON")
+    args = parser.parse_args()
+
+    try:
+        records = read_telemetry(args.telemetry)
+    except OSError as e:
+        print(f"Error: {e}")
+        return 1
+    if not records:
+        print(f"Error: no steps in {args.telemetry}")
+        return 1
+
+    summary = summarize(records, args.top)
+    print("\n".join(report_lines(summary)))
+    if args.folded:
+        write_folded(records, args.folded)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.plot:
+        plot(records, summary, args.plot)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
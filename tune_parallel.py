@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Find the fastest parallel setup of Parameters_parallel.txt for this basin and machine.
+
+N_Subbasin and NHydroThread set how the hydrological model is split by
+Parallel_hydro_pre and how many threads run it, Tot_tile and NLandThread
+the same for the slope stability model. The best values depend on the
+basin (how FAC_divide cuts the subbasins, how many valid landslide
+pixels there are) and on the cores, so this script measures them: it
+runs the model on a short window (--steps time steps from StartDate)
+for each candidate setup, one run at a time so the runs do not compete
+for the cores, and reads the "Hydrological runtime" and "Landslide
+runtime" the model prints at the end of CREST_Simu.
+
+The two halves are independent, so by default the hydrological pairs
+(N_Subbasin, NHydroThread) are tried with the current landslide setup,
+then the landslide pairs (Tot_tile, NLandThread) with the best
+hydrological one; --full tries every combination instead. Pairs with
+fewer subbasins or tiles than threads are skipped unless --all-pairs,
+since the extra threads would have nothing to do.
+
+Every trial is an isolated run directory prepared like run_ensemble.py
+does, under --output (default: Tuning):
+
+    <output>/<trial>/...            the run, its run.log and status.json
+    <output>/trials.csv             one line per trial with the runtimes
+    <output>/report.txt             runtime tables and speedup curves
+    <output>/tuning.json            the same as data, with the best setup
+    <output>/speedup.png            the speedup curves, with --plot
+
+Trials already done with the same settings are not run again, so an
+interrupted tuning resumes. Unless --no-write, the best setup is written
+to the Parameters_parallel.txt of the project (the old file is kept as
+Parameters_parallel.txt.bak).
+
+Usage:
+    python tune_parallel.py --binary build/iHydroSlide3D --steps 6
+    python tune_parallel.py --binary build/iHydroSlide3D --threads 4 8 16 32 --tiles 20 40 80 --repeat 2
+    python tune_parallel.py --binary build/iHydroSlide3D --full --no-write --plot
+"""
+
+import argparse
+import csv
+import datetime
+import itertools
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+from control_utils import get_int, get_str, parse_control, set_control_value
+from run_ensemble import Run, prepare_run, run_failed
+
+HYDRO_KEYS = ("N_Subbasin", "NHydroThread")
+LAND_KEYS = ("Tot_tile", "NLandThread")
+DATE_FORMATS = {"d": "%Y%m%d", "h": "%Y%m%d%H", "u": "%Y%m%d%H%M", "s": "%Y%m%d%H%M%S"}
+DATE_UNITS = {"d": "days", "h": "hours", "u": "minutes", "s": "seconds"}
+
+# the runtimes printed by CREST_Simu with list-directed writes
+_RUNTIME = {"hydro": re.compile(r"Hydrological runtime \(s\):\s*([-+0-9.EeDd]+)"),
+            "land": re.compile(r"Landslide runtime \(s\):\s*([-+0-9.EeDd]+)")}
+
+
+def window_end(control, steps):
+    """EndDate of a window of steps time steps from StartDate, in the format of TimeMark"""
+    mark = get_str(control, "TimeMark").lower()
+    if mark not in DATE_FORMATS:
+        raise ValueError(f"TimeMark {mark!r} is not supported for --steps, give --end-date")
+    start = datetime.datetime.strptime(get_str(control, "StartDate"), DATE_FORMATS[mark])
+    step = get_int(control, "TimeStep", 1)
+    end = start + datetime.timedelta(**{DATE_UNITS[mark]: step * (steps - 1)})
+    return end.strftime(DATE_FORMATS[mark])
+
+
+def default_threads(cores):
+    """1, 2, 4, ... up to the cores, and the cores themselves"""
+    threads = [1]
+    while threads[-1] * 2 <= cores:
+        threads.append(threads[-1] * 2)
+    if threads[-1] != cores:
+        threads.append(cores)
+    return threads
+
+
+def pairs(parts, threads, all_pairs):
+    """(parts, threads) candidates, without more threads than parts unless all_pairs"""
+    return [(p, t) for p, t in itertools.product(parts, threads) if all_pairs or p >= t]
+
+
+def read_runtimes(run):
+    """{"hydro": s, "land": s} printed at the end of a run, missing ones left out"""
+    try:
+        with open(os.path.join(run.directory, "run.log"), errors="replace") as f:
+            text = f.read()
+    except OSError:
+        return {}
+    runtimes = {}
+    for name, pattern in _RUNTIME.items():
+        match = pattern.search(text)
+        if match:
+            runtimes[name] = float(match.group(1).replace("D", "E").replace("d", "e"))
+    return runtimes
+
+
+class Trial:
+    """One setup of Parameters_parallel.txt, run repeat times"""
+
+    def __init__(self, setup, stage, output_dir, repeat):
+        self.setup = setup
+        self.stage = stage
+        name = "_".join(f"{key}{value}" for key, value in setup.items())
+        names = [f"{name}_r{k + 1}" for k in range(repeat)] if repeat > 1 else [name]
+        self.runs = [Run(run_name, {}, os.path.join(output_dir, run_name)) for run_name in names]
+        self.results = []
+        self.error = None
+
+    def measure(self, binary, base_text, project_dir, settings):
+        """Run (or take from a previous tuning) every repetition; returns False on failure"""
+        for run in self.runs:
+            run.settings = dict(settings, **{key: str(value) for key, value in self.setup.items()})
+            os.makedirs(run.directory, exist_ok=True)
+            status = run.read_status()
+            if not run.needs_run():
+                if status["state"] == "failed":
+                    # failed in a previous tuning with the same settings
+                    self.error = status.get("error") or "failed"
+                    return False
+                self.results.append(dict(read_runtimes(run), wall=status.get("elapsed")))
+                continue
+            prepare_run(run, base_text, project_dir)
+            env = dict(os.environ, OMP_NUM_THREADS=str(run.threads))
+            run.write_status("running")
+            start = time.perf_counter()
+            with open(os.path.join(run.directory, "run.log"), "w") as log:
+                returncode = subprocess.run([binary], cwd=run.directory, env=env,
+                                            stdout=log, stderr=subprocess.STDOUT).returncode
+            wall = time.perf_counter() - start
+            self.error = run_failed(run, returncode)
+            runtimes = read_runtimes(run)
+            if not self.error and "hydro" not in runtimes:
+                self.error = "no runtime in run.log"
+            run.write_status("failed" if self.error else "done", returncode=returncode,
+                             elapsed=round(wall, 3), error=self.error)
+            if self.error:
+                return False
+            self.results.append(dict(runtimes, wall=wall))
+        return True
+
+    def runtime(self, name):
+        """Median over the repetitions of one runtime, None if not measured"""
+        values = [result[name] for result in self.results if result.get(name) is not None]
+        return statistics.median(values) if values else None
+
+    def cost(self, stage=None):
+        """Runtime the stage is tuned on: hydrological, landslide or both"""
+        stage = stage or self.stage
+        hydro, land = self.runtime("hydro"), self.runtime("land")
+        if stage == "land" or hydro is None:
+            return land if stage == "land" else None
+        return hydro if stage == "hydro" else hydro + (land or 0.0)
+
+    def row(self):
+        wall = self.runtime("wall")
+        return dict(self.setup, stage=self.stage, hydro_s=self.runtime("hydro"), land_s=self.runtime("land"),
+                    wall_s=round(wall, 3) if wall is not None else None, error=self.error or "")
+
+
+def best_of(trials, stage):
+    done = [trial for trial in trials if trial.cost(stage) is not None]
+    return min(done, key=lambda trial: trial.cost(stage)) if done else None
+
+
+def speedup_curve(trials, parts_key, threads_key, runtime):
+    """
+    [(threads, best runtime, best parts, speedup, efficiency)] over the thread counts.
+
+    The runtime of a thread count is the best over the parts (subbasins or
+    tiles) tried with it; speedup and efficiency are relative to the
+    smallest thread count measured.
+    """
+    best = {}
+    for trial in trials:
+        value = trial.runtime(runtime)
+        if value is None or threads_key not in trial.setup:
+            continue
+        threads = trial.setup[threads_key]
+        if threads not in best or value < best[threads][0]:
+            best[threads] = (value, trial.setup[parts_key])
+    if not best:
+        return []
+    ref_threads = min(best)
+    ref = best[ref_threads][0]
+    curve = []
+    for threads in sorted(best):
+        value, parts = best[threads]
+        speedup = ref / value if value > 0 else float("nan")
+        curve.append((threads, value, parts, speedup, speedup * ref_threads / threads))
+    return curve
+
+
+def runtime_table(trials, parts_key, threads_key, runtime):
+    """Lines of a parts x threads table of one runtime"""
+    cells = {(trial.setup[parts_key], trial.setup[threads_key]): trial.runtime(runtime) for trial in trials
+             if parts_key in trial.setup and threads_key in trial.setup}
+    parts = sorted({key[0] for key in cells})
+    threads = sorted({key[1] for key in cells})
+    header = f"{parts_key} \\ {threads_key}"
+    lines = [f"  {header:<26}" + "".join(f"{t:>10}" for t in threads)]
+    for p in parts:
+        values = [cells.get((p, t)) for t in threads]
+        lines.append(f"  {p:<26}" + "".join(f"{v:>10.2f}" if v is not None else f"{'-':>10}" for v in values))
+    return lines
+
+
+def write_report(trials, best_setup, baseline, output_dir, land):
+    lines = []
+    curves = {}
+    halves = [("Hydrological", "hydro", HYDRO_KEYS)] + ([("Landslide", "land", LAND_KEYS)] if land else [])
+    for title, runtime, (parts_key, threads_key) in halves:
+        lines.append(f"{title} runtime (s)")
+        lines.extend(runtime_table(trials, parts_key, threads_key, runtime))
+        curve = speedup_curve(trials, parts_key, threads_key, runtime)
+        curves[runtime] = curve
+        lines.append(f"  {'threads':>8}{'runtime s':>12}{parts_key:>14}{'speedup':>10}{'efficiency':>12}")
+        for threads, value, parts, speedup, efficiency in curve:
+            lines.append(f"  {threads:>8}{value:>12.2f}{parts:>14}{speedup:>10.2f}{efficiency:>12.2f}")
+        lines.append("")
+
+    lines.append("Best setup: " + ", ".join(f"{key} = {value}" for key, value in best_setup.items()))
+    if baseline is not None and baseline.cost("total") and best_setup:
+        best = min((trial for trial in trials if trial.setup == best_setup and trial.cost("total")),
+                   key=lambda trial: trial.cost("total"), default=None)
+        if best is not None:
+            lines.append(f"Runtime {baseline.cost('total'):.2f} s with the current setup, "
+                         f"{best.cost('total'):.2f} s with the best one "
+                         f"({baseline.cost('total') / best.cost('total'):.2f}x)")
+    failed = [trial for trial in trials if trial.error]
+    for trial in failed:
+        lines.append(f"Failed: {trial.setup} ({trial.error})")
+
+    with open(os.path.join(output_dir, "report.txt"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    with open(os.path.join(output_dir, "trials.csv"), "w", newline="") as f:
+        keys = list(HYDRO_KEYS + LAND_KEYS) + ["stage", "hydro_s", "land_s", "wall_s", "error"]
+        writer = csv.DictWriter(f, fieldnames=keys, restval="")
+        writer.writeheader()
+        for trial in trials:
+            writer.writerow(trial.row())
+    with open(os.path.join(output_dir, "tuning.json"), "w") as f:
+        json.dump({"best": best_setup, "trials": [trial.row() for trial in trials],
+                   "speedup": {name: [dict(zip(("threads", "runtime_s", "parts", "speedup", "efficiency"), point))
+                                      for point in curve] for name, curve in curves.items()}}, f, indent=2)
+    print("\n".join(lines))
+    return curves
+
+
+def plot_curves(curves, path):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(6, 4))
+    for name, curve in curves.items():
+        if curve:
+            threads = [point[0] for point in curve]
+            ax.plot(threads, [point[3] for point in curve], "o-", label={"hydro": "Hydrological",
+                                                                      "land": "Landslide"}[name])
+    all_threads = sorted({point[0] for curve in curves.values() for point in curve})
+    if all_threads:
+        ax.plot(all_threads, [t / all_threads[0] for t in all_threads], "k--", lw=0.8, label="Ideal")
+    ax.set_xlabel("Threads")
+    ax.set_ylabel("Speedup")
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune N_Subbasin, NHydroThread, Tot_tile and NLandThread")
+    parser.add_argument("--binary", required=True, help="model executable")
+    parser.add_argument("--control", default="Control.Project", help="control file of the project")
+    parser.add_argument("--output", default="Tuning", help="folder of the trial runs (default: Tuning)")
+    parser.add_argument("--steps", type=int, default=6, help="time steps of the benchmark window (default: 6)")
+    parser.add_argument("--end-date", help="EndDate of the window instead of --steps")
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 1, help="cores to use (default: all)")
+    parser.add_argument("--threads", nargs="+", type=int, help="thread counts (default: 1, 2, 4, ... cores)")
+    parser.add_argument("--hydro-threads", nargs="+", type=int, help="NHydroThread values (default: --threads)")
+    parser.add_argument("--land-threads", nargs="+", type=int, help="NLandThread values (default: --threads)")
+    parser.add_argument("--subbasins", nargs="+", type=int, default=[2, 4, 8, 16], help="N_Subbasin values")
+    parser.add_argument("--tiles", nargs="+", type=int, default=[10, 20, 40, 80], help="Tot_tile values")
+    parser.add_argument("--all-pairs", action="store_true", help="also try fewer subbasins/tiles than threads")
+    parser.add_argument("--full", action="store_true", help="try every combination of the four keys")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per setup, the median counts (default: 1)")
+    parser.add_argument("--no-write", action="store_true", help="do not change Parameters_parallel.txt")
+    parser.add_argument("--plot", action="store_true", help="also draw speedup.png")
+    args = parser.parse_args()
+
+    binary = os.path.abspath(args.binary)
+    if not os.access(binary, os.X_OK):
+        print(f"Error: {binary} is not an executable")
+        return 1
+    with open(args.control) as f:
+        base_text = f.read()
+    control = parse_control(base_text.splitlines())
+    project_dir = os.path.dirname(os.path.abspath(args.control))
+    param_file = os.path.join(project_dir, get_str(control, "ParamPath", "./Params/"), "Parameters_parallel.txt")
+    try:
+        with open(param_file) as f:
+            parallel_text = f.read()
+        end_date = args.end_date or window_end(control, args.steps)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return 1
+    current = {key: get_int(parse_control(parallel_text.splitlines()), key, 1) for key in HYDRO_KEYS + LAND_KEYS}
+    land = get_str(control, "ModelCore", "HydroSlide3D").lower() != "hydro"
+    if not land:
+        current = {key: current[key] for key in HYDRO_KEYS}
+
+    threads = [t for t in (args.threads or default_threads(args.cores)) if t <= args.cores]
+    hydro_pairs = pairs(args.subbasins, [t for t in args.hydro_threads or threads if t <= args.cores],
+                        args.all_pairs)
+    land_pairs = pairs(args.tiles, [t for t in args.land_threads or threads if t <= args.cores], args.all_pairs)
+    if not hydro_pairs or (land and not land_pairs):
+        print("Error: no candidate setup, check --subbasins, --tiles and the thread counts")
+        return 1
+
+    # the window and a fresh result folder for every trial; everything else as in the project
+    settings = {"EndDate": end_date}
+    output_dir = os.path.abspath(args.output)
+    os.makedirs(output_dir, exist_ok=True)
+    trials = []
+
+    def run_trial(setup, stage):
+        for trial in trials:
+            if trial.setup == setup:
+                return trial
+        trial = Trial(setup, stage, output_dir, args.repeat)
+        trials.append(trial)
+        print(f"{stage:>6}: " + ", ".join(f"{key} = {value}" for key, value in setup.items()), end=" ", flush=True)
+        ok = trial.measure(binary, base_text, project_dir, settings)
+        print(f"-> hydro {trial.runtime('hydro')} s, land {trial.runtime('land')} s" if ok
+              else f"-> FAILED ({trial.error})")
+        return trial
+
+    try:
+        # the current setup, as the reference of the report, when it fits the cores
+        baseline = None
+        if max(current.get("NHydroThread", 1), current.get("NLandThread", 1)) <= args.cores:
+            baseline = run_trial(dict(current), "current")
+        if args.full and land:
+            for (subbasins, hydro_threads), (tiles, land_threads) in itertools.product(hydro_pairs, land_pairs):
+                run_trial({"N_Subbasin": subbasins, "NHydroThread": hydro_threads, "Tot_tile": tiles,
+                           "NLandThread": land_threads}, "total")
+            best = best_of(trials, "total")
+            best_setup = best.setup if best else {}
+        else:
+            fixed_land = {key: current[key] for key in LAND_KEYS} if land else {}
+            for subbasins, hydro_threads in hydro_pairs:
+                run_trial(dict({"N_Subbasin": subbasins, "NHydroThread": hydro_threads}, **fixed_land), "hydro")
+            best = best_of(trials, "hydro")
+            best_setup = {key: best.setup[key] for key in HYDRO_KEYS} if best else {}
+            if land and best:
+                for tiles, land_threads in land_pairs:
+                    run_trial(dict(best_setup, Tot_tile=tiles, NLandThread=land_threads), "land")
+                # the landslide runtime does not depend on the hydrological setup
+                best_land = best_of(trials, "land")
+                if best_land:
+                    best_setup.update({key: best_land.setup[key] for key in LAND_KEYS})
+    except KeyboardInterrupt:
+        print("\nInterrupted; run again to resume")
+        return 130
+
+    if not best_setup:
+        print("Error: every trial failed, see the run.log files under " + output_dir)
+        return 1
+    curves = write_report(trials, best_setup, baseline, output_dir, land)
+    if args.plot:
+        plot_curves(curves, os.path.join(output_dir, "speedup.png"))
+
+    if not args.no_write:
+        shutil.copy2(param_file, param_file + ".bak")
+        text = parallel_text
+        for key, value in best_setup.items():
+            text = set_control_value(text, key, value)
+        with open(param_file, "w") as f:
+            f.write(text)
+        print(f"Written the best setup to {param_file} (previous one in {param_file}.bak)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())